@@ -1,16 +1,50 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, send_file, jsonify, abort
+from flask import Flask, render_template, request, redirect, url_for, flash, send_file, jsonify, abort, session, make_response
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import create_engine, event
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, contains_eager, load_only, with_expression
 from werkzeug.security import generate_password_hash, check_password_hash
 from werkzeug.utils import secure_filename
 from flask_login import LoginManager, UserMixin, login_user, login_required, logout_user, current_user
+import click
 import os
-from datetime import datetime, timezone
+import base64
+import hashlib
+import hmac
+import json
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import date, datetime, timedelta, timezone
+from functools import wraps
 import mimetypes
 from dotenv import load_dotenv
 import cloudinary
 import cloudinary.uploader
 import cloudinary.api
 
+from bulk_import import ManifestError, open_import_source
+from db_pool import (PoolMonitor, default_pool_profile, engine_options, install_sqlite_pragmas, is_sqlite_file,
+                     normalize_database_url, sqlite_read_engine)
+from db_routing import ReadRouter, RoutingSession
+from file_server import StorageFileServer
+from images import cloudinary_variants, is_cloudinary_url, local_variants
+from instrumentation import Instrumentation, timed
+from metrics import Registry, RequestMetrics
+from migrations import (Migration, MigrationRunner, add_column_if_missing, create_missing_indexes, drop_indexes,
+                        index_report, read_state, set_feature)
+from page_cache import PageCache, create_backend
+from search import SearchIndex, highlight, split_terms
+from static_export import EXPORT_ENVIRON_KEY, StaticExporter
+from usage import UsageCounters
+from uploads import (ChunkError, PermanentUploadError, UploadQueue, append_chunk, backoff_delay, create_uploader,
+                     direct_uploads_available, file_sha256, sign_direct_upload, spool_path_for, spool_upload,
+                     verify_direct_upload)
+
 # Load environment variables
 load_dotenv()
 
@@ -19,31 +53,238 @@ app = Flask(__name__)
 # Configuration from environment variables
 app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'your-secret-key-here')
 
+# บน Vercel แต่ละ instance อยู่ไม่นานและ thread เบื้องหลังถูกหยุดหลังตอบ response
+on_vercel = bool(os.getenv('VERCEL'))
+
 # Database: Use DATABASE_URL (Neon PostgreSQL) if provided, otherwise fallback to local SQLite
-database_url = os.getenv('DATABASE_URL')
+database_url = normalize_database_url(os.getenv('DATABASE_URL'))
 if database_url:
     app.config['SQLALCHEMY_DATABASE_URI'] = database_url
 else:
     app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///hospital.db'
     
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+
+# Connection pool: default, serverless, pgbouncer (Neon pooled endpoint) หรือ null (ดู db_pool.py)
+# ไม่ตั้งค่าไว้จะเลือกจาก URL และ Vercel ส่วน DB_POOL_* ใช้ปรับค่าของ profile ทีละตัว
+def _env_number(name, cast=int):
+    value = os.getenv(name)
+    return cast(value) if value not in (None, '') else None
+
+app.config['DB_POOL_PROFILE'] = os.getenv('DB_POOL_PROFILE') or default_pool_profile(
+    app.config['SQLALCHEMY_DATABASE_URI'], serverless=on_vercel)
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config['SQLALCHEMY_DATABASE_URI'], app.config['DB_POOL_PROFILE'], {
+    'pool_size': _env_number('DB_POOL_SIZE'),
+    'max_overflow': _env_number('DB_MAX_OVERFLOW'),
+    'pool_timeout': _env_number('DB_POOL_TIMEOUT', float),
+    'pool_recycle': _env_number('DB_POOL_RECYCLE'),
+    'pool_pre_ping': {'true': True, 'false': False}.get(os.getenv('DB_POOL_PRE_PING', '').lower()),
+})
+
+# SQLite (ไม่ได้ตั้ง DATABASE_URL เช่น server ในโรงพยาบาล): PRAGMA ที่ตั้งทุกครั้งที่เปิด connection
+# ค่าว่างคือไม่ตั้ง PRAGMA นั้น (ใช้ค่าเริ่มต้นของ SQLite) cache_size ติดลบหมายถึงหน่วย KiB
+app.config['SQLITE_PRAGMAS'] = {
+    'journal_mode': os.getenv('SQLITE_JOURNAL_MODE', 'WAL'),
+    'synchronous': os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL'),
+    'mmap_size': os.getenv('SQLITE_MMAP_SIZE', str(256 * 1024 * 1024)),
+    'cache_size': os.getenv('SQLITE_CACHE_SIZE', str(-32 * 1024)),
+    'temp_store': os.getenv('SQLITE_TEMP_STORE', 'MEMORY'),
+    'busy_timeout': os.getenv('SQLITE_BUSY_TIMEOUT', '5000'),  # มิลลิวินาที
+}
+# หน้า public (home, department) อ่านผ่าน connection แบบ read-only (mode=ro) แยกจากของแอดมิน
+app.config['SQLITE_READ_ONLY_ENGINE'] = os.getenv('SQLITE_READ_ONLY_ENGINE', 'true').lower() == 'true'
+
+# วัดเวลาแต่ละ request (SQL, render template, อัปโหลด) ส่งเป็น header Server-Timing
+# และเขียน request ที่ช้ากว่า SLOW_REQUEST_MS ลง SLOW_REQUEST_LOG (JSON บรรทัดละ request, ว่าง = stderr)
+# INSTRUMENTATION=false ไม่ติดตั้ง hook ใดๆ เลย
+app.config['INSTRUMENTATION'] = os.getenv('INSTRUMENTATION', 'true').lower() == 'true'
+app.config['SERVER_TIMING_HEADER'] = os.getenv('SERVER_TIMING_HEADER', 'true').lower() == 'true'
+app.config['SLOW_REQUEST_MS'] = float(os.getenv('SLOW_REQUEST_MS', 500))
+app.config['SLOW_REQUEST_LOG'] = os.getenv('SLOW_REQUEST_LOG', '')
+
+# Prometheus metrics ที่ /metrics (ต้องส่ง Authorization: Bearer METRICS_TOKEN หรือล็อกอินเป็นแอดมิน)
+# gunicorn หลาย worker ต้องตั้ง METRICS_DIR เป็น directory ที่ทุก worker เขียนได้ (ล้างทิ้งก่อนเริ่มระบบใหม่ได้)
+app.config['METRICS_ENABLED'] = os.getenv('METRICS_ENABLED', 'true').lower() == 'true'
+app.config['METRICS_DIR'] = os.getenv('METRICS_DIR') or os.getenv('PROMETHEUS_MULTIPROC_DIR', '')
+app.config['METRICS_TOKEN'] = os.getenv('METRICS_TOKEN', '')
+app.config['METRICS_FLUSH_INTERVAL'] = float(os.getenv('METRICS_FLUSH_INTERVAL', 1))
+
+# Read replica ของ PostgreSQL (คั่นหลายตัวด้วย ,) หน้า public อ่านจาก replica ส่วนแอดมินเขียน/อ่านที่ primary
+# replica ที่ตามหลังเกิน REPLICA_MAX_LAG วินาทีจะถูกข้าม (ตรวจทุก REPLICA_CHECK_INTERVAL วินาที)
+# หลัง commit แอดมินคนนั้นอ่านจาก primary ต่อไม่เกิน REPLICA_STICKY_SECONDS หรือจนกว่า replica จะตามทัน
+app.config['DATABASE_REPLICA_URLS'] = [
+    normalize_database_url(url.strip()) for url in os.getenv('DATABASE_REPLICA_URL', '').split(',') if url.strip()]
+app.config['REPLICA_MAX_LAG'] = float(os.getenv('REPLICA_MAX_LAG', 30))
+app.config['REPLICA_CHECK_INTERVAL'] = float(os.getenv('REPLICA_CHECK_INTERVAL', 5))
+app.config['REPLICA_STICKY_SECONDS'] = float(os.getenv('REPLICA_STICKY_SECONDS', 10))
 app.config['MAX_CONTENT_LENGTH'] = int(os.getenv('MAX_CONTENT_LENGTH', 50 * 1024 * 1024))  # 50MB max
+app.config['STATS_CACHE_TTL'] = int(os.getenv('STATS_CACHE_TTL', 60))  # วินาที, 0 = ไม่ cache
+# เก็บแอดมินที่ล็อกอินอยู่ไว้ในหน่วยความจำ ไม่ต้อง query AdminUser ทุก request (วินาที, 0 = ไม่ cache)
+# เป็นเวลานานสุดที่ instance อื่นยังรับ session ที่ถูกเพิกถอนแล้ว instance ที่เพิกถอนเองมีผลทันที
+app.config['SESSION_USER_CACHE_TTL'] = int(os.getenv('SESSION_USER_CACHE_TTL', 30))
+app.config['ADMIN_PAGE_SIZE'] = int(os.getenv('ADMIN_PAGE_SIZE', 50))  # จำนวนแถวต่อหน้าในหน้ารายการของแอดมิน
+app.config['SEARCH_PAGE_SIZE'] = int(os.getenv('SEARCH_PAGE_SIZE', 20))
+# จำนวนรายการต่อครั้งในแต่ละแท็บของหน้าหน่วยงาน (หน้าแรกและทุกครั้งที่กดโหลดเพิ่ม)
+app.config['DEPARTMENT_TAB_PAGE_SIZE'] = int(os.getenv('DEPARTMENT_TAB_PAGE_SIZE', 20))
+# นับการดาวน์โหลด guideline และการเปิดหน้าหน่วยงานในหน่วยความจำ แล้วบันทึกเป็นชุด
+# ทุก USAGE_FLUSH_INTERVAL วินาทีหรือทุก USAGE_FLUSH_EVENTS ครั้ง (ดูที่ /admin/usage)
+app.config['USAGE_COUNTERS'] = os.getenv('USAGE_COUNTERS', 'true').lower() == 'true'
+app.config['USAGE_FLUSH_INTERVAL'] = float(os.getenv('USAGE_FLUSH_INTERVAL', 10))
+app.config['USAGE_FLUSH_EVENTS'] = int(os.getenv('USAGE_FLUSH_EVENTS', 500))
+
+# Rendered-page cache สำหรับหน้า public: memory, filesystem (ใช้ร่วมกันหลาย worker), tiered หรือ none
+app.config['PAGE_CACHE_BACKEND'] = os.getenv('PAGE_CACHE_BACKEND', 'memory')
+app.config['PAGE_CACHE_DIR'] = os.getenv('PAGE_CACHE_DIR', os.path.join(app.instance_path, 'page_cache'))
+app.config['PAGE_CACHE_MAX_ENTRIES'] = int(os.getenv('PAGE_CACHE_MAX_ENTRIES', 256))
+app.config['PAGE_CACHE_MAX_BYTES'] = int(os.getenv('PAGE_CACHE_MAX_BYTES', 32 * 1024 * 1024))
+
+# ส่งออกหน้าแรกและหน้าหน่วยงานเป็นไฟล์ HTML ที่ STATIC_EXPORT_DIR/current ให้ nginx/CDN ส่งแทน Flask (ว่าง = ปิด)
+# STATIC_EXPORT_ON_CHANGE: ส่งออกใหม่เฉพาะหน้าที่ได้รับผลทุกครั้งที่แอดมินแก้ไข (ต้องรันบนเครื่องเดียวกับ directory นั้น)
+app.config['STATIC_EXPORT_DIR'] = os.getenv('STATIC_EXPORT_DIR', '')
+app.config['STATIC_EXPORT_ON_CHANGE'] = os.getenv('STATIC_EXPORT_ON_CHANGE', 'true').lower() == 'true'
+app.config['STATIC_EXPORT_KEEP'] = int(os.getenv('STATIC_EXPORT_KEEP', 3))  # จำนวน release เก่าที่เก็บไว้ย้อนกลับได้
+
+# การส่งไฟล์จาก storage/: hot-file cache ในหน่วยความจำ และโหมดให้ nginx/Apache ส่งไฟล์แทน
+app.config['STORAGE_ROOT'] = os.getenv('STORAGE_ROOT', os.path.join(app.root_path, 'storage'))
+app.config['STORAGE_HOT_CACHE_BYTES'] = int(os.getenv('STORAGE_HOT_CACHE_BYTES', 16 * 1024 * 1024))
+app.config['STORAGE_HOT_FILE_MAX_SIZE'] = int(os.getenv('STORAGE_HOT_FILE_MAX_SIZE', 256 * 1024))
+app.config['STORAGE_ACCEL_MODE'] = os.getenv('STORAGE_ACCEL_MODE', '')  # '', 'x-accel' หรือ 'x-sendfile'
+app.config['STORAGE_ACCEL_PREFIX'] = os.getenv('STORAGE_ACCEL_PREFIX', '/protected-storage')
+app.config['STORAGE_MAX_AGE'] = int(os.getenv('STORAGE_MAX_AGE', 0))  # สำหรับไฟล์ที่ไม่ได้ immutable (ดู file_server.IMMUTABLE_PATH)
+
+# คิวอัปโหลดไฟล์: async = ส่งขึ้น Cloudinary ใน thread เบื้องหลัง, sync = อัปโหลดใน request
+# บน Vercel thread เบื้องหลังถูกหยุดหลังตอบ response จึงใช้ sync เป็นค่าเริ่มต้น
+app.config['UPLOAD_MODE'] = os.getenv('UPLOAD_MODE', 'sync' if on_vercel else 'async')
+app.config['UPLOAD_BACKEND'] = os.getenv('UPLOAD_BACKEND', 'cloudinary')  # cloudinary หรือ stub (ไม่ใช้ network)
+app.config['UPLOAD_WORKERS'] = int(os.getenv('UPLOAD_WORKERS', 2))
+app.config['UPLOAD_MAX_ATTEMPTS'] = int(os.getenv('UPLOAD_MAX_ATTEMPTS', 4))
+app.config['UPLOAD_RETRY_BASE'] = float(os.getenv('UPLOAD_RETRY_BASE', 2.0))  # วินาที
+app.config['UPLOAD_RETRY_MAX'] = float(os.getenv('UPLOAD_RETRY_MAX', 60.0))
+app.config['UPLOAD_SPOOL_DIR'] = os.getenv(
+    'UPLOAD_SPOOL_DIR', os.path.join('/tmp' if on_vercel else app.instance_path, 'upload_spool'))
+app.config['UPLOAD_STUB_LATENCY'] = float(os.getenv('UPLOAD_STUB_LATENCY', 0))
+app.config['UPLOAD_STUB_FAILURE_RATE'] = float(os.getenv('UPLOAD_STUB_FAILURE_RATE', 0))
+# อัปโหลดแบบแบ่ง chunk: แต่ละ request มีขนาดไม่เกิน UPLOAD_CHUNK_SIZE (ต่ำกว่า body limit 4.5MB ของ Vercel)
+# ขนาดไฟล์รวมจำกัดด้วย UPLOAD_MAX_FILE_SIZE แทน MAX_CONTENT_LENGTH
+app.config['UPLOAD_CHUNK_SIZE'] = int(os.getenv('UPLOAD_CHUNK_SIZE', 4 * 1024 * 1024))
+app.config['UPLOAD_MAX_FILE_SIZE'] = int(os.getenv('UPLOAD_MAX_FILE_SIZE', 200 * 1024 * 1024))
+app.config['UPLOAD_SESSION_TTL'] = int(os.getenv('UPLOAD_SESSION_TTL', 24 * 3600))  # วินาที
+app.config['CLOUDINARY_CHUNK_SIZE'] = int(os.getenv('CLOUDINARY_CHUNK_SIZE', 20 * 1024 * 1024))  # upload_large
+# ไฟล์ที่ไม่มีข้อมูลใดอ้างถึงแล้วนานเกินเวลานี้จะถูกลบจาก Cloudinary โดย flask assets-gc (วินาที)
+app.config['ASSET_GC_GRACE'] = int(os.getenv('ASSET_GC_GRACE', 24 * 3600))
+# ความกว้างของรูปย่อที่ใช้ใน srcset ของรูป knowledge/activity (พิกเซล)
+app.config['IMAGE_DERIVATIVE_WIDTHS'] = tuple(
+    int(width) for width in os.getenv('IMAGE_DERIVATIVE_WIDTHS', '320,640,1280').split(',') if width.strip())
+# นำเข้าข้อมูลจำนวนมาก (flask import-content / หน้า /admin/import)
+app.config['IMPORT_WORKERS'] = int(os.getenv('IMPORT_WORKERS', 4))  # จำนวนไฟล์ที่อัปโหลดพร้อมกัน
+app.config['IMPORT_BATCH_SIZE'] = int(os.getenv('IMPORT_BATCH_SIZE', 50))  # จำนวนแถวต่อหนึ่ง transaction
+# migrate schema อัตโนมัติตอนเริ่มระบบเมื่อฐานข้อมูลเก่ากว่าโค้ด
+# บน Vercel ปิดไว้เพื่อให้ cold start ไม่ต้องรอ migration ให้รัน flask db-upgrade ในขั้นตอน deploy แทน
+app.config['SCHEMA_AUTO_MIGRATE'] = os.getenv('SCHEMA_AUTO_MIGRATE', 'false' if on_vercel else 'true').lower() == 'true'
 
 # Cloudinary Config
 cloudinary_url = os.getenv('CLOUDINARY_URL')
 if cloudinary_url:
     cloudinary.config()  # Automatically picks up CLOUDINARY_URL from env
+elif app.config['UPLOAD_BACKEND'] == 'stub':
+    print("Using stub uploader: files are stored under storage/stub instead of Cloudinary.")
 else:
     print("Warning: CLOUDINARY_URL not found in environment. File uploads will fail.")
 
+# ให้ browser อัปโหลดไฟล์ตรงไป Cloudinary ด้วยพารามิเตอร์ที่เซิร์ฟเวอร์เซ็นให้ (ไม่ผ่าน Flask/Vercel)
+# เปิดได้เฉพาะเมื่อใช้ Cloudinary จริงและมี api_secret
+app.config['UPLOAD_DIRECT'] = (
+    os.getenv('UPLOAD_DIRECT', 'true').lower() == 'true'
+    and app.config['UPLOAD_BACKEND'] == 'cloudinary'
+    and direct_uploads_available()
+)
+
 
-db = SQLAlchemy(app)
+read_router = ReadRouter(max_lag=app.config['REPLICA_MAX_LAG'], check_interval=app.config['REPLICA_CHECK_INTERVAL'])
+db = SQLAlchemy(app, session_options={'class_': RoutingSession})
+metrics_registry = Registry(
+    directory=app.config['METRICS_DIR'] if app.config['METRICS_ENABLED'] else None,
+    flush_interval=app.config['METRICS_FLUSH_INTERVAL'],
+)
+db_checkout_seconds = metrics_registry.histogram(
+    'ha_db_pool_checkout_seconds', 'Time to check out a pooled DB connection (waiting, pre-ping, connecting)',
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0),
+)
+pool_monitor = PoolMonitor(app.config['DB_POOL_PROFILE'], on_checkout=db_checkout_seconds.observe)
+with app.app_context():
+    pool_monitor.install(db.engine)
+    read_router.primary = db.engine
+    if app.config['DATABASE_REPLICA_URLS']:
+        for replica_url in app.config['DATABASE_REPLICA_URLS']:
+            read_router.add(create_engine(replica_url, **engine_options(replica_url, app.config['DB_POOL_PROFILE'])))
+            pool_monitor.install(read_router.engines[-1])
+    elif is_sqlite_file(db.engine.url):
+        install_sqlite_pragmas(db.engine, app.config['SQLITE_PRAGMAS'])
+        if app.config['SQLITE_READ_ONLY_ENGINE']:
+            read_router.add(sqlite_read_engine(db.engine.url, app.config['SQLITE_PRAGMAS'],
+                                               **app.config['SQLALCHEMY_ENGINE_OPTIONS']))
+            pool_monitor.install(read_router.engines[-1])
+
+if app.config['INSTRUMENTATION']:
+    slow_request_logger = logging.getLogger('slow_requests')
+    slow_request_logger.propagate = False
+    slow_request_handler = (logging.FileHandler(app.config['SLOW_REQUEST_LOG'], encoding='utf-8')
+                            if app.config['SLOW_REQUEST_LOG'] else logging.StreamHandler())
+    slow_request_handler.setFormatter(logging.Formatter('%(message)s'))
+    slow_request_logger.addHandler(slow_request_handler)
+    Instrumentation(
+        slow_ms=app.config['SLOW_REQUEST_MS'], header=app.config['SERVER_TIMING_HEADER'], logger=slow_request_logger,
+    ).init_app(app)
+
+if app.config['METRICS_ENABLED']:
+    RequestMetrics(metrics_registry).init_app(app)
+
+# key ใน Flask session: {'until': เวลา, 'lsn': WAL position ของ primary} หลังผู้ใช้คนนี้ commit
+READ_PRIMARY_KEY = '_read_primary'
+
+def _choose_reader():
+    """engine อ่านของ request นี้ หรือ None ให้อ่านจาก primary (ผู้ใช้เพิ่ง commit และ replica ยังตามไม่ทัน)"""
+    if request.environ.get(EXPORT_ENVIRON_KEY):
+        return None  # ส่งออกหน้าทันทีหลังแอดมิน commit ต้องเห็นข้อมูลล่าสุด
+    engine = read_router.reader()
+    if engine is None or not read_router.replicated:
+        return engine
+    mark = session.get(READ_PRIMARY_KEY)
+    if not mark:
+        return engine
+    if mark['until'] > time.time() and not (mark.get('lsn') and read_router.caught_up(engine, mark['lsn'])):
+        return None
+    session.pop(READ_PRIMARY_KEY, None)
+    return engine
+
+def read_only_view(view):
+    """route ที่อ่านข้อมูลอย่างเดียว: query อ่านใช้ engine อ่านของ read_router (ถ้ามี) แทน engine หลัก"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if request.method in ('GET', 'HEAD'):
+            db.session.info['reader'] = _choose_reader()
+        return view(*args, **kwargs)
+    return wrapper
+
+@app.after_request
+def _read_your_writes(response):
+    """request ที่ commit ข้อมูล (แอดมิน) ให้ request ถัดไปของผู้ใช้คนเดียวกันอ่านจาก primary จนกว่า replica จะตามทัน"""
+    if read_router.replicated and db.session.info.get('committed'):
+        try:
+            lsn = read_router.primary_lsn()
+        except Exception:
+            lsn = None
+        session[READ_PRIMARY_KEY] = {'until': time.time() + app.config['REPLICA_STICKY_SECONDS'], 'lsn': lsn}
+    return response
 login_manager = LoginManager()
 login_manager.init_app(app)
 login_manager.login_view = 'admin_login'
 
 # Models
 class Department(db.Model):
+    # หน้ารายการของแอดมินเรียงตามชื่อหน่วยงาน: อ่านหน่วยงานตามลำดับชื่อ แล้วอ่านแถวของแต่ละหน่วยงานตาม
+    # index (department_id, id) ของตารางนั้น sort เฉพาะภายในหน่วยงานที่ชื่อซ้ำกัน ไม่ใช่ทั้งตาราง
+    __table_args__ = (db.Index('ix_department_name', 'name', 'id'),)
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
     code = db.Column(db.String(50), nullable=False, unique=True)
@@ -52,18 +293,37 @@ class Department(db.Model):
     updated_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc))
 
 class Guideline(db.Model):
+    # หน้าหน่วยงานเรียง guideline ตาม (upload_date, id) ภายในหน่วยงาน ส่วนหน้ารายการของแอดมินเรียงทั้งตาราง
+    __table_args__ = (
+        db.Index('ix_guideline_department_upload_date', 'department_id', 'upload_date', 'id'),
+        db.Index('ix_guideline_upload_date', 'upload_date', 'id'),
+        db.Index('ix_guideline_title', 'title', 'id'),
+        db.Index('ix_guideline_department', 'department_id', 'id'),  # เรียงตามหน่วยงาน (คู่กับ ix_department_name)
+    )
     id = db.Column(db.Integer, primary_key=True)
     department_id = db.Column(db.Integer, db.ForeignKey('department.id'), nullable=False)
     title = db.Column(db.String(200), nullable=False)
     file_path = db.Column(db.String(500))  # เปลี่ยนเป็น nullable=True
     file_size = db.Column(db.Integer)
-    upload_date = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+    upload_date = db.Column(db.DateTime, nullable=False, default=lambda: datetime.now(timezone.utc))
     description = db.Column(db.Text)
     external_link = db.Column(db.String(500))  # เพิ่มฟิลด์สำหรับ external link
     link_type = db.Column(db.String(50))  # ประเภทลิงก์ เช่น Google Drive, OneDrive, Website
-    department = db.relationship('Department', backref=db.backref('guidelines', lazy=True))
+    upload_status = db.Column(db.String(20))  # None = พร้อมแสดง, pending/failed = ไฟล์ยังอัปโหลดไม่เสร็จ
+    preview = db.query_expression()  # ข้อความย่อสำหรับหน้ารายการ (โหลดผ่าน with_expression)
+    department = db.relationship('Department', backref=db.backref(
+        'guidelines', lazy=True, order_by='(Guideline.upload_date.desc(), Guideline.id.desc())'))
 
 class Knowledge(db.Model):
+    # หน้าหน่วยงานเรียงตาม (updated_at, id) ส่วนสถิติบนแดชบอร์ดนับตาม created_at ของแต่ละหน่วยงาน
+    __table_args__ = (
+        db.Index('ix_knowledge_department_updated_at', 'department_id', 'updated_at', 'id'),
+        db.Index('ix_knowledge_department_created_at', 'department_id', 'created_at'),
+        db.Index('ix_knowledge_updated_at', 'updated_at', 'id'),  # หน้ารายการของแอดมิน
+        db.Index('ix_knowledge_created_at', 'created_at', 'id'),
+        db.Index('ix_knowledge_title', 'title', 'id'),
+        db.Index('ix_knowledge_department', 'department_id', 'id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     department_id = db.Column(db.Integer, db.ForeignKey('department.id'), nullable=False)
     title = db.Column(db.String(200), nullable=False)
@@ -71,11 +331,25 @@ class Knowledge(db.Model):
     image_path = db.Column(db.String(500))  # เพิ่มฟิลด์สำหรับรูปภาพ
     external_link = db.Column(db.String(500))  # เพิ่มฟิลด์สำหรับลิงก์ภายนอก
     link_type = db.Column(db.String(50))  # ประเภทลิงก์
-    created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
-    updated_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc))
-    department = db.relationship('Department', backref=db.backref('knowledge', lazy=True))
+    upload_status = db.Column(db.String(20))  # None = พร้อมแสดง, pending/failed = รูปยังอัปโหลดไม่เสร็จ
+    image_width = db.Column(db.Integer)
+    image_height = db.Column(db.Integer)
+    image_variants = db.Column(db.Text)  # JSON list ของรูปย่อ {url, width, height} สำหรับ srcset
+    created_at = db.Column(db.DateTime, nullable=False, default=lambda: datetime.now(timezone.utc))
+    updated_at = db.Column(db.DateTime, nullable=False, default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc))
+    preview = db.query_expression()  # ข้อความย่อสำหรับหน้ารายการ (โหลดผ่าน with_expression)
+    department = db.relationship('Department', backref=db.backref(
+        'knowledge', lazy=True, order_by='(Knowledge.updated_at.desc(), Knowledge.id.desc())'))
 
 class Activity(db.Model):
+    # หน้าหน่วยงานเรียงตาม (activity_date, id) ส่วนสถิติบนแดชบอร์ดนับตาม created_at ของแต่ละหน่วยงาน
+    __table_args__ = (
+        db.Index('ix_activity_department_activity_date', 'department_id', 'activity_date', 'id'),
+        db.Index('ix_activity_department_created_at', 'department_id', 'created_at'),
+        db.Index('ix_activity_created_at', 'created_at', 'id'),  # หน้ารายการของแอดมิน
+        db.Index('ix_activity_title', 'title', 'id'),
+        db.Index('ix_activity_department', 'department_id', 'id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     department_id = db.Column(db.Integer, db.ForeignKey('department.id'), nullable=False)
     title = db.Column(db.String(200), nullable=False)
@@ -83,18 +357,188 @@ class Activity(db.Model):
     image_path = db.Column(db.String(500))  # เพิ่มฟิลด์สำหรับรูปภาพ
     external_link = db.Column(db.String(500))  # เพิ่มฟิลด์สำหรับลิงก์ภายนอก
     link_type = db.Column(db.String(50))  # ประเภทลิงก์
+    upload_status = db.Column(db.String(20))  # None = พร้อมแสดง, pending/failed = รูปยังอัปโหลดไม่เสร็จ
+    image_width = db.Column(db.Integer)
+    image_height = db.Column(db.Integer)
+    image_variants = db.Column(db.Text)  # JSON list ของรูปย่อ {url, width, height} สำหรับ srcset
     activity_date = db.Column(db.Date)
-    created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
-    department = db.relationship('Department', backref=db.backref('activities', lazy=True))
+    created_at = db.Column(db.DateTime, nullable=False, default=lambda: datetime.now(timezone.utc))
+    preview = db.query_expression()  # ข้อความย่อสำหรับหน้ารายการ (โหลดผ่าน with_expression)
+    department = db.relationship('Department', backref=db.backref(
+        'activities', lazy=True, order_by='(Activity.activity_date.desc(), Activity.id.desc())'))
 
 class Contact(db.Model):
+    __table_args__ = (db.Index('ix_contact_department', 'department_id', 'id'),)
     id = db.Column(db.Integer, primary_key=True)
     department_id = db.Column(db.Integer, db.ForeignKey('department.id'), nullable=False)
     line_id = db.Column(db.String(100))
     email = db.Column(db.String(100))
     phone = db.Column(db.String(20))
     other_contact = db.Column(db.Text)
-    department = db.relationship('Department', backref=db.backref('contacts', lazy=True))
+    preview = db.query_expression()  # ข้อความย่อสำหรับหน้ารายการ (โหลดผ่าน with_expression)
+    department = db.relationship('Department', backref=db.backref(
+        'contacts', lazy=True, order_by='Contact.id'))
+
+class ContentRevision(db.Model):
+    """เลข revision ของเนื้อหาแต่ละส่วน ('home', 'department:<id>', 'dashboard') เพิ่มขึ้นทุกครั้งที่แอดมินแก้ไข"""
+    scope = db.Column(db.String(50), primary_key=True)
+    revision = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc))
+
+class GuidelineUsage(db.Model):
+    """ยอดดาวน์โหลดสะสมของ guideline (เขียนโดย _flush_usage เท่านั้น)"""
+    __table_args__ = (db.Index('ix_guideline_usage_downloads', 'downloads'),)  # guideline ยอดนิยมตลอดกาล
+    guideline_id = db.Column(db.Integer, primary_key=True)
+    downloads = db.Column(db.Integer, nullable=False, default=0)
+
+class DailyUsage(db.Model):
+    """จำนวนครั้งต่อวัน (UTC): kind 'download' นับต่อ guideline_id, 'view' นับต่อ department_id"""
+    day = db.Column(db.Date, primary_key=True)
+    kind = db.Column(db.String(20), primary_key=True)
+    target_id = db.Column(db.Integer, primary_key=True)
+    hits = db.Column(db.Integer, nullable=False, default=0)
+
+class UploadJob(db.Model):
+    """งานอัปโหลดไฟล์หนึ่งชิ้น (ไฟล์รออยู่ใน spool_path จนกว่าจะส่งขึ้น Cloudinary สำเร็จ)"""
+    __table_args__ = (db.Index('ix_upload_job_target', 'target_type', 'target_id'),)  # cancel_uploads
+    id = db.Column(db.Integer, primary_key=True)
+    target_type = db.Column(db.String(20), nullable=False)  # guideline, knowledge หรือ activity
+    target_id = db.Column(db.Integer, nullable=False)
+    folder = db.Column(db.String(200), nullable=False)
+    resource_type = db.Column(db.String(20), nullable=False)
+    spool_path = db.Column(db.String(500), nullable=False)
+    original_filename = db.Column(db.String(255))
+    status = db.Column(db.String(20), nullable=False, default='queued', index=True)  # queued, running, done, failed, cancelled
+    sha256 = db.Column(db.String(64))  # ใช้หาไฟล์เดียวกันที่เคยอัปโหลดแล้ว (StoredAsset)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    error = db.Column(db.Text)
+    result_url = db.Column(db.String(500))
+    created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+    updated_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc))
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'target_type': self.target_type,
+            'target_id': self.target_id,
+            'filename': self.original_filename,
+            'status': self.status,
+            'attempts': self.attempts,
+            'error': self.error,
+            'result_url': self.result_url,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None,
+        }
+
+class StoredAsset(db.Model):
+    """ไฟล์ที่อัปโหลดขึ้น Cloudinary (หรือ stub) แล้ว ค้นหาได้ด้วย SHA-256 ของเนื้อไฟล์
+
+    ref_count คือจำนวนแถว Guideline/Knowledge/Activity ที่ใช้ secure_url นี้อยู่ (ดู _update_asset_refs)
+    ไฟล์ที่อัปโหลดตรงจาก browser ไม่ผ่านเซิร์ฟเวอร์จึงไม่มี sha256 แต่ยังนับการอ้างอิงเพื่อให้ลบได้อย่างปลอดภัย
+    """
+    __table_args__ = (db.UniqueConstraint('backend', 'sha256'),)
+    id = db.Column(db.Integer, primary_key=True)
+    backend = db.Column(db.String(20), nullable=False)
+    sha256 = db.Column(db.String(64))
+    secure_url = db.Column(db.String(500), nullable=False, unique=True)
+    public_id = db.Column(db.String(300))
+    resource_type = db.Column(db.String(20))
+    size = db.Column(db.BigInteger)
+    width = db.Column(db.Integer)
+    height = db.Column(db.Integer)
+    ref_count = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+    updated_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc))
+
+    def to_result(self):
+        """ผลลัพธ์ในรูปแบบเดียวกับ uploader.upload()"""
+        return {
+            'secure_url': self.secure_url,
+            'bytes': self.size,
+            'public_id': self.public_id,
+            'resource_type': self.resource_type,
+            'width': self.width,
+            'height': self.height,
+        }
+
+class BulkImport(db.Model):
+    """การนำเข้าข้อมูลหนึ่งครั้ง เก็บความคืบหน้าและข้อผิดพลาดรายแถวไว้ให้หน้าแอดมินและ CLI แสดง"""
+    id = db.Column(db.Integer, primary_key=True)
+    filename = db.Column(db.String(255), nullable=False)
+    source_path = db.Column(db.String(500), nullable=False)
+    dry_run = db.Column(db.Boolean, nullable=False, default=False)
+    status = db.Column(db.String(20), nullable=False, default='queued')  # queued, running, done, failed
+    total = db.Column(db.Integer, nullable=False, default=0)
+    imported = db.Column(db.Integer, nullable=False, default=0)
+    skipped = db.Column(db.Integer, nullable=False, default=0)  # เคยนำเข้าแล้ว
+    failed = db.Column(db.Integer, nullable=False, default=0)
+    errors = db.Column(db.Text)  # JSON list ของ {row, title, error}
+    created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+    updated_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc))
+
+    MAX_ERRORS = 500
+
+    @property
+    def processed(self):
+        return self.imported + self.skipped + self.failed
+
+    @property
+    def error_list(self):
+        return json.loads(self.errors) if self.errors else []
+
+    def add_error(self, row, message):
+        errors = self.error_list
+        if len(errors) < self.MAX_ERRORS:
+            errors.append({'row': row.number if row else None, 'title': row.title if row else '', 'error': message})
+            self.errors = json.dumps(errors, ensure_ascii=False)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'filename': self.filename,
+            'dry_run': self.dry_run,
+            'status': self.status,
+            'total': self.total,
+            'processed': self.processed,
+            'imported': self.imported,
+            'skipped': self.skipped,
+            'failed': self.failed,
+            'errors': self.error_list,
+        }
+
+class ImportedItem(db.Model):
+    """แถวของ manifest ที่นำเข้าแล้ว (key ของแถว -> ข้อมูลที่สร้าง) ทำให้นำเข้าไฟล์เดิมซ้ำได้โดยไม่เกิดข้อมูลซ้ำ"""
+    key = db.Column(db.String(64), primary_key=True)
+    target_type = db.Column(db.String(20), nullable=False)
+    target_id = db.Column(db.Integer, nullable=False)
+    import_id = db.Column(db.Integer)
+    created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+
+class ChunkedUpload(db.Model):
+    """ไฟล์ที่กำลังอัปโหลดแบบแบ่ง chunk (received = จำนวน byte ที่เขียนลง spool_path ครบแล้ว)"""
+    id = db.Column(db.String(32), primary_key=True)
+    filename = db.Column(db.String(255), nullable=False)
+    size = db.Column(db.BigInteger, nullable=False)
+    chunk_size = db.Column(db.Integer, nullable=False)
+    received = db.Column(db.BigInteger, nullable=False, default=0)
+    sha256 = db.Column(db.String(64))  # คำนวณเมื่อได้รับครบทุก chunk
+    spool_path = db.Column(db.String(500), nullable=False)
+    created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+    updated_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc))
+
+    @property
+    def complete(self):
+        return self.received >= self.size
+
+    def to_dict(self):
+        return {
+            'upload_id': self.id,
+            'filename': self.filename,
+            'size': self.size,
+            'chunk_size': self.chunk_size,
+            'received': self.received,
+            'next_index': self.received // self.chunk_size,
+            'complete': self.complete,
+        }
 
 class AdminUser(UserMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -103,44 +547,984 @@ class AdminUser(UserMixin, db.Model):
     email = db.Column(db.String(120), unique=True, nullable=False)
     created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
     last_login = db.Column(db.DateTime)
+    # เพิ่มทีละหนึ่งเมื่อต้องการให้ session ที่ล็อกอินอยู่ทั้งหมดหลุด (เปลี่ยนรหัสผ่าน, flask revoke-sessions)
+    session_version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+
+    @property
+    def credential_version(self):
+        """เปลี่ยนทุกครั้งที่ username หรือรหัสผ่านเปลี่ยน (HMAC ด้วย SECRET_KEY จึงเดาจาก cookie ไม่ได้)"""
+        message = f'{self.username}\0{self.password_hash}'.encode('utf-8')
+        return hmac.new(app.config['SECRET_KEY'].encode('utf-8'), message, hashlib.sha256).hexdigest()[:16]
+
+    def get_id(self):
+        # Flask-Login เก็บค่านี้ใน session: session ที่ล็อกอินก่อนเพิกถอนหรือเปลี่ยนรหัสผ่านจะโหลดผู้ใช้ไม่ได้อีก
+        return f'{self.id}:{self.session_version}:{self.credential_version}'
+
+class SessionUser(UserMixin):
+    """แอดมินที่ล็อกอินอยู่ในรูปที่ไม่ผูกกับ session ของ SQLAlchemy จึงเก็บใน cache ข้าม request ได้"""
+
+    def __init__(self, admin):
+        self.id = admin.id
+        self.username = admin.username
+        self.email = admin.email
+        self._session_id = admin.get_id()
+
+    def get_id(self):
+        return self._session_id
+
+# ===== Full-text search =====
+search_index = SearchIndex()
+
+def _search_document(obj):
+    """แปลง model เป็น (doc_type, doc_id, department_id, title, body) สำหรับดัชนีค้นหา"""
+    if isinstance(obj, Guideline):
+        return ('guideline', obj.id, obj.department_id, obj.title, obj.description)
+    if isinstance(obj, Knowledge):
+        return ('knowledge', obj.id, obj.department_id, obj.title, obj.content)
+    if isinstance(obj, Activity):
+        return ('activity', obj.id, obj.department_id, obj.title, obj.description)
+    return None
+
+def _iter_search_documents():
+    for model in (Guideline, Knowledge, Activity):
+        # yield_per อ่านทีละชุด ข้อมูลหลักล้านแถวจะไม่ถูกโหลดเข้าหน่วยความจำพร้อมกัน
+        query = db.select(model).where(model.upload_status.is_(None)).execution_options(yield_per=1000)
+        for obj in db.session.execute(query).scalars():
+            yield _search_document(obj)
+
+@event.listens_for(Session, 'after_flush')
+def _update_search_index(session, flush_context):
+    """อัปเดตดัชนีค้นหาใน transaction เดียวกับการบันทึกข้อมูล (ทุก route ที่ commit จะได้ดัชนีล่าสุดเสมอ)"""
+    if not search_index.available:
+        return
+    connection = session.connection()
+    for obj in list(session.new) + list(session.dirty):
+        document = _search_document(obj)
+        if document is None:
+            continue
+        if obj.upload_status:
+            # ยังอัปโหลดไฟล์ไม่เสร็จ ไม่แสดงในผลค้นหาเหมือนหน้า public
+            search_index.delete(connection, document[0], document[1])
+        else:
+            search_index.upsert(connection, *document)
+    for obj in session.deleted:
+        document = _search_document(obj)
+        if document is not None:
+            search_index.delete(connection, document[0], document[1])
+
+# คอลัมน์ที่เก็บ URL ของไฟล์ที่อัปโหลด (นับการอ้างอิง StoredAsset)
+ASSET_URL_COLUMNS = {Guideline: 'file_path', Knowledge: 'image_path', Activity: 'image_path'}
+
+def _adjust_asset_refs(connection, deltas):
+    for url, delta in deltas.items():
+        if url and delta:
+            connection.execute(
+                db.update(StoredAsset)
+                .where(StoredAsset.secure_url == url)
+                .values(ref_count=StoredAsset.ref_count + delta)
+            )
+
+@event.listens_for(Session, 'after_flush')
+def _update_asset_refs(session, flush_context):
+    """ปรับ ref_count ของ StoredAsset ตาม URL ที่ถูกเพิ่ม เปลี่ยน หรือลบใน flush นี้ (URL ที่ไม่อยู่ในตารางไม่มีผล)"""
+    deltas = {}
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        column = ASSET_URL_COLUMNS.get(type(obj))
+        if column is None:
+            continue
+        history = db.inspect(obj).attrs[column].history
+        if obj in session.deleted:
+            removed, added = list(history.unchanged) + list(history.deleted), []
+        else:
+            removed, added = history.deleted, history.added
+        for url in removed:
+            deltas[url] = deltas.get(url, 0) - 1
+        for url in added:
+            deltas[url] = deltas.get(url, 0) + 1
+    if deltas:
+        _adjust_asset_refs(session.connection(), deltas)
+
+def collect_unused_assets(grace=None):
+    """ลบไฟล์ที่ไม่มีแถวข้อมูลใดอ้างถึงแล้ว (ref_count เป็น 0 นานกว่า grace วินาที) ทั้งในตารางและบน Cloudinary"""
+    grace = app.config['ASSET_GC_GRACE'] if grace is None else grace
+    cutoff = (datetime.now(timezone.utc) - timedelta(seconds=grace)).replace(tzinfo=None)
+    assets = db.session.execute(
+        db.select(StoredAsset).where(
+            StoredAsset.backend == uploader.name,
+            StoredAsset.ref_count <= 0,
+            StoredAsset.updated_at < cutoff,
+        )
+    ).scalars().all()
+    removed = 0
+    for asset in assets:
+        # ลบแถวแบบมีเงื่อนไขก่อน ถ้ามีการนำไฟล์กลับมาใช้ระหว่างนี้ ref_count จะไม่เป็น 0 แล้วจึงไม่ลบ
+        deleted = db.session.execute(
+            db.delete(StoredAsset).where(StoredAsset.id == asset.id, StoredAsset.ref_count <= 0)
+        ).rowcount
+        db.session.commit()
+        if not deleted:
+            continue
+        try:
+            uploader.delete(asset.public_id, asset.resource_type)
+            removed += 1
+        except Exception as e:
+            print(f"Warning: could not delete {asset.public_id}: {e}")
+    return removed
+
+# ความยาวข้อความย่อที่แสดงในหน้ารายการ (ตัดที่ฐานข้อมูล ไม่ต้องดึงข้อความเต็ม)
+PREVIEW_LENGTH = 100
+
+# ===== Keyset pagination สำหรับหน้ารายการของแอดมิน =====
+# เรียงตาม (คอลัมน์ที่เลือก, id) และใช้ค่าของแถวสุดท้ายเป็น cursor แทน OFFSET
+# ทำให้ทุกหน้าเร็วเท่ากันไม่ว่าจะมีข้อมูลกี่หมื่นแถว
+
+def _encode_cursor(value, row_id):
+    if isinstance(value, (datetime, date)):
+        value = value.isoformat()
+    payload = json.dumps([value, row_id], ensure_ascii=False).encode('utf-8')
+    return base64.urlsafe_b64encode(payload).decode('ascii').rstrip('=')
+
+def _decode_cursor(cursor, null_value):
+    """แปลง cursor กลับเป็น (ค่า, id) โดยใช้ชนิดของ null_value ในการแปลงค่า คืน None ถ้า cursor ไม่ถูกต้อง"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        value, row_id = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        if isinstance(null_value, datetime):
+            value = datetime.fromisoformat(value)
+        elif isinstance(null_value, date):
+            value = date.fromisoformat(value)
+        return value, int(row_id)
+    except (ValueError, TypeError):
+        return None
+
+def keyset_paginate(query, model, sort_options, default_sort, default_dir='desc', per_page=None, args=None):
+    """แบ่งหน้าแบบ keyset ตามพารามิเตอร์ sort, dir, after, before ใน query string (หรือใน args ถ้าส่งมา)
+
+    sort_options คือ dict {ชื่อ: (column, ค่าแทน NULL)} ที่อนุญาตให้เรียง ใส่ค่าที่สามเป็น False ได้ถ้าคอลัมน์ไม่มี NULL
+    จริง (เรียงด้วยคอลัมน์ตรงๆ ให้ใช้ index ได้ แทน coalesce ที่ต้อง sort ทุกแถว) ค่าแทน NULL ยังใช้แปลงชนิดของ cursor
+    คืนค่า dict ที่มี items และ cursor สำหรับหน้าถัดไป/ก่อนหน้า
+    """
+    per_page = per_page or app.config['ADMIN_PAGE_SIZE']
+    args = request.args if args is None else args
+    sort = args.get('sort', default_sort)
+    if sort not in sort_options:
+        sort = default_sort
+    direction = 'asc' if args.get('dir', default_dir) == 'asc' else 'desc'
+    column, null_value, *nullable = sort_options[sort]
+    sort_key = db.func.coalesce(column, null_value) if nullable != [False] else column
+    key = db.tuple_(sort_key, model.id)
+
+    after = args.get('after')
+    before = args.get('before')
+    cursor = _decode_cursor(after or before, null_value) if (after or before) else None
+    backwards = bool(before) and cursor is not None
+
+    # เดินไปข้างหน้า = ทิศทางเดียวกับที่เรียง, ย้อนกลับ = กลับทิศแล้วค่อย reverse ผลลัพธ์
+    ascending = (direction == 'asc') != backwards
+    if cursor is not None:
+        query = query.where(key > db.tuple_(*cursor) if ascending else key < db.tuple_(*cursor))
+    order = (sort_key.asc(), model.id.asc()) if ascending else (sort_key.desc(), model.id.desc())
+    rows = db.session.execute(
+        query.add_columns(sort_key.label('sort_key')).order_by(*order).limit(per_page + 1)
+    ).all()
+
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+    if backwards:
+        rows.reverse()
+    items = [row[0] for row in rows]
+
+    has_next = has_more if not backwards else True
+    has_prev = (cursor is not None) if not backwards else has_more
+    return {
+        'items': items,
+        'sort': sort,
+        'dir': direction,
+        'next_cursor': _encode_cursor(rows[-1].sort_key, items[-1].id) if rows and has_next else None,
+        'prev_cursor': _encode_cursor(rows[0].sort_key, items[0].id) if rows and has_prev else None,
+    }
+
+def _count_subquery(model, date_column=None, since=None):
+    """นับจำนวนแถวของ model ที่อยู่ในหน่วยงานเดียวกัน (correlated scalar subquery)
+
+    ถ้าส่ง date_column และ since มาด้วย จะนับเฉพาะแถวที่ date_column >= since
+    """
+    query = db.select(db.func.count(model.id)).where(model.department_id == Department.id)
+    if date_column is not None:
+        query = query.where(date_column >= since)
+    return query.correlate(Department).scalar_subquery()
+
+def department_content_counts():
+    """ดึงหน่วยงานทั้งหมดพร้อมจำนวน guidelines/knowledge/activities ใน query เดียว
+
+    คืนค่า (departments, counts) โดย counts เป็น dict {department_id: {...}}
+    """
+    rows = db.session.execute(
+        db.select(
+            Department,
+            _count_subquery(Guideline).label('guidelines'),
+            _count_subquery(Knowledge).label('knowledge'),
+            _count_subquery(Activity).label('activities'),
+        ).order_by(Department.id)
+    ).all()
+    departments = [row.Department for row in rows]
+    counts = {
+        row.Department.id: {
+            'guidelines': row.guidelines,
+            'knowledge': row.knowledge,
+            'activities': row.activities,
+        }
+        for row in rows
+    }
+    return departments, counts
+
+# ===== Dashboard statistics cache =====
+# เก็บผลสถิติไว้ในหน่วยความจำช่วงสั้นๆ (STATS_CACHE_TTL) คู่กับ revision ของ scope 'dashboard' ตอนคำนวณ
+# notify_content_changed เพิ่ม revision นี้ในฐานข้อมูลทุกครั้งที่แก้ไขข้อมูล ทุก worker/instance จึงเลิกใช้ค่าเดิมทันที
+DASHBOARD_SCOPE = 'dashboard'
+_dashboard_stats_lock = threading.Lock()
+_dashboard_stats_cache = {'value': None, 'revision': None, 'expires_at': 0.0, 'hits': 0, 'misses': 0}
+
+def compute_dashboard_stats():
+    """คำนวณสถิติทั้งหมดของแดชบอร์ดใน query เดียว
+
+    แต่ละแถวคือหน่วยงานหนึ่งพร้อมจำนวนทั้งหมด/เดือนนี้/สัปดาห์นี้ ส่วนยอดรวมคำนวณจากผลรวมของแถว
+    """
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    month_start = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    week_start = (now - timedelta(days=now.weekday())).replace(hour=0, minute=0, second=0, microsecond=0)
+
+    columns = {
+        'guidelines': _count_subquery(Guideline),
+        'guidelines_month': _count_subquery(Guideline, Guideline.upload_date, month_start),
+        'guidelines_week': _count_subquery(Guideline, Guideline.upload_date, week_start),
+        'knowledge': _count_subquery(Knowledge),
+        'knowledge_month': _count_subquery(Knowledge, Knowledge.created_at, month_start),
+        'knowledge_week': _count_subquery(Knowledge, Knowledge.created_at, week_start),
+        'activities': _count_subquery(Activity),
+        'activities_month': _count_subquery(Activity, Activity.created_at, month_start),
+        'activities_week': _count_subquery(Activity, Activity.created_at, week_start),
+    }
+    rows = db.session.execute(
+        db.select(
+            Department.id, Department.name, Department.code,
+            *[column.label(key) for key, column in columns.items()]
+        ).order_by(Department.id)
+    ).all()
+
+    per_department = [row._asdict() for row in rows]
+    totals = {key: sum(row[key] for row in per_department) for key in columns}
+    totals['departments'] = len(per_department)
+    return {
+        **totals,
+        'per_department': per_department,
+        'month_start': month_start,
+        'week_start': week_start,
+        'generated_at': now,
+    }
+
+def _cached_dashboard_stats(revision):
+    """สถิติใน cache ถ้ายังไม่หมดอายุและคำนวณจาก revision เดียวกัน ไม่เช่นนั้น None"""
+    with _dashboard_stats_lock:
+        if app.config['STATS_CACHE_TTL'] > 0 and _dashboard_stats_cache['value'] is not None \
+                and _dashboard_stats_cache['revision'] == revision \
+                and _dashboard_stats_cache['expires_at'] > time.monotonic():
+            return _dashboard_stats_cache['value']
+    return None
+
+def get_dashboard_stats():
+    """คืนค่าสถิติจาก cache ถ้ายังใช้ได้ (อ่าน revision ด้วย primary key lookup) ไม่เช่นนั้นคำนวณใหม่"""
+    revision, _ = get_revision(DASHBOARD_SCOPE)
+    stats = _cached_dashboard_stats(revision)
+    with _dashboard_stats_lock:
+        _dashboard_stats_cache['hits' if stats is not None else 'misses'] += 1
+    if stats is not None:
+        return stats
+
+    stats = compute_dashboard_stats()
+    with _dashboard_stats_lock:
+        _dashboard_stats_cache['value'] = stats
+        _dashboard_stats_cache['revision'] = revision
+        _dashboard_stats_cache['expires_at'] = time.monotonic() + app.config['STATS_CACHE_TTL']
+    return stats
+
+def content_total(model, key):
+    """จำนวนรายการทั้งหมดของหน้ารายการแอดมิน: ใช้ยอดจาก cache ของแดชบอร์ดถ้ายังใช้ได้ ไม่เช่นนั้น COUNT ตารางเดียว"""
+    stats = _cached_dashboard_stats(get_revision(DASHBOARD_SCOPE)[0])
+    if stats is not None:
+        return stats[key]
+    return db.session.scalar(db.select(db.func.count()).select_from(model))
+
+storage_server = StorageFileServer(
+    app.config['STORAGE_ROOT'],
+    hot_cache_bytes=app.config['STORAGE_HOT_CACHE_BYTES'],
+    hot_file_max_size=app.config['STORAGE_HOT_FILE_MAX_SIZE'],
+    accel_mode=app.config['STORAGE_ACCEL_MODE'],
+    accel_prefix=app.config['STORAGE_ACCEL_PREFIX'],
+    max_age=app.config['STORAGE_MAX_AGE'],
+)
+
+# ===== Content revisions + rendered-page cache =====
+page_cache = PageCache(create_backend(
+    app.config['PAGE_CACHE_BACKEND'],
+    directory=app.config['PAGE_CACHE_DIR'],
+    max_entries=app.config['PAGE_CACHE_MAX_ENTRIES'],
+    max_bytes=app.config['PAGE_CACHE_MAX_BYTES'],
+))
+
+# อัตรา hit = hit / (hit + miss) ของแต่ละ cache คำนวณใน Prometheus จากค่าสะสมของทุก worker
+metrics_registry.counter('ha_cache_requests_total', 'Cache lookups by cache and result', ('cache', 'result'), collect=lambda: {
+    ('page', 'hit'): page_cache.hits,
+    ('page', 'miss'): page_cache.misses,
+    ('dashboard_stats', 'hit'): _dashboard_stats_cache['hits'],
+    ('dashboard_stats', 'miss'): _dashboard_stats_cache['misses'],
+    ('storage_hot_file', 'hit'): storage_server.hot_hits,
+    ('storage_hot_file', 'miss'): storage_server.hot_misses,
+    ('session_user', 'hit'): _session_user_stats['hits'],
+    ('session_user', 'miss'): _session_user_stats['misses'],
+})
+
+def _templates_fingerprint():
+    """hash ของไฟล์ template ทั้งหมด ใส่ใน cache key เพื่อไม่ให้ใช้ cache ของ deploy เก่า"""
+    digest = hashlib.sha256()
+    for root, _, files in sorted(os.walk(os.path.join(app.root_path, app.template_folder))):
+        for name in sorted(files):
+            with open(os.path.join(root, name), 'rb') as f:
+                digest.update(name.encode('utf-8'))
+                digest.update(f.read())
+    return digest.hexdigest()[:12]
+
+TEMPLATES_FINGERPRINT = _templates_fingerprint()
+
+def department_scope(dept_id):
+    return f'department:{int(dept_id)}'
+
+def get_revision(scope):
+    """อ่าน (revision, เวลาแก้ไขล่าสุด) ด้วย primary key lookup 1 ครั้ง คืน (0, None) ถ้ายังไม่เคยแก้ไข"""
+    row = db.session.get(ContentRevision, scope)
+    if row is None:
+        return 0, None
+    updated_at = row.updated_at
+    if updated_at is not None and updated_at.tzinfo is None:
+        updated_at = updated_at.replace(tzinfo=timezone.utc)
+    return row.revision, updated_at
+
+def bump_revisions(scopes, retry=True):
+    """เพิ่ม revision ของแต่ละ scope (ต้องเรียกหลัง commit ข้อมูลจริงแล้วเท่านั้น)"""
+    for scope in scopes:
+        updated = db.session.execute(
+            db.update(ContentRevision)
+            .where(ContentRevision.scope == scope)
+            .values(revision=ContentRevision.revision + 1, updated_at=datetime.now(timezone.utc))
+        ).rowcount
+        if not updated:
+            db.session.add(ContentRevision(scope=scope, revision=1))
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # worker อื่นสร้างแถวเดียวกันไปพร้อมกัน ลองใหม่อีกครั้ง (คราวนี้ UPDATE จะเจอแถวแล้ว)
+        db.session.rollback()
+        if not retry:
+            raise
+        bump_revisions(scopes, retry=False)
+
+def _page_cacheable():
+    """หน้าที่มี flash message หรือเมนูของแอดมินต้อง render ใหม่เสมอ"""
+    return not current_user.is_authenticated and '_flashes' not in session
+
+def cached_page(scope, render, variant=''):
+    """ตอบหน้าของ scope จาก cache พร้อม ETag/Last-Modified และตอบ 304 โดยไม่ render ถ้า browser มีฉบับล่าสุดแล้ว
+
+    variant แยก response หลายแบบที่ใช้ revision เดียวกัน (เช่นแท็บและหน้าของแท็บในหน้าหน่วยงาน)
+    """
+    if not _page_cacheable():
+        response = make_response(render())
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response
+
+    revision, updated_at = get_revision(scope)
+    etag = f'{TEMPLATES_FINGERPRINT}-{scope.replace(":", "-")}-r{revision}'
+    if variant:
+        etag += '-' + hashlib.sha256(variant.encode('utf-8')).hexdigest()[:12]
+    if request.if_none_match:
+        not_modified = request.if_none_match.contains(etag)
+    else:
+        not_modified = (
+            updated_at is not None and request.if_modified_since is not None
+            and updated_at.replace(microsecond=0) <= request.if_modified_since
+        )
+
+    if not_modified:
+        response = make_response('', 304)
+    else:
+        key = f'{TEMPLATES_FINGERPRINT}:{scope}:r{revision}' + (f':{variant}' if variant else '')
+        response = make_response(page_cache.get_or_render(key, render))
+    response.set_etag(etag)
+    if updated_at is not None:
+        response.last_modified = updated_at
+    # ให้ browser/proxy เก็บไว้ได้แต่ต้องถามซ้ำทุกครั้ง (ซึ่งถูกมากเพราะได้ 304)
+    response.headers['Cache-Control'] = 'public, no-cache'
+    return response
+
+def notify_content_changed(*department_ids, department_changed=False):
+    """เรียกหลัง commit ทุกครั้งที่ admin เพิ่ม/แก้ไข/ลบข้อมูล เพื่อล้าง cache ที่เกี่ยวข้อง
+
+    department_changed=True เมื่อแก้ไขตัวหน่วยงานเอง (หน้าแรกแสดงรายชื่อหน่วยงานจึงต้องเปลี่ยนด้วย)
+    """
+    scopes = {department_scope(dept_id) for dept_id in department_ids if dept_id is not None}
+    if department_changed:
+        scopes.add('home')
+    bump_revisions(sorted(scopes | {DASHBOARD_SCOPE}))
+    if static_exporter is not None and app.config['STATIC_EXPORT_ON_CHANGE']:
+        static_export_queue.submit(export_static_pages, [_scope_url(scope) for scope in sorted(scopes)])
+
+# ===== ส่งออกหน้า public เป็น HTML =====
+def _scope_url(scope):
+    return '/' if scope == 'home' else f"/department/{scope.split(':', 1)[1]}"
+
+def _static_export_pages():
+    department_ids = db.session.scalars(db.select(Department.id).order_by(Department.id))
+    return ['/'] + [f'/department/{dept_id}' for dept_id in department_ids]
+
+static_exporter = StaticExporter(
+    app, app.config['STATIC_EXPORT_DIR'], _static_export_pages, keep_releases=app.config['STATIC_EXPORT_KEEP'],
+) if app.config['STATIC_EXPORT_DIR'] else None
+static_export_queue = UploadQueue(app, mode=app.config['UPLOAD_MODE'], max_workers=1)
+
+def export_static_pages(urls):
+    """ส่งออกหน้าที่ได้รับผลจากการแก้ไข ถ้าล้มเหลวหน้าเดิมยังอยู่ และรอบถัดไปหรือ flask static-export จะเขียนให้ใหม่"""
+    try:
+        static_exporter.export(urls)
+    except Exception as e:
+        print(f"Warning: static export failed ({str(e).splitlines()[0] if str(e) else type(e).__name__})")
+
+# ===== Background uploads =====
+UPLOAD_TARGETS = {'guideline': Guideline, 'knowledge': Knowledge, 'activity': Activity}
+
+uploader = create_uploader(
+    app.config['UPLOAD_BACKEND'],
+    stub_root=os.path.join(app.config['STORAGE_ROOT'], 'stub'),
+    stub_url_prefix='/storage/stub',
+    stub_latency=app.config['UPLOAD_STUB_LATENCY'],
+    stub_failure_rate=app.config['UPLOAD_STUB_FAILURE_RATE'],
+    chunk_size=app.config['CLOUDINARY_CHUNK_SIZE'],
+)
+upload_queue = UploadQueue(app, mode=app.config['UPLOAD_MODE'], max_workers=app.config['UPLOAD_WORKERS'])
+
+upload_seconds = metrics_registry.histogram(
+    'ha_upload_duration_seconds', 'Duration of each upload attempt to the storage backend', ('backend',),
+    buckets=(0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0),
+)
+upload_bytes = metrics_registry.counter('ha_upload_bytes_total', 'Bytes uploaded successfully', ('backend',))
+upload_failures = metrics_registry.counter(
+    'ha_upload_failures_total', 'Failed upload attempts (retryable or permanent)', ('backend', 'kind'))
+
+def upload_file(path, folder, resource_type):
+    """uploader.upload() หนึ่งครั้ง พร้อมบันทึกเวลา จำนวน byte และความล้มเหลวลง metrics/Server-Timing"""
+    started = time.perf_counter()
+    try:
+        with timed('upload'):
+            result = uploader.upload(path, folder, resource_type)
+    except Exception as e:
+        upload_failures.inc(uploader.name, 'permanent' if isinstance(e, PermanentUploadError) else 'retryable')
+        raise
+    finally:
+        upload_seconds.observe(time.perf_counter() - started, uploader.name)
+    upload_bytes.inc(uploader.name, amount=result.get('bytes') or 0)
+    return result
+
+def _target_type(target):
+    return next(name for name, model in UPLOAD_TARGETS.items() if isinstance(target, model))
+
+def _remove_spool(job):
+    try:
+        os.unlink(job.spool_path)
+    except OSError:
+        pass
+
+def receive_upload(field):
+    """รับไฟล์ของฟิลด์ในฟอร์ม คืน dict ที่มี filename และ spool_path หรือ direct หรือ None ถ้าไม่ได้ส่งไฟล์มา
+
+    รองรับ 3 แบบ
+    - <field>_direct: ผลการอัปโหลดตรงจาก browser ไป Cloudinary (JSON) ตรวจลายเซ็นใน start_upload
+    - <field>_upload_id: การอัปโหลดแบบแบ่ง chunk ที่ได้รับครบแล้ว (ไฟล์อยู่ใน spool แล้ว ไม่ต้องคัดลอกซ้ำ)
+    - ไฟล์แบบ multipart ปกติ
+    """
+    direct = request.form.get(f'{field}_direct')
+    if direct and app.config['UPLOAD_DIRECT']:
+        try:
+            payload = json.loads(direct)
+        except ValueError:
+            return None
+        if not isinstance(payload, dict):
+            return None
+        return {'filename': str(payload.get('original_filename') or ''), 'direct': payload}
+    upload_id = request.form.get(f'{field}_upload_id')
+    if upload_id:
+        chunked = db.session.get(ChunkedUpload, upload_id)
+        if chunked is None or not chunked.complete:
+            return None
+        # ไฟล์ใน spool ย้ายไปเป็นของ UploadJob แล้ว ลบเฉพาะแถวที่ติดตามการอัปโหลด
+        db.session.delete(chunked)
+        return {'filename': chunked.filename, 'spool_path': chunked.spool_path, 'sha256': chunked.sha256}
+    file = request.files.get(field)
+    if file and file.filename:
+        spool_path, sha256 = spool_upload(file, app.config['UPLOAD_SPOOL_DIR'])
+        return {'filename': file.filename, 'spool_path': spool_path, 'sha256': sha256}
+    return None
+
+def start_upload(target, upload, folder, resource_type):
+    """สร้าง UploadJob ของไฟล์ที่ได้จาก receive_upload() ให้ target แล้ว commit และส่งเข้าคิว
+
+    งานเก่าของ target เดียวกันที่ยังไม่เสร็จจะถูกยกเลิก ในโหมด sync งานเสร็จแล้วเมื่อฟังก์ชันคืนค่า
+    บันทึกผลทันทีโดยไม่ผ่านคิวในสองกรณี
+    - ไฟล์ที่ browser อัปโหลดตรงไป Cloudinary แล้ว (ถ้าลายเซ็นไม่ถูกต้องจะโยน PermanentUploadError)
+    - ไฟล์ที่มีเนื้อหาเดียวกับไฟล์ที่เคยอัปโหลดไว้แล้ว (SHA-256 ตรงกัน) ใช้ URL เดิมได้เลย
+    """
+    db.session.flush()  # ให้ target มี id
+    target_type = _target_type(target)
+    cancel_uploads(target_type, target.id)
+    if target.upload_status == 'failed':
+        target.upload_status = 'pending'
+    job = UploadJob(
+        target_type=target_type,
+        target_id=target.id,
+        folder=folder,
+        resource_type=resource_type,
+        spool_path=upload.get('spool_path', ''),
+        original_filename=upload['filename'],
+        sha256=upload.get('sha256'),
+    )
+    result = None
+    if 'direct' in upload:
+        result = _register_asset(None, verify_direct_upload(upload['direct'], folder))
+    elif job.sha256:
+        asset = _find_asset(job.sha256)
+        if asset is not None:
+            result = asset.to_result()
+    if result is not None:
+        _apply_upload_result(target, result)
+        job.status = 'done'
+        job.result_url = result['secure_url']
+        db.session.add(job)
+        db.session.commit()
+        if job.spool_path:
+            _remove_spool(job)
+        return job
+    db.session.add(job)
+    db.session.commit()
+    upload_queue.submit(process_upload_job, job.id)
+    if upload_queue.mode == 'sync':
+        db.session.refresh(job)
+    return job
+
+def cancel_uploads(target_type, target_id):
+    """ยกเลิกงานที่ยังไม่เสร็จของ target (เมื่อลบข้อมูล เปลี่ยนเป็นลิงก์ หรืออัปโหลดไฟล์ใหม่แทน)
+
+    งานที่ worker กำลังทำอยู่จะเห็นสถานะ cancelled ตอนจบและทิ้งผลลัพธ์ไป (ไม่ commit ในฟังก์ชันนี้)
+    """
+    jobs = db.session.execute(
+        db.select(UploadJob).where(
+            UploadJob.target_type == target_type,
+            UploadJob.target_id == target_id,
+            UploadJob.status.in_(('queued', 'running', 'failed')),
+        )
+    ).scalars()
+    for job in jobs:
+        if job.status == 'failed':
+            _remove_spool(job)
+        job.status = 'cancelled'
+
+def flash_upload_result(job, success_message):
+    if job.status == 'done':
+        flash(success_message, 'success')
+    elif job.status == 'failed':
+        flash(f'เกิดข้อผิดพลาดในการอัปโหลดไฟล์: {job.error}', 'error')
+    else:
+        flash('บันทึกข้อมูลแล้ว ไฟล์กำลังอัปโหลดอยู่เบื้องหลัง ดูสถานะได้ที่หน้างานอัปโหลด', 'info')
+
+def _find_asset(sha256):
+    if not sha256:
+        return None
+    return db.session.execute(
+        db.select(StoredAsset).filter_by(backend=uploader.name, sha256=sha256)
+    ).scalar_one_or_none()
+
+def _find_asset_by_url(secure_url):
+    return db.session.execute(
+        db.select(StoredAsset).filter_by(secure_url=secure_url)
+    ).scalar_one_or_none()
+
+def _register_asset(sha256, result):
+    """บันทึกไฟล์ที่เพิ่งอัปโหลดลง StoredAsset (ref_count เริ่มที่ 0 แล้วเพิ่มเมื่อแถวข้อมูลใช้ URL นี้)
+
+    ถ้ามีงานอื่นอัปโหลดเนื้อหาเดียวกันเสร็จไปก่อน คืนผลของไฟล์เดิม ส่วนไฟล์ที่เพิ่งอัปโหลดซ้ำ
+    บันทึกไว้โดยไม่มี sha256 และไม่มีใครอ้างถึง เพื่อให้ assets-gc ลบทิ้งภายหลัง
+    ผลที่มี secure_url อยู่ในตารางแล้ว (ฟอร์มอัปโหลดตรงที่ถูกส่งซ้ำ) ใช้แถวเดิม ref_count เพิ่มตามแถวข้อมูล
+    ที่อ้างถึง URL นี้ใน _update_asset_refs
+    """
+    registered = _find_asset_by_url(result['secure_url'])
+    if registered is not None:
+        return registered.to_result()
+    existing = _find_asset(sha256)
+    try:
+        with db.session.begin_nested():
+            db.session.add(StoredAsset(
+                backend=uploader.name,
+                sha256=sha256 if existing is None else None,
+                secure_url=result['secure_url'],
+                public_id=result.get('public_id'),
+                resource_type=result.get('resource_type'),
+                size=result.get('bytes'),
+                width=result.get('width'),
+                height=result.get('height'),
+            ))
+    except IntegrityError:
+        # request อื่นบันทึก URL เดียวกันไปพร้อมกัน
+        registered = _find_asset_by_url(result['secure_url'])
+        if registered is None:
+            raise
+        return registered.to_result()
+    return result if existing is None else existing.to_result()
+
+def _apply_upload_result(target, result):
+    if isinstance(target, Guideline):
+        target.file_path = result['secure_url']
+        target.file_size = result['bytes']
+        target.external_link = None
+        target.link_type = 'Cloudinary'
+    else:
+        target.image_path = result['secure_url']
+        target.external_link = None
+        target.link_type = None
+        apply_image_variants(target, result.get('width'), result.get('height'))
+    target.upload_status = None
+
+def _local_image_path(url):
+    """path ในเครื่องและ URL ที่เสิร์ฟของรูปที่อยู่ใน storage/ (คืน None ถ้าไม่ใช่ไฟล์ในเครื่อง)"""
+    if url.startswith('/storage/'):
+        relative = url[len('/storage/'):]
+    elif url.startswith('storage/'):
+        relative = url[len('storage/'):]
+    else:
+        return None
+    located = storage_server.locate(relative)
+    return (located[0], f'/storage/{relative}') if located else None
+
+def apply_image_variants(target, width=None, height=None):
+    """บันทึกขนาดและรูปย่อของ target.image_path ลงในแถว (Cloudinary ใช้ transformation URL, ไฟล์ในเครื่องย่อด้วย Pillow)"""
+    url = target.image_path
+    widths = app.config['IMAGE_DERIVATIVE_WIDTHS']
+    variants = []
+    if url and is_cloudinary_url(url):
+        variants = cloudinary_variants(url, width, height, widths)
+    elif url:
+        local = _local_image_path(url)
+        generated = local_variants(local[0], local[1], widths) if local else None
+        if generated is not None:
+            width, height, variants = generated
+    target.image_width = width
+    target.image_height = height
+    target.image_variants = json.dumps(variants) if variants else None
+
+def _reset_image_variants(target, value, oldvalue, initiator):
+    # รูปเปลี่ยนหรือถูกลบ (เช่นเปลี่ยนเป็นลิงก์) รูปย่อเดิมใช้ไม่ได้แล้ว
+    if value != oldvalue:
+        target.image_width = target.image_height = target.image_variants = None
+
+for _model in (Knowledge, Activity):
+    event.listen(_model.image_path, 'set', _reset_image_variants)
+
+@app.template_global()
+def media_url(path):
+    """URL ของไฟล์ใน image_path/file_path: URL เต็มและ /storage/... ใช้ได้ทันที, path รุ่นเก่า storage/... ส่งผ่าน serve_storage"""
+    if not path or path.startswith(('http://', 'https://', '/')):
+        return path
+    return url_for('serve_storage', filename=path.removeprefix('storage/'))
+
+@app.template_filter('image_variants')
+def image_variants_filter(value):
+    return json.loads(value) if value else []
+
+def process_upload_job(job_id):
+    """อัปโหลดไฟล์ของงานหนึ่งชิ้นพร้อม retry แบบ exponential backoff
+
+    เรียกจาก thread ของ upload_queue (หรือใน request เมื่อเป็นโหมด sync)
+    """
+    # จองงานด้วย UPDATE แบบมีเงื่อนไข ป้องกันหลาย worker/process ทำงานเดียวกันซ้ำ
+    claimed = db.session.execute(
+        db.update(UploadJob)
+        .where(UploadJob.id == job_id, UploadJob.status == 'queued')
+        .values(status='running', updated_at=datetime.now(timezone.utc))
+    ).rowcount
+    db.session.commit()
+    job = db.session.get(UploadJob, job_id)
+    if not claimed:
+        if job is not None and job.status == 'cancelled':
+            _remove_spool(job)
+        return
+
+    # ไฟล์เดียวกันอาจอัปโหลดเสร็จไปแล้วระหว่างที่งานนี้รอในคิว
+    asset = _find_asset(job.sha256)
+    result = asset.to_result() if asset is not None else None
+    error = None
+    while result is None:
+        job.attempts += 1
+        db.session.commit()
+        try:
+            result = upload_file(job.spool_path, job.folder, job.resource_type)
+            break
+        except PermanentUploadError as e:
+            error = str(e)
+            break
+        except Exception as e:
+            error = str(e) or type(e).__name__
+            if job.attempts >= app.config['UPLOAD_MAX_ATTEMPTS']:
+                break
+            time.sleep(backoff_delay(job.attempts, app.config['UPLOAD_RETRY_BASE'], app.config['UPLOAD_RETRY_MAX']))
+
+    target = db.session.get(UPLOAD_TARGETS[job.target_type], job.target_id)
+    if target is None:
+        status = 'cancelled'
+    else:
+        status = 'done' if result is not None else 'failed'
+    # ถ้าแอดมินยกเลิกระหว่างอัปโหลด สถานะจะไม่ใช่ running แล้ว และไม่ต้องแตะข้อมูลหลัก
+    finished = db.session.execute(
+        db.update(UploadJob)
+        .where(UploadJob.id == job_id, UploadJob.status == 'running')
+        .values(
+            status=status,
+            error=error if status == 'failed' else None,
+            result_url=result['secure_url'] if result else None,
+            updated_at=datetime.now(timezone.utc),
+        )
+    ).rowcount
+    if result is not None and asset is None:
+        if finished and status == 'done':
+            result = _register_asset(job.sha256, result)
+        else:
+            _register_asset(None, result)  # อัปโหลดแล้วแต่งานถูกยกเลิก ให้ assets-gc ลบทิ้ง
+    if finished and status == 'done':
+        _apply_upload_result(target, result)
+    elif finished and status == 'failed' and target.upload_status == 'pending':
+        target.upload_status = 'failed'
+    db.session.commit()
+    db.session.refresh(job)
+
+    if job.status != 'failed':
+        _remove_spool(job)  # เก็บไฟล์ของงานที่ล้มเหลวไว้ให้กดลองใหม่ได้
+    if finished and target is not None:
+        notify_content_changed(target.department_id)
+
+def run_pending_uploads(stale_after=timedelta(minutes=15)):
+    """ส่งงานที่ค้างอยู่ในสถานะ queued (และ running ที่ค้างนานผิดปกติเพราะ process ตาย) เข้าคิวอีกครั้ง"""
+    stale_before = (datetime.now(timezone.utc) - stale_after).replace(tzinfo=None)
+    db.session.execute(
+        db.update(UploadJob)
+        .where(UploadJob.status == 'running', UploadJob.updated_at < stale_before)
+        .values(status='queued')
+    )
+    db.session.commit()
+    job_ids = db.session.execute(
+        db.select(UploadJob.id).where(UploadJob.status == 'queued').order_by(UploadJob.id)
+    ).scalars().all()
+    for job_id in job_ids:
+        upload_queue.submit(process_upload_job, job_id)
+    return len(job_ids)
+
+# user id ใน session (มี session_version และ HMAC ของ credential อยู่แล้ว) -> (หมดอายุเมื่อ, SessionUser)
+# entry ที่ยังไม่หมดอายุเชื่อได้โดยไม่อ่านฐานข้อมูล การล็อกเอาต์ลบ user id ออกจาก session ที่เซ็นไว้จึงมีผลทุก instance
+# ทันที ส่วนการเพิกถอน (revoke_sessions) มีผลทันทีบน instance ที่สั่ง และภายใน SESSION_USER_CACHE_TTL บน instance อื่น
+_session_user_lock = threading.Lock()
+_session_user_cache = {}
+_session_user_stats = {'hits': 0, 'misses': 0}
+SESSION_USER_CACHE_MAX = 256
+
+def revoke_sessions(admin_id=None):
+    """เพิ่ม session_version (ของทุกแอดมินเมื่อ admin_id=None) ให้ session เดิมหลุด ผู้เรียก commit เอง"""
+    statement = db.update(AdminUser).values(session_version=AdminUser.session_version + 1)
+    if admin_id is not None:
+        statement = statement.where(AdminUser.id == admin_id)
+    db.session.execute(statement)
+    with _session_user_lock:
+        _session_user_cache.clear()
 
 @login_manager.user_loader
 def load_user(user_id):
-    return db.session.get(AdminUser, int(user_id))
+    ttl = app.config['SESSION_USER_CACHE_TTL']
+    with _session_user_lock:
+        entry = _session_user_cache.get(user_id)
+        if entry is not None and entry[0] > time.monotonic():
+            _session_user_stats['hits'] += 1
+            return entry[1]
+        _session_user_stats['misses'] += 1
+
+    admin_id = user_id.partition(':')[0]
+    admin = db.session.get(AdminUser, int(admin_id)) if admin_id.isdigit() else None
+    # get_id() มีทั้ง session_version และ HMAC ของ username/รหัสผ่าน: แถวเดียวตรวจได้ทั้งการเพิกถอนและการเปลี่ยนรหัสผ่าน
+    if admin is None or not hmac.compare_digest(admin.get_id(), user_id):
+        with _session_user_lock:
+            _session_user_cache.pop(user_id, None)
+        return None
+
+    user = SessionUser(admin)
+    if ttl > 0:
+        with _session_user_lock:
+            if len(_session_user_cache) >= SESSION_USER_CACHE_MAX:
+                _session_user_cache.pop(next(iter(_session_user_cache)))
+            _session_user_cache[user_id] = (time.monotonic() + ttl, user)
+    return user
+
+# ===== ตัวนับการใช้งาน (write-behind) =====
+def _upsert_hits(model, rows, keys, column, chunk=500):
+    """INSERT หลายแถวต่อหนึ่ง statement ถ้า key ซ้ำให้บวกเพิ่มจากค่าเดิม (PostgreSQL และ SQLite 3.24+)"""
+    insert = postgresql_insert if db.session.get_bind().dialect.name == 'postgresql' else sqlite_insert
+    # เรียงตาม key ทุก worker จึงล็อกแถวในลำดับเดียวกันและไม่ deadlock กันบน PostgreSQL
+    rows = sorted(rows, key=lambda row: tuple(row[key] for key in keys))
+    for start in range(0, len(rows), chunk):
+        statement = insert(model).values(rows[start:start + chunk])
+        db.session.execute(statement.on_conflict_do_update(
+            index_elements=keys, set_={column: getattr(model, column) + statement.excluded[column]}))
+
+def _flush_usage(batch):
+    """บันทึกตัวนับที่สะสมไว้ (เรียกจาก thread ของ usage_counters และตอน process ปิด)"""
+    downloads = {}
+    for (kind, target_id, day), hits in batch.items():
+        if kind == 'download':
+            downloads[target_id] = downloads.get(target_id, 0) + hits
+    with app.app_context():
+        try:
+            _upsert_hits(DailyUsage, [
+                {'day': day, 'kind': kind, 'target_id': target_id, 'hits': hits}
+                for (kind, target_id, day), hits in batch.items()
+            ], ['day', 'kind', 'target_id'], 'hits')
+            if downloads:
+                _upsert_hits(GuidelineUsage, [
+                    {'guideline_id': guideline_id, 'downloads': hits} for guideline_id, hits in downloads.items()
+                ], ['guideline_id'], 'downloads')
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+usage_counters = UsageCounters(
+    _flush_usage, interval=app.config['USAGE_FLUSH_INTERVAL'], max_events=app.config['USAGE_FLUSH_EVENTS'])
+
+def record_usage(kind, target_id):
+    if app.config['USAGE_COUNTERS'] and not request.environ.get(EXPORT_ENVIRON_KEY):
+        usage_counters.record(kind, target_id)
 
 # Routes
 @app.route('/')
+@read_only_view
 def home():
-    departments = db.session.query(Department).all()
-    return render_template('home.html', departments=departments)
+    def render():
+        departments = db.session.query(Department).order_by(Department.id).all()
+        return render_template('home.html', departments=departments)
+    return cached_page('home', render)
 
 @app.route('/department/<int:dept_id>')
+@read_only_view
 def department(dept_id):
-    dept = db.session.get(Department, dept_id)
-    if dept is None:
+    def render():
+        # render เฉพาะหน้าแรกของแท็บ Guidelines ที่เห็นตอนเปิดหน้า แท็บอื่นโหลดผ่าน department_tab เมื่อเปิดครั้งแรก
+        dept = db.session.get(Department, dept_id)
+        if dept is None:
+            abort(404)
+        page = department_tab_page(dept_id, 'guidelines', after=None)
+        return render_template('department.html', department=dept, guidelines=page['items'],
+                               guidelines_next=_next_tab_url(dept_id, 'guidelines', page['next_cursor']))
+    response = cached_page(department_scope(dept_id), render)
+    record_usage('view', dept_id)  # หลัง cached_page เพราะหน่วยงานที่ไม่มีอยู่จะ abort(404) ระหว่าง render
+    return response
+
+# แท็บของหน้าหน่วยงาน: (model, คอลัมน์ที่เรียง, ค่าแทน NULL, มี NULL ไหม, ทิศทาง) ตรงกับ order_by ของ relationship
+# upload_date/updated_at มีค่าเริ่มต้นเสมอจึงเรียงตาม index (department_id, คอลัมน์, id) ได้โดยไม่ต้อง sort
+# ส่วน activity_date เว้นว่างได้ (ต้อง coalesce และ sort กิจกรรมทั้งหน่วยงาน ซึ่งมีจำนวนน้อยกว่ามาก)
+DEPARTMENT_TABS = {
+    'guidelines': (Guideline, Guideline.upload_date, datetime(1970, 1, 1), False, 'desc'),
+    'knowledge': (Knowledge, Knowledge.updated_at, datetime(1970, 1, 1), False, 'desc'),
+    'activities': (Activity, Activity.activity_date, date(1970, 1, 1), True, 'desc'),
+    'contact': (Contact, Contact.id, 0, False, 'asc'),
+}
+
+def department_tab_page(dept_id, tab, after):
+    """รายการหนึ่งหน้าของแท็บ (keyset ต่อจาก cursor after) คืนค่าแบบเดียวกับ keyset_paginate"""
+    model, column, null_value, nullable, direction = DEPARTMENT_TABS[tab]
+    query = db.select(model).where(model.department_id == dept_id)
+    if model is not Contact:
+        query = query.where(model.upload_status.is_(None))  # ไฟล์/รูปยังอัปโหลดไม่เสร็จ
+    return keyset_paginate(query, model, {tab: (column, null_value, nullable)}, tab, default_dir=direction,
+                           per_page=app.config['DEPARTMENT_TAB_PAGE_SIZE'], args={'after': after} if after else {})
+
+def _next_tab_url(dept_id, tab, next_cursor):
+    """URL ของปุ่มโหลดเพิ่ม หรือ None ถ้าแสดงครบแล้ว"""
+    return url_for('department_tab', dept_id=dept_id, tab=tab, after=next_cursor) if next_cursor else None
+
+@app.route('/department/<int:dept_id>/tab/<tab>')
+@read_only_view
+def department_tab(dept_id, tab):
+    """หนึ่งหน้าของแท็บในหน้าหน่วยงานเป็น JSON {html: รายการ, next: URL ของหน้าถัดไป หรือ null}"""
+    if tab not in DEPARTMENT_TABS:
         abort(404)
-    return render_template('department.html', department=dept)
+    after = request.args.get('after') or None
+
+    def render():
+        if db.session.get(Department, dept_id) is None:
+            abort(404)
+        page = department_tab_page(dept_id, tab, after)
+        html = render_template('_department_tab.html', tab=tab, items=page['items'], empty=after is None)
+        return json.dumps({'html': html, 'next': _next_tab_url(dept_id, tab, page['next_cursor'])},
+                          ensure_ascii=False)
+    # ใช้ revision เดียวกับหน้าหน่วยงาน แก้ไขข้อมูลแล้วทุกแท็บและทุกหน้าของแท็บหมดอายุพร้อมกัน
+    response = cached_page(department_scope(dept_id), render, variant=f'{tab}:{after or ""}')
+    response.mimetype = 'application/json'
+    return response
 
 @app.route('/download/<int:guideline_id>')
+@read_only_view
 def download_guideline(guideline_id):
     guideline = db.session.get(Guideline, guideline_id)
     if guideline is None:
         abort(404)
+    record_usage('download', guideline.id)
     
     # ถ้ามี external link ให้ redirect ไปที่ลิงก์นั้น
     if guideline.external_link:
         return redirect(guideline.external_link)
     
-    # ถ้ามีไฟล์ (Cloudinary URL) ให้ redirect ไปที่ URL
-    if guideline.file_path and "cloudinary" in guideline.file_path:
+    # ถ้ามีไฟล์ (Cloudinary URL หรือไฟล์จาก stub uploader) ให้ redirect ไปที่ URL
+    if guideline.file_path and ("cloudinary" in guideline.file_path or guideline.file_path.startswith('/storage/')):
         return redirect(guideline.file_path)
     # Fallback สำหรับไฟล์เก่าที่อยู่ในเครื่อง
+    elif guideline.file_path and guideline.file_path.startswith('storage/') \
+            and storage_server.locate(guideline.file_path[len('storage/'):]):
+        return storage_server.serve(request, guideline.file_path[len('storage/'):], as_attachment=True)
     elif guideline.file_path and os.path.exists(guideline.file_path):
         return send_file(guideline.file_path, as_attachment=True)
     
     flash('ไฟล์ไม่พบ', 'error')
     return redirect(url_for('department', dept_id=guideline.department_id))
 
+@app.route('/search')
+def search():
+    query = request.args.get('q', '').strip()
+    page = max(request.args.get('page', 1, type=int), 1)
+    per_page = app.config['SEARCH_PAGE_SIZE']
+    total, results = 0, []
+    if query and search_index.available:
+        total, results = search_index.search(
+            db.session.connection(), query, limit=per_page, offset=(page - 1) * per_page
+        )
+        terms = split_terms(query)
+        for result in results:
+            result['title_html'] = highlight(result['title'], terms, width=200)
+            result['snippet'] = highlight(result['body'], terms)
+    return render_template(
+        'search.html', query=query, results=results, total=total, page=page,
+        pages=(total + per_page - 1) // per_page, search_available=search_index.available
+    )
+
 @app.route('/admin/login', methods=['GET', 'POST'])
 def admin_login():
     if request.method == 'POST':
@@ -167,25 +1551,35 @@ def admin_logout():
 @app.route('/admin/dashboard')
 @login_required
 def admin_dashboard():
-    stats = {
-        'departments': db.session.query(Department).count(),
-        'guidelines': db.session.query(Guideline).count(),
-        'knowledge': db.session.query(Knowledge).count(),
-        'activities': db.session.query(Activity).count()
-    }
+    stats = get_dashboard_stats()
     return render_template('admin/dashboard.html', stats=stats)
 
 @app.route('/admin/departments')
 @login_required
 def admin_departments():
-    departments = db.session.query(Department).all()
-    return render_template('admin/departments.html', departments=departments)
+    departments, counts = department_content_counts()
+    return render_template('admin/departments.html', departments=departments, counts=counts)
 
 @app.route('/admin/guidelines')
 @login_required
 def admin_guidelines():
-    guidelines = db.session.query(Guideline).join(Department).all()
-    return render_template('admin/guidelines.html', guidelines=guidelines)
+    query = (
+        db.select(Guideline)
+        .join(Guideline.department)
+        .options(
+            load_only(Guideline.title, Guideline.file_size, Guideline.upload_date,
+                      Guideline.external_link, Guideline.link_type, Guideline.upload_status),
+            with_expression(Guideline.preview, db.func.substr(Guideline.description, 1, PREVIEW_LENGTH + 1)),
+            contains_eager(Guideline.department).load_only(Department.code, Department.name),
+        )
+    )
+    page = keyset_paginate(query, Guideline, {
+        'upload_date': (Guideline.upload_date, datetime(1970, 1, 1), False),
+        'title': (Guideline.title, '', False),
+        'department': (Department.name, '', False),
+    }, default_sort='upload_date')
+    return render_template('admin/guidelines.html', guidelines=page['items'], page=page,
+                           total=content_total(Guideline, 'guidelines'))
 
 @app.route('/admin/guidelines/edit/<int:guideline_id>', methods=['GET', 'POST'])
 @login_required
@@ -199,30 +1593,23 @@ def admin_edit_guideline(guideline_id):
         title = request.form['title']
         description = request.form['description']
         upload_type = request.form['upload_type']
+        previous_department_id = guideline.department_id
         
         guideline.department_id = department_id
         guideline.title = title
         guideline.description = description
+        job = None
         
         if upload_type == 'file':
-            file = request.files['file']
-            if file and file.filename:
+            file = receive_upload('file')
+            if file:
                 try:
-                    # Upload to Cloudinary
+                    # ส่งไฟล์เข้าคิวอัปโหลด Cloudinary (ไฟล์เดิมยังแสดงอยู่จนกว่าไฟล์ใหม่จะอัปโหลดเสร็จ)
                     dept = db.session.get(Department, department_id)
                     folder_name = f"guidelines/{dept.code.lower()}"
-                    
-                    upload_result = cloudinary.uploader.upload(
-                        file,
-                        folder=folder_name,
-                        resource_type="auto"
-                    )
-                    
-                    guideline.file_path = upload_result.get("secure_url")
-                    guideline.file_size = upload_result.get("bytes")
-                    guideline.external_link = None
-                    guideline.link_type = 'Cloudinary'
+                    job = start_upload(guideline, file, folder_name, 'auto')
                 except Exception as e:
+                    db.session.rollback()
                     flash(f'เกิดข้อผิดพลาดในการอัปโหลดไฟล์: {str(e)}', 'error')
                     return redirect(url_for('admin_edit_guideline', guideline_id=guideline_id))
         elif upload_type == 'link':
@@ -230,13 +1617,19 @@ def admin_edit_guideline(guideline_id):
             link_type = request.form['link_type']
             
             if external_link:
+                cancel_uploads('guideline', guideline.id)
                 guideline.external_link = external_link
                 guideline.link_type = link_type
                 guideline.file_path = None
                 guideline.file_size = None
+                guideline.upload_status = None
         
         db.session.commit()
-        flash('แก้ไข guideline สำเร็จ', 'success')
+        notify_content_changed(previous_department_id, guideline.department_id)
+        if job is not None:
+            flash_upload_result(job, 'แก้ไข guideline สำเร็จ')
+        else:
+            flash('แก้ไข guideline สำเร็จ', 'success')
         return redirect(url_for('admin_guidelines'))
     
     departments = db.session.query(Department).all()
@@ -249,8 +1642,12 @@ def admin_delete_guideline(guideline_id):
     if guideline is None:
         abort(404)
     
+    department_id = guideline.department_id
+    cancel_uploads('guideline', guideline.id)
+    db.session.query(GuidelineUsage).filter_by(guideline_id=guideline.id).delete()
     db.session.delete(guideline)
     db.session.commit()
+    notify_content_changed(department_id)
     flash('ลบ guideline สำเร็จ', 'success')
     return redirect(url_for('admin_guidelines'))
 
@@ -264,37 +1661,31 @@ def upload_guideline():
         upload_type = request.form['upload_type']  # 'file' หรือ 'link'
         
         if upload_type == 'file':
-            file = request.files['file']
-            if file and file.filename:
+            file = receive_upload('file')
+            if file:
                 try:
-                    # Upload to Cloudinary
+                    # บันทึก guideline สถานะ pending แล้วส่งไฟล์เข้าคิวอัปโหลด Cloudinary
                     dept = db.session.get(Department, department_id)
                     folder_name = f"guidelines/{dept.code.lower()}"
                     
-                    upload_result = cloudinary.uploader.upload(
-                        file,
-                        folder=folder_name,
-                        resource_type="auto" # Allows uploading pdfs, docs, etc.
-                    )
-                    
-                    file_url = upload_result.get("secure_url")
-                    file_size = upload_result.get("bytes")
-                    
                     guideline = Guideline(
                         department_id=department_id,
                         title=title,
-                        file_path=file_url,
-                        file_size=file_size,
+                        file_path=None,
+                        file_size=None,
                         description=description,
                         external_link=None,
-                        link_type='Cloudinary'
+                        link_type='Cloudinary',
+                        upload_status='pending'
                     )
                     db.session.add(guideline)
-                    db.session.commit()
+                    job = start_upload(guideline, file, folder_name, 'auto')  # resource_type auto: pdf, doc ฯลฯ
+                    notify_content_changed(guideline.department_id)
                     
-                    flash('อัปโหลดไฟล์ไปที่ Cloudinary สำเร็จ', 'success')
+                    flash_upload_result(job, 'อัปโหลดไฟล์ไปที่ Cloudinary สำเร็จ')
                     return redirect(url_for('admin_guidelines'))
                 except Exception as e:
+                    db.session.rollback()
                     flash(f'เกิดข้อผิดพลาดในการอัปโหลดไฟล์: {str(e)}', 'error')
                     return redirect(request.url)
             else:
@@ -315,6 +1706,7 @@ def upload_guideline():
                 )
                 db.session.add(guideline)
                 db.session.commit()
+                notify_content_changed(guideline.department_id)
                 
                 flash('เพิ่มลิงก์ภายนอกสำเร็จ', 'success')
                 return redirect(url_for('admin_guidelines'))
@@ -327,31 +1719,567 @@ def upload_guideline():
 @app.route('/admin/knowledge')
 @login_required
 def admin_knowledge():
-    knowledge = db.session.query(Knowledge).join(Department).all()
-    return render_template('admin/knowledge.html', knowledge=knowledge)
+    query = (
+        db.select(Knowledge)
+        .join(Knowledge.department)
+        .options(
+            load_only(Knowledge.title, Knowledge.image_path, Knowledge.image_width, Knowledge.image_height,
+                      Knowledge.image_variants, Knowledge.external_link, Knowledge.link_type,
+                      Knowledge.created_at, Knowledge.updated_at, Knowledge.upload_status),
+            with_expression(Knowledge.preview, db.func.substr(Knowledge.content, 1, PREVIEW_LENGTH + 1)),
+            contains_eager(Knowledge.department).load_only(Department.name),
+        )
+    )
+    page = keyset_paginate(query, Knowledge, {
+        'updated_at': (Knowledge.updated_at, datetime(1970, 1, 1), False),
+        'created_at': (Knowledge.created_at, datetime(1970, 1, 1), False),
+        'title': (Knowledge.title, '', False),
+        'department': (Department.name, '', False),
+    }, default_sort='updated_at')
+    return render_template('admin/knowledge.html', knowledge=page['items'], page=page,
+                           total=content_total(Knowledge, 'knowledge'))
+
+USAGE_PERIODS = (7, 30, 90, 365)
+
+@app.route('/admin/usage')
+@login_required
+def admin_usage():
+    """guideline ที่ถูกดาวน์โหลดมากที่สุด และยอดดาวน์โหลด/เปิดหน้าหน่วยงานรายวัน"""
+    days = request.args.get('days', 30, type=int)
+    if days not in USAGE_PERIODS:
+        days = 30
+    today = datetime.now(timezone.utc).date()
+    since = today - timedelta(days=days - 1)
+    downloads = db.func.sum(DailyUsage.hits).label('hits')
+    top_guidelines = db.session.execute(
+        db.select(Guideline.id, Guideline.title, Department.name.label('department_name'), downloads)
+        .join(DailyUsage, db.and_(DailyUsage.kind == 'download', DailyUsage.target_id == Guideline.id))
+        .join(Guideline.department)
+        .where(DailyUsage.day >= since)
+        .group_by(Guideline.id, Guideline.title, Department.name)
+        .order_by(downloads.desc(), Guideline.id)
+        .limit(20)
+    ).all()
+    all_time = db.session.execute(
+        db.select(Guideline.id, Guideline.title, Department.name.label('department_name'),
+                  GuidelineUsage.downloads.label('hits'))
+        .join(GuidelineUsage, GuidelineUsage.guideline_id == Guideline.id)
+        .join(Guideline.department)
+        .order_by(GuidelineUsage.downloads.desc(), Guideline.id)
+        .limit(20)
+    ).all()
+    views = db.func.sum(DailyUsage.hits).label('hits')
+    department_views = db.session.execute(
+        db.select(Department.id, Department.name, views)
+        .join(DailyUsage, db.and_(DailyUsage.kind == 'view', DailyUsage.target_id == Department.id))
+        .where(DailyUsage.day >= since)
+        .group_by(Department.id, Department.name)
+        .order_by(views.desc(), Department.id)
+    ).all()
+    per_day = {}
+    for day, kind, hits in db.session.execute(
+        db.select(DailyUsage.day, DailyUsage.kind, db.func.sum(DailyUsage.hits))
+        .where(DailyUsage.day >= since)
+        .group_by(DailyUsage.day, DailyUsage.kind)
+    ):
+        per_day.setdefault(day, {})[kind] = hits
+    trend = [
+        {'day': day, 'download': per_day.get(day, {}).get('download', 0), 'view': per_day.get(day, {}).get('view', 0)}
+        for day in (since + timedelta(days=n) for n in range(days))
+    ]
+    trend_max = max([1] + [max(row['download'], row['view']) for row in trend])
+    return render_template(
+        'admin/usage.html', days=days, periods=USAGE_PERIODS, top_guidelines=top_guidelines, all_time=all_time,
+        department_views=department_views, trend=trend, trend_max=trend_max,
+        flush_interval=app.config['USAGE_FLUSH_INTERVAL'], enabled=app.config['USAGE_COUNTERS'],
+    )
+
+@app.route('/admin/uploads')
+@login_required
+def admin_uploads():
+    jobs = db.session.execute(
+        db.select(UploadJob).order_by(UploadJob.id.desc()).limit(100)
+    ).scalars().all()
+    return render_template('admin/uploads.html', jobs=jobs, upload_mode=upload_queue.mode)
+
+@app.route('/admin/uploads/status')
+@login_required
+def admin_upload_status():
+    """สถานะงานอัปโหลดแบบ JSON สำหรับให้หน้าแอดมิน poll (?ids=1,2,3)"""
+    job_ids = [int(job_id) for job_id in request.args.get('ids', '').split(',') if job_id.isdigit()][:100]
+    jobs = db.session.execute(
+        db.select(UploadJob).where(UploadJob.id.in_(job_ids))
+    ).scalars().all() if job_ids else []
+    return jsonify({'jobs': [job.to_dict() for job in jobs]})
+
+@app.route('/admin/db/pool')
+@login_required
+def admin_db_pool():
+    """สถิติ connection pool ของ process นี้ (profile, จำนวน connection ที่เปิดใหม่, ที่ใช้อยู่/ว่าง)"""
+    return jsonify(pool_monitor.stats())
+
+@app.route('/metrics')
+def metrics():
+    """ค่า metrics รวมทุก worker ในรูปแบบ Prometheus text"""
+    if not app.config['METRICS_ENABLED']:
+        abort(404)
+    token = app.config['METRICS_TOKEN']
+    authorized = bool(token) and hmac.compare_digest(request.headers.get('Authorization', '').encode(), f'Bearer {token}'.encode())
+    if not (authorized or current_user.is_authenticated):
+        abort(401)
+    return app.response_class(metrics_registry.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/admin/db/replicas')
+@login_required
+def admin_db_replicas():
+    """lag ของ read replica แต่ละตัว (วัดใหม่ทุกครั้งที่เรียก) และ replica ตัวไหนถูกข้ามอยู่"""
+    return jsonify({'max_lag': read_router.max_lag, 'replicas': read_router.refresh() if read_router.replicated else []})
+
+@app.route('/admin/uploads/<int:job_id>/retry', methods=['POST'])
+@login_required
+def admin_retry_upload(job_id):
+    job = db.session.get(UploadJob, job_id)
+    if job is None:
+        abort(404)
+    
+    if job.status != 'failed' or not os.path.exists(job.spool_path):
+        flash('ไม่สามารถลองอัปโหลดงานนี้ใหม่ได้', 'error')
+        return redirect(url_for('admin_uploads'))
+    
+    target = db.session.get(UPLOAD_TARGETS[job.target_type], job.target_id)
+    if target is not None and target.upload_status == 'failed':
+        target.upload_status = 'pending'
+    job.status = 'queued'
+    job.attempts = 0
+    job.error = None
+    db.session.commit()
+    upload_queue.submit(process_upload_job, job.id)
+    flash('ส่งงานอัปโหลดเข้าคิวอีกครั้งแล้ว', 'success')
+    return redirect(url_for('admin_uploads'))
+
+# ===== อัปโหลดตรงจาก browser ไป Cloudinary =====
+# browser ขอพารามิเตอร์ที่เซ็นแล้ว -> POST ไฟล์ไป Cloudinary เอง -> ส่งผลลัพธ์ (public_id, version, signature)
+# มากับฟอร์มในฟิลด์ <field>_direct แล้ว start_upload ตรวจลายเซ็นก่อนบันทึก
+DIRECT_UPLOAD_KINDS = {
+    'guideline': ('guidelines', 'auto'),
+    'knowledge': ('knowledge', 'image'),
+    'activity': ('activities', 'image'),
+}
+
+@app.route('/admin/uploads/direct/sign', methods=['POST'])
+@login_required
+def admin_direct_upload_sign():
+    if not app.config['UPLOAD_DIRECT']:
+        abort(404)
+    data = request.get_json(silent=True) or {}
+    kind = DIRECT_UPLOAD_KINDS.get(data.get('kind'))
+    try:
+        dept = db.session.get(Department, int(data.get('department_id')))
+    except (TypeError, ValueError):
+        dept = None
+    if kind is None or dept is None:
+        return jsonify({'error': 'ต้องระบุประเภทข้อมูลและหน่วยงาน'}), 400
+    prefix, resource_type = kind
+    return jsonify(sign_direct_upload(f"{prefix}/{dept.code.lower()}", resource_type))
+
+# ===== อัปโหลดแบบแบ่ง chunk (ต่อได้เมื่อการเชื่อมต่อหลุด) =====
+# 1. POST /admin/uploads/chunked           {filename, size} -> upload_id, chunk_size
+# 2. PUT  /admin/uploads/chunked/<id>/<n>  body = chunk ที่ n, header X-Chunk-SHA256
+# 3. GET  /admin/uploads/chunked/<id>      ถามว่าได้รับถึงไหนแล้ว (ใช้ต่อหลังการเชื่อมต่อหลุด)
+# 4. ส่งฟอร์มเดิมพร้อมฟิลด์ <field>_upload_id แทนไฟล์ (ดู receive_upload)
+def _expire_chunked_uploads():
+    expired_before = (datetime.now(timezone.utc) - timedelta(seconds=app.config['UPLOAD_SESSION_TTL'])).replace(tzinfo=None)
+    expired = db.session.execute(
+        db.select(ChunkedUpload).where(ChunkedUpload.updated_at < expired_before)
+    ).scalars().all()
+    for chunked in expired:
+        try:
+            os.unlink(chunked.spool_path)
+        except OSError:
+            pass
+        db.session.delete(chunked)
+
+@app.route('/admin/uploads/chunked', methods=['POST'])
+@login_required
+def admin_chunked_upload_create():
+    data = request.get_json(silent=True) or {}
+    filename = str(data.get('filename') or '')[:255]
+    try:
+        size = int(data.get('size'))
+    except (TypeError, ValueError):
+        size = 0
+    if not filename or size <= 0:
+        return jsonify({'error': 'ต้องระบุชื่อไฟล์และขนาดไฟล์'}), 400
+    if size > app.config['UPLOAD_MAX_FILE_SIZE']:
+        return jsonify({'error': 'ไฟล์มีขนาดใหญ่เกินกำหนด', 'max_size': app.config['UPLOAD_MAX_FILE_SIZE']}), 413
+    
+    _expire_chunked_uploads()
+    spool_path = spool_path_for(app.config['UPLOAD_SPOOL_DIR'], filename)
+    open(spool_path, 'wb').close()
+    chunked = ChunkedUpload(
+        id=os.urandom(16).hex(),
+        filename=filename,
+        size=size,
+        chunk_size=app.config['UPLOAD_CHUNK_SIZE'],
+        spool_path=spool_path,
+    )
+    db.session.add(chunked)
+    db.session.commit()
+    return jsonify(chunked.to_dict()), 201
+
+@app.route('/admin/uploads/chunked/<upload_id>', methods=['GET'])
+@login_required
+def admin_chunked_upload_status(upload_id):
+    chunked = db.session.get(ChunkedUpload, upload_id)
+    if chunked is None:
+        abort(404)
+    return jsonify(chunked.to_dict())
+
+@app.route('/admin/uploads/chunked/<upload_id>', methods=['DELETE'])
+@login_required
+def admin_chunked_upload_cancel(upload_id):
+    chunked = db.session.get(ChunkedUpload, upload_id)
+    if chunked is None:
+        abort(404)
+    try:
+        os.unlink(chunked.spool_path)
+    except OSError:
+        pass
+    db.session.delete(chunked)
+    db.session.commit()
+    return '', 204
+
+@app.route('/admin/uploads/chunked/<upload_id>/<int:index>', methods=['PUT'])
+@login_required
+def admin_chunked_upload_chunk(upload_id, index):
+    """รับ chunk ทีละชิ้นตามลำดับ อ่าน body เป็น stream จึงใช้หน่วยความจำไม่เกิน buffer ของ append_chunk"""
+    chunked = db.session.get(ChunkedUpload, upload_id)
+    if chunked is None:
+        abort(404)
+    checksum = request.headers.get('X-Chunk-SHA256', '')
+    if len(checksum) != 64:
+        return jsonify({'error': 'ต้องส่ง header X-Chunk-SHA256', **chunked.to_dict()}), 400
+    
+    offset = index * chunked.chunk_size
+    if offset < chunked.received:
+        # chunk ที่ได้รับไปแล้ว (client ส่งซ้ำเพราะไม่ได้รับคำตอบ) ตอบสำเร็จได้เลย
+        return jsonify(chunked.to_dict())
+    if offset > chunked.received or offset >= chunked.size:
+        return jsonify({'error': 'ลำดับ chunk ไม่ถูกต้อง', **chunked.to_dict()}), 409
+    
+    length = min(chunked.chunk_size, chunked.size - offset)
+    try:
+        append_chunk(chunked.spool_path, offset, request.stream, length, checksum)
+    except ChunkError as e:
+        return jsonify({'error': str(e), **chunked.to_dict()}), 422
+    except FileNotFoundError:
+        abort(404)
+    
+    # บันทึกความคืบหน้าแบบมีเงื่อนไข ถ้ามี request อื่นเขียน chunk เดียวกันไปแล้วก็ไม่นับซ้ำ
+    values = {'received': offset + length, 'updated_at': datetime.now(timezone.utc)}
+    if offset + length >= chunked.size:
+        values['sha256'] = file_sha256(chunked.spool_path)
+    db.session.execute(
+        db.update(ChunkedUpload)
+        .where(ChunkedUpload.id == upload_id, ChunkedUpload.received == offset)
+        .values(**values)
+    )
+    db.session.commit()
+    db.session.refresh(chunked)
+    return jsonify(chunked.to_dict())
+
+# ===== นำเข้าข้อมูลจำนวนมาก =====
+# แตกไฟล์จาก ZIP ลง spool ทีละไฟล์ อัปโหลดพร้อมกันไม่เกิน IMPORT_WORKERS ไฟล์
+# แล้วบันทึกแถวข้อมูลเป็นชุดละ IMPORT_BATCH_SIZE แถวต่อ transaction
+# แถวที่เคยนำเข้าแล้ว (ImportedItem) จะถูกข้าม จึงรันไฟล์เดิมซ้ำได้ เช่นหลังแก้แถวที่ผิดพลาด
+import_queue = UploadQueue(app, mode=app.config['UPLOAD_MODE'], max_workers=1)
+
+def _upload_with_retry(path, folder, resource_type):
+    """อัปโหลดไฟล์หนึ่งไฟล์พร้อม retry (ทำงานใน thread ของการนำเข้า ไม่แตะฐานข้อมูล)"""
+    attempt = 0
+    while True:
+        attempt += 1
+        try:
+            return upload_file(path, folder, resource_type)
+        except PermanentUploadError:
+            raise
+        except Exception:
+            if attempt >= app.config['UPLOAD_MAX_ATTEMPTS']:
+                raise
+            time.sleep(backoff_delay(attempt, app.config['UPLOAD_RETRY_BASE'], app.config['UPLOAD_RETRY_MAX']))
+
+def _imported_keys(keys, chunk=500):
+    """key ที่เคยนำเข้าแล้วและข้อมูลที่สร้างไว้ยังอยู่ (ถ้าแอดมินลบไปแล้วจะนำเข้าใหม่)"""
+    keys = list(keys)
+    items = []
+    for start in range(0, len(keys), chunk):
+        items.extend(db.session.execute(
+            db.select(ImportedItem).where(ImportedItem.key.in_(keys[start:start + chunk]))
+        ).scalars())
+    alive = set()
+    for target_type, model in UPLOAD_TARGETS.items():
+        ids = [item.target_id for item in items if item.target_type == target_type]
+        for start in range(0, len(ids), chunk):
+            alive.update((target_type, target_id) for target_id in db.session.execute(
+                db.select(model.id).where(model.id.in_(ids[start:start + chunk]))
+            ).scalars())
+    return {item.key for item in items if (item.target_type, item.target_id) in alive}
+
+def _build_import_target(row, department_id, result):
+    if row.kind == 'guideline':
+        target = Guideline(department_id=department_id, title=row.title, description=row.description)
+        if row.date:
+            target.upload_date = row.date
+    elif row.kind == 'knowledge':
+        target = Knowledge(department_id=department_id, title=row.title, content=row.description)
+        if row.date:
+            target.created_at = target.updated_at = row.date
+    else:
+        target = Activity(department_id=department_id, title=row.title, description=row.description,
+                          activity_date=row.date.date())
+    if result is not None:
+        _apply_upload_result(target, result)
+    elif row.link:
+        target.external_link = row.link
+        target.link_type = row.link_type
+    return target
+
+def _import_failed(record, row, message):
+    record.failed += 1
+    record.add_error(row, message)
+    db.session.commit()
+
+def _commit_import_batch(record, batch, departments):
+    """บันทึกแถวที่พร้อมแล้ว [(row, ผลอัปโหลดหรือ None)] ใน transaction เดียว"""
+    department_ids = {departments[row.department.lower()][0] for row, _ in batch}
+    try:
+        targets = [(row, _build_import_target(row, departments[row.department.lower()][0], result))
+                   for row, result in batch]
+        db.session.add_all(target for _, target in targets)
+        db.session.flush()
+        for row, target in targets:
+            # merge: key เดิมที่ข้อมูลถูกลบไปแล้วจะชี้ไปที่ข้อมูลใหม่แทน
+            db.session.merge(ImportedItem(key=row.key, target_type=row.kind, target_id=target.id, import_id=record.id))
+        record.imported += len(targets)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        record.failed += len(batch)
+        for row, _ in batch:
+            record.add_error(row, f'บันทึกข้อมูลไม่สำเร็จ: {e}')
+        db.session.commit()
+    notify_content_changed(*department_ids)
+    batch.clear()
+
+def _import_rows(record, source, rows, workers, progress):
+    departments = {code.lower(): (dept_id, code) for dept_id, code in db.session.execute(
+        db.select(Department.id, Department.code))}
+    max_size = app.config['UPLOAD_MAX_FILE_SIZE']
+
+    # ตรวจทุกแถวก่อนเริ่ม: ข้อมูลไม่ครบ หน่วยงานไม่มีอยู่ หรือเคยนำเข้าแล้ว
+    record.total = len(rows)
+    done_keys = _imported_keys(row.key for row in rows if row.error is None)
+    todo = []
+    seen = set()
+    for row in rows:
+        if row.error is None and row.department.lower() not in departments:
+            row.error = f'ไม่พบหน่วยงานรหัส {row.department}'
+        if row.error is None and row.file and record.dry_run:
+            try:
+                source.file_size(row.file, max_size)
+            except ValueError as e:
+                row.error = str(e)
+        if row.error is not None:
+            record.failed += 1
+            record.add_error(row, row.error)
+        elif row.key in done_keys or row.key in seen:
+            record.skipped += 1
+        else:
+            seen.add(row.key)
+            todo.append(row)
+    if record.dry_run:
+        record.imported = len(todo)  # จำนวนแถวที่จะนำเข้า
+    db.session.commit()
+    if record.dry_run:
+        return
+
+    batch_size = app.config['IMPORT_BATCH_SIZE']
+    pending = deque(todo)
+    in_flight = {}  # sha256 -> {'future', 'path', 'rows'} ไฟล์เนื้อหาเดียวกันในชุดนี้อัปโหลดครั้งเดียว
+    batch = []
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='import') as executor:
+        while pending or in_flight or batch:
+            # แตกไฟล์ล่วงหน้าไม่เกินสองเท่าของจำนวน worker เพื่อไม่ให้ spool ใช้ดิสก์มากเกินไป
+            while pending and len(in_flight) < workers * 2 and len(batch) < batch_size:
+                row = pending.popleft()
+                if not row.file:
+                    batch.append((row, None))
+                    continue
+                try:
+                    path, sha256 = source.extract(row.file, app.config['UPLOAD_SPOOL_DIR'], max_size)
+                except Exception as e:
+                    _import_failed(record, row, str(e))
+                    continue
+                asset = _find_asset(sha256)
+                group = in_flight.get(sha256)
+                if asset is not None or group is not None:
+                    os.unlink(path)
+                    if asset is not None:
+                        batch.append((row, asset.to_result()))
+                    else:
+                        group['rows'].append(row)
+                    continue
+                dept_code = departments[row.department.lower()][1]
+                prefix, resource_type = DIRECT_UPLOAD_KINDS[row.kind]
+                future = executor.submit(_upload_with_retry, path, f'{prefix}/{dept_code.lower()}', resource_type)
+                in_flight[sha256] = {'future': future, 'path': path, 'rows': [row]}
+
+            if in_flight and len(batch) < batch_size:
+                finished, _ = wait([group['future'] for group in in_flight.values()], return_when=FIRST_COMPLETED)
+                for sha256, group in list(in_flight.items()):
+                    if group['future'] not in finished:
+                        continue
+                    del in_flight[sha256]
+                    try:
+                        os.unlink(group['path'])
+                    except OSError:
+                        pass
+                    try:
+                        result = group['future'].result()
+                    except Exception as e:
+                        for row in group['rows']:
+                            _import_failed(record, row, f'อัปโหลดไฟล์ไม่สำเร็จ: {e}')
+                        continue
+                    result = _register_asset(sha256, result)
+                    db.session.commit()
+                    batch.extend((row, result) for row in group['rows'])
+
+            if batch and (len(batch) >= batch_size or not (pending or in_flight)):
+                _commit_import_batch(record, batch, departments)
+                if progress:
+                    progress(record)
+
+def run_bulk_import(import_id, uploaded=False, workers=None, progress=None):
+    """นำเข้าข้อมูลตาม BulkImport หนึ่งรายการ เรียกจาก import_queue (หน้าแอดมิน) หรือ flask import-content
+
+    uploaded=True คือไฟล์ที่อัปโหลดผ่านหน้าเว็บ: ลบทิ้งเมื่อเสร็จ และ manifest ที่ไม่ได้อยู่ใน ZIP นำเข้าได้เฉพาะลิงก์
+    progress(record) ถูกเรียกหลังบันทึกแต่ละชุด
+    """
+    claimed = db.session.execute(
+        db.update(BulkImport)
+        .where(BulkImport.id == import_id, BulkImport.status == 'queued')
+        .values(status='running', updated_at=datetime.now(timezone.utc))
+    ).rowcount
+    db.session.commit()
+    record = db.session.get(BulkImport, import_id)
+    if not claimed:
+        return record
+
+    try:
+        source = open_import_source(record.source_path, allow_files=not uploaded, filename=record.filename)
+        try:
+            _import_rows(record, source, source.read_rows(), workers or app.config['IMPORT_WORKERS'], progress)
+        finally:
+            source.close()
+        record.status = 'done'
+    except Exception as e:
+        db.session.rollback()
+        record.status = 'failed'
+        record.add_error(None, str(e) if isinstance(e, ManifestError) else f'{type(e).__name__}: {e}')
+    db.session.commit()
+    if uploaded:
+        try:
+            os.unlink(record.source_path)
+        except OSError:
+            pass
+    return record
+
+@app.route('/admin/import', methods=['GET', 'POST'])
+@login_required
+def admin_bulk_import():
+    if request.method == 'POST':
+        upload = receive_upload('archive')
+        if upload is None or 'spool_path' not in upload:
+            flash('กรุณาเลือกไฟล์ ZIP หรือ manifest (.csv/.json)', 'error')
+            return redirect(url_for('admin_bulk_import'))
+        record = BulkImport(
+            filename=upload['filename'][:255] or 'import',
+            source_path=upload['spool_path'],
+            dry_run=bool(request.form.get('dry_run')),
+        )
+        db.session.add(record)
+        db.session.commit()
+        import_queue.submit(run_bulk_import, record.id, True)
+        return redirect(url_for('admin_bulk_import_detail', import_id=record.id))
+    
+    imports = db.session.execute(
+        db.select(BulkImport).order_by(BulkImport.id.desc()).limit(20)
+    ).scalars().all()
+    return render_template('admin/bulk_import.html', imports=imports)
+
+@app.route('/admin/import/<int:import_id>')
+@login_required
+def admin_bulk_import_detail(import_id):
+    record = db.session.get(BulkImport, import_id)
+    if record is None:
+        abort(404)
+    return render_template('admin/bulk_import_detail.html', record=record)
+
+@app.route('/admin/import/<int:import_id>/status')
+@login_required
+def admin_bulk_import_status(import_id):
+    record = db.session.get(BulkImport, import_id)
+    if record is None:
+        abort(404)
+    return jsonify(record.to_dict())
 
 @app.route('/storage/<path:filename>')
 def serve_storage(filename):
     """Serve files from storage folder"""
-    # ใช้ path โดยตรงจาก storage folder
-    storage_path = os.path.join('storage', filename)
-    if os.path.exists(storage_path):
-        return send_file(storage_path)
-    else:
-        abort(404)
+    return storage_server.serve(request, filename)
 
 @app.route('/admin/activities')
 @login_required
 def admin_activities():
-    activities = db.session.query(Activity).join(Department).all()
-    return render_template('admin/activities.html', activities=activities)
+    query = (
+        db.select(Activity)
+        .join(Activity.department)
+        .options(
+            load_only(Activity.title, Activity.image_path, Activity.image_width, Activity.image_height,
+                      Activity.image_variants, Activity.external_link, Activity.link_type,
+                      Activity.activity_date, Activity.created_at, Activity.upload_status),
+            with_expression(Activity.preview, db.func.substr(Activity.description, 1, PREVIEW_LENGTH + 1)),
+            contains_eager(Activity.department).load_only(Department.name),
+        )
+    )
+    page = keyset_paginate(query, Activity, {
+        'activity_date': (Activity.activity_date, date(1970, 1, 1)),  # วันที่กิจกรรมเว้นว่างได้
+        'created_at': (Activity.created_at, datetime(1970, 1, 1), False),
+        'title': (Activity.title, '', False),
+        'department': (Department.name, '', False),
+    }, default_sort='activity_date')
+    return render_template('admin/activities.html', activities=page['items'], page=page,
+                           total=content_total(Activity, 'activities'))
 
 @app.route('/admin/contacts')
 @login_required
 def admin_contacts():
-    contacts = db.session.query(Contact).join(Department).all()
-    departments = db.session.query(Department).all()
-    return render_template('admin/contacts.html', contacts=contacts, departments=departments)
+    query = (
+        db.select(Contact)
+        .join(Contact.department)
+        .options(
+            load_only(Contact.line_id, Contact.email, Contact.phone),
+            with_expression(Contact.preview, db.func.substr(Contact.other_contact, 1, 51)),
+            contains_eager(Contact.department).load_only(Department.name),
+        )
+    )
+    page = keyset_paginate(query, Contact, {
+        'id': (Contact.id, 0, False),
+        'department': (Department.name, '', False),
+        'email': (Contact.email, ''),
+    }, default_sort='department', default_dir='asc')
+    total = db.session.scalar(db.select(db.func.count(Contact.id)))
+    return render_template('admin/contacts.html', contacts=page['items'], page=page, total=total)
 
 @app.route('/admin/contacts/add', methods=['GET', 'POST'])
 @login_required
@@ -378,6 +2306,7 @@ def admin_add_contact():
         
         db.session.add(contact)
         db.session.commit()
+        notify_content_changed(contact.department_id)
         flash('เพิ่มข้อมูลการติดต่อสำเร็จ', 'success')
         return redirect(url_for('admin_contacts'))
     
@@ -403,6 +2332,7 @@ def admin_edit_contact(contact_id):
             flash('กรุณาใส่ข้อมูลการติดต่ออย่างน้อย 1 อย่าง', 'error')
             return redirect(url_for('admin_edit_contact', contact_id=contact_id))
         
+        previous_department_id = contact.department_id
         contact.department_id = department_id
         contact.line_id = line_id if line_id else None
         contact.email = email if email else None
@@ -410,6 +2340,7 @@ def admin_edit_contact(contact_id):
         contact.other_contact = other_contact if other_contact else None
         
         db.session.commit()
+        notify_content_changed(previous_department_id, contact.department_id)
         flash('แก้ไขข้อมูลการติดต่อสำเร็จ', 'success')
         return redirect(url_for('admin_contacts'))
     
@@ -423,8 +2354,10 @@ def admin_delete_contact(contact_id):
     if contact is None:
         abort(404)
     
+    department_id = contact.department_id
     db.session.delete(contact)
     db.session.commit()
+    notify_content_changed(department_id)
     flash('ลบข้อมูลการติดต่อสำเร็จ', 'success')
     return redirect(url_for('admin_contacts'))
 
@@ -442,6 +2375,7 @@ def edit_department(dept_id):
         dept.updated_at = datetime.now(timezone.utc)
         
         db.session.commit()
+        notify_content_changed(dept.id, department_changed=True)
         flash('แก้ไขข้อมูลหน่วยงานสำเร็จ', 'success')
         return redirect(url_for('admin_departments'))
     
@@ -454,15 +2388,40 @@ def delete_department(dept_id):
     if dept is None:
         abort(404)
     
-    # ลบข้อมูลที่เกี่ยวข้องทั้งหมด
+    # ยกเลิกงานอัปโหลดที่ค้างอยู่ของข้อมูลที่จะถูกลบ
+    for target_type, model in UPLOAD_TARGETS.items():
+        target_ids = db.session.execute(db.select(model.id).filter_by(department_id=dept_id)).scalars().all()
+        for target_id in target_ids:
+            cancel_uploads(target_type, target_id)
+    
+    # bulk delete ข้างล่างไม่ผ่าน flush event จึงต้องลดการอ้างอิงไฟล์เอง
+    deltas = {}
+    for model, column in ASSET_URL_COLUMNS.items():
+        url_column = getattr(model, column)
+        rows = db.session.execute(
+            db.select(url_column, db.func.count()).filter_by(department_id=dept_id)
+            .where(url_column.isnot(None)).group_by(url_column)
+        ).all()
+        for url, count in rows:
+            deltas[url] = deltas.get(url, 0) - count
+    _adjust_asset_refs(db.session.connection(), deltas)
+    
+    # ลบข้อมูลที่เกี่ยวข้องทั้งหมด (ยอดรายวันเก็บไว้เป็นประวัติ หน้าสถิติแสดงเฉพาะที่ยังมีข้อมูลอยู่)
+    db.session.query(GuidelineUsage).filter(
+        GuidelineUsage.guideline_id.in_(db.select(Guideline.id).filter_by(department_id=dept_id))
+    ).delete(synchronize_session=False)
     db.session.query(Guideline).filter_by(department_id=dept_id).delete()
     db.session.query(Knowledge).filter_by(department_id=dept_id).delete()
     db.session.query(Activity).filter_by(department_id=dept_id).delete()
     db.session.query(Contact).filter_by(department_id=dept_id).delete()
+    # bulk delete ข้างบนไม่ผ่าน flush event จึงต้องลบออกจากดัชนีค้นหาเอง
+    if search_index.available:
+        search_index.delete_department(db.session.connection(), dept_id)
     
     # ลบหน่วยงาน
     db.session.delete(dept)
     db.session.commit()
+    notify_content_changed(dept_id, department_changed=True)
     
     flash('ลบหน่วยงานและข้อมูลที่เกี่ยวข้องสำเร็จ', 'success')
     return redirect(url_for('admin_departments'))
@@ -482,32 +2441,19 @@ def admin_add_knowledge():
             flash('เนื้อหามีความยาวเกิน 500 ตัวอักษร', 'error')
             return redirect(url_for('admin_add_knowledge'))
         
+        image = None
         if upload_type == 'image':
-            image = request.files['image']
-            if image and image.filename:
-                try:
-                    dept = db.session.get(Department, department_id)
-                    folder_name = f"knowledge/{dept.code.lower()}"
-                    
-                    upload_result = cloudinary.uploader.upload(
-                        image,
-                        folder=folder_name,
-                        resource_type="image"
-                    )
-                    
-                    image_url = upload_result.get("secure_url")
-                    
-                    knowledge = Knowledge(
-                        department_id=department_id,
-                        title=title,
-                        content=content,
-                        image_path=image_url,
-                        external_link=None,
-                        link_type=None
-                    )
-                except Exception as e:
-                    flash(f'เกิดข้อผิดพลาดในการอัปโหลดรูปภาพ: {str(e)}', 'error')
-                    return redirect(url_for('admin_add_knowledge'))
+            image = receive_upload('image')
+            if image:
+                knowledge = Knowledge(
+                    department_id=department_id,
+                    title=title,
+                    content=content,
+                    image_path=None,
+                    external_link=None,
+                    link_type=None,
+                    upload_status='pending'
+                )
             else:
                 flash('กรุณาเลือกรูปภาพ', 'error')
                 return redirect(url_for('admin_add_knowledge'))
@@ -539,7 +2485,19 @@ def admin_add_knowledge():
             )
         
         db.session.add(knowledge)
+        if knowledge.upload_status == 'pending':
+            try:
+                dept = db.session.get(Department, department_id)
+                job = start_upload(knowledge, image, f"knowledge/{dept.code.lower()}", 'image')
+            except Exception as e:
+                db.session.rollback()
+                flash(f'เกิดข้อผิดพลาดในการอัปโหลดรูปภาพ: {str(e)}', 'error')
+                return redirect(url_for('admin_add_knowledge'))
+            notify_content_changed(knowledge.department_id)
+            flash_upload_result(job, 'เพิ่มบทความความรู้สำเร็จ')
+            return redirect(url_for('admin_knowledge'))
         db.session.commit()
+        notify_content_changed(knowledge.department_id)
         flash('เพิ่มบทความความรู้สำเร็จ', 'success')
         return redirect(url_for('admin_knowledge'))
     
@@ -567,35 +2525,34 @@ def admin_edit_knowledge(knowledge_id):
         
         # อัปเดตรูปภาพหรือลิงก์
         upload_type = request.form['upload_type']
+        job = None
         if upload_type == 'image':
-            image = request.files['image']
-            if image and image.filename:
+            image = receive_upload('image')
+            if image:
                 try:
                     dept = db.session.get(Department, knowledge.department_id)
                     folder_name = f"knowledge/{dept.code.lower()}"
-                    
-                    upload_result = cloudinary.uploader.upload(
-                        image,
-                        folder=folder_name,
-                        resource_type="image"
-                    )
-                    
-                    knowledge.image_path = upload_result.get("secure_url")
-                    knowledge.external_link = None
-                    knowledge.link_type = None
+                    job = start_upload(knowledge, image, folder_name, 'image')
                 except Exception as e:
+                    db.session.rollback()
                     flash(f'เกิดข้อผิดพลาดในการอัปโหลดรูปภาพ: {str(e)}', 'error')
                     return redirect(url_for('admin_edit_knowledge', knowledge_id=knowledge_id))
         elif upload_type == 'link':
             external_link = request.form['external_link']
             link_type = request.form['link_type']
             if external_link:
+                cancel_uploads('knowledge', knowledge.id)
                 knowledge.external_link = external_link
                 knowledge.link_type = link_type
                 knowledge.image_path = None
+                knowledge.upload_status = None
         
         db.session.commit()
-        flash('แก้ไขบทความความรู้สำเร็จ', 'success')
+        notify_content_changed(knowledge.department_id)
+        if job is not None:
+            flash_upload_result(job, 'แก้ไขบทความความรู้สำเร็จ')
+        else:
+            flash('แก้ไขบทความความรู้สำเร็จ', 'success')
         return redirect(url_for('admin_knowledge'))
     
     return render_template('admin/edit_knowledge.html', knowledge=knowledge)
@@ -607,8 +2564,11 @@ def admin_delete_knowledge(knowledge_id):
     if knowledge is None:
         abort(404)
     
+    department_id = knowledge.department_id
+    cancel_uploads('knowledge', knowledge.id)
     db.session.delete(knowledge)
     db.session.commit()
+    notify_content_changed(department_id)
     flash('ลบบทความความรู้สำเร็จ', 'success')
     return redirect(url_for('admin_knowledge'))
 
@@ -628,33 +2588,20 @@ def admin_add_activity():
             flash('คำอธิบายมีความยาวเกิน 300 ตัวอักษร', 'error')
             return redirect(url_for('admin_add_activity'))
         
+        image = None
         if upload_type == 'image':
-            image = request.files['image']
-            if image and image.filename:
-                try:
-                    dept = db.session.get(Department, department_id)
-                    folder_name = f"activities/{dept.code.lower()}"
-                    
-                    upload_result = cloudinary.uploader.upload(
-                        image,
-                        folder=folder_name,
-                        resource_type="image"
-                    )
-                    
-                    image_url = upload_result.get("secure_url")
-                    
-                    activity = Activity(
-                        department_id=department_id,
-                        title=title,
-                        description=description,
-                        activity_date=datetime.strptime(activity_date, '%Y-%m-%d').date(),
-                        image_path=image_url,
-                        external_link=None,
-                        link_type=None
-                    )
-                except Exception as e:
-                    flash(f'เกิดข้อผิดพลาดในการอัปโหลดรูปภาพ: {str(e)}', 'error')
-                    return redirect(url_for('admin_add_activity'))
+            image = receive_upload('image')
+            if image:
+                activity = Activity(
+                    department_id=department_id,
+                    title=title,
+                    description=description,
+                    activity_date=datetime.strptime(activity_date, '%Y-%m-%d').date(),
+                    image_path=None,
+                    external_link=None,
+                    link_type=None,
+                    upload_status='pending'
+                )
             else:
                 flash('กรุณาเลือกรูปภาพ', 'error')
                 return redirect(url_for('admin_add_activity'))
@@ -688,7 +2635,19 @@ def admin_add_activity():
             )
         
         db.session.add(activity)
+        if activity.upload_status == 'pending':
+            try:
+                dept = db.session.get(Department, department_id)
+                job = start_upload(activity, image, f"activities/{dept.code.lower()}", 'image')
+            except Exception as e:
+                db.session.rollback()
+                flash(f'เกิดข้อผิดพลาดในการอัปโหลดรูปภาพ: {str(e)}', 'error')
+                return redirect(url_for('admin_add_activity'))
+            notify_content_changed(activity.department_id)
+            flash_upload_result(job, 'เพิ่มกิจกรรมสำเร็จ')
+            return redirect(url_for('admin_activities'))
         db.session.commit()
+        notify_content_changed(activity.department_id)
         flash('เพิ่มกิจกรรมสำเร็จ', 'success')
         return redirect(url_for('admin_activities'))
     
@@ -717,35 +2676,34 @@ def admin_edit_activity(activity_id):
         
         # อัปเดตรูปภาพหรือลิงก์
         upload_type = request.form['upload_type']
+        job = None
         if upload_type == 'image':
-            image = request.files['image']
-            if image and image.filename:
+            image = receive_upload('image')
+            if image:
                 try:
                     dept = db.session.get(Department, activity.department_id)
                     folder_name = f"activities/{dept.code.lower()}"
-                    
-                    upload_result = cloudinary.uploader.upload(
-                        image,
-                        folder=folder_name,
-                        resource_type="image"
-                    )
-                    
-                    activity.image_path = upload_result.get("secure_url")
-                    activity.external_link = None
-                    activity.link_type = None
+                    job = start_upload(activity, image, folder_name, 'image')
                 except Exception as e:
+                    db.session.rollback()
                     flash(f'เกิดข้อผิดพลาดในการอัปโหลดรูปภาพ: {str(e)}', 'error')
                     return redirect(url_for('admin_edit_activity', activity_id=activity_id))
         elif upload_type == 'link':
             external_link = request.form['external_link']
             link_type = request.form['link_type']
             if external_link:
+                cancel_uploads('activity', activity.id)
                 activity.external_link = external_link
                 activity.link_type = link_type
                 activity.image_path = None
+                activity.upload_status = None
         
         db.session.commit()
-        flash('แก้ไขกิจกรรมสำเร็จ', 'success')
+        notify_content_changed(activity.department_id)
+        if job is not None:
+            flash_upload_result(job, 'แก้ไขกิจกรรมสำเร็จ')
+        else:
+            flash('แก้ไขกิจกรรมสำเร็จ', 'success')
         return redirect(url_for('admin_activities'))
     
     return render_template('admin/edit_activity.html', activity=activity)
@@ -757,94 +2715,302 @@ def admin_delete_activity(activity_id):
     if activity is None:
         abort(404)
     
+    department_id = activity.department_id
+    cancel_uploads('activity', activity.id)
     db.session.delete(activity)
     db.session.commit()
+    notify_content_changed(department_id)
     flash('ลบกิจกรรมสำเร็จ', 'success')
     return redirect(url_for('admin_activities'))
 
-def init_db():
-    with app.app_context():
-        db.create_all()
-        
-        # ===== Migration: เพิ่มคอลัมน์ที่ขาดในตารางเดิม =====
-        # db.create_all() ไม่เพิ่มคอลัมน์ใหม่ให้ตารางที่มีอยู่แล้ว
-        # ต้องใช้ ALTER TABLE เพิ่มเอง
-        migration_columns = [
-            ('knowledge', 'image_path', 'VARCHAR(500)'),
-            ('knowledge', 'external_link', 'VARCHAR(500)'),
-            ('knowledge', 'link_type', 'VARCHAR(50)'),
-            ('activity', 'image_path', 'VARCHAR(500)'),
-            ('activity', 'external_link', 'VARCHAR(500)'),
-            ('activity', 'link_type', 'VARCHAR(50)'),
-            ('guideline', 'external_link', 'VARCHAR(500)'),
-            ('guideline', 'link_type', 'VARCHAR(50)'),
-        ]
-        
-        for table, column, col_type in migration_columns:
-            try:
-                db.session.execute(
-                    db.text(f'ALTER TABLE {table} ADD COLUMN IF NOT EXISTS {column} {col_type}')
-                )
-            except Exception:
-                db.session.rollback()
+@app.cli.command('search-reindex')
+def search_reindex_command():
+    """สร้างดัชนีค้นหาใหม่ทั้งหมดจากข้อมูลในฐานข้อมูล"""
+    search_index.create_schema(db.session.connection())
+    count = search_index.rebuild(db.session.connection(), _iter_search_documents())
+    set_feature(db.session, 'search', True)
+    db.session.commit()
+    print(f"Indexed {count} documents")
+
+@app.cli.command('uploads-run')
+def uploads_run_command():
+    """อัปโหลดงานที่ค้างอยู่ในคิวทั้งหมดทันที (รอจนเสร็จ)"""
+    upload_queue.mode = 'sync'
+    count = run_pending_uploads()
+    print(f"Processed {count} upload jobs")
+
+@app.cli.command('revoke-sessions')
+def revoke_sessions_command():
+    """ให้แอดมินทุกคนที่ล็อกอินอยู่ต้องล็อกอินใหม่ (instance อื่นภายใน SESSION_USER_CACHE_TTL วินาที)"""
+    revoke_sessions()
+    db.session.commit()
+    print("Revoked all admin sessions")
+
+@app.cli.command('assets-gc')
+def assets_gc_command():
+    """ลบไฟล์บน Cloudinary ที่ไม่มีข้อมูลใดอ้างถึงแล้ว"""
+    print(f"Deleted {collect_unused_assets()} unused assets")
+
+@app.cli.command('import-content')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--dry-run', is_flag=True, help='ตรวจ manifest และไฟล์โดยไม่อัปโหลดหรือบันทึกข้อมูล')
+@click.option('--workers', type=int, default=None, help='จำนวนไฟล์ที่อัปโหลดพร้อมกัน (ค่าเริ่มต้น IMPORT_WORKERS)')
+def import_content_command(path, dry_run, workers):
+    """นำเข้า guideline/knowledge/activity จาก ZIP หรือ manifest CSV/JSON (รันซ้ำได้ แถวที่นำเข้าแล้วจะถูกข้าม)"""
+    record = BulkImport(filename=os.path.basename(path), source_path=os.path.abspath(path), dry_run=dry_run)
+    db.session.add(record)
+    db.session.commit()
+    record = run_bulk_import(
+        record.id, workers=workers,
+        progress=lambda r: print(f"{r.processed}/{r.total} rows (imported {r.imported}, failed {r.failed})"),
+    )
+    for error in record.error_list:
+        print(f"row {error['row']}: {error['title']}: {error['error']}" if error['row'] else error['error'])
+    verb = 'Would import' if dry_run else 'Imported'
+    print(f"{verb} {record.imported}, skipped {record.skipped}, failed {record.failed} of {record.total} rows")
+
+@app.cli.command('images-rebuild')
+def images_rebuild_command():
+    """สร้างรูปย่อและบันทึกขนาดรูปของ knowledge/activity ที่มีอยู่แล้วทั้งหมด"""
+    department_ids = set()
+    count = 0
+    for model in (Knowledge, Activity):
+        items = db.session.execute(db.select(model).where(model.image_path.isnot(None))).scalars().all()
+        for item in items:
+            apply_image_variants(item, item.image_width, item.image_height)
+            department_ids.add(item.department_id)
+            count += 1
+            if count % 100 == 0:
+                db.session.commit()
+    db.session.commit()
+    notify_content_changed(*department_ids)
+    print(f"Rebuilt image variants for {count} items")
+
+# ===== Schema migrations และข้อมูลเริ่มต้น =====
+# ตอนเริ่มระบบอ่านแค่เลขเวอร์ชันใน schema_version (check_schema) ส่วนการสร้างตาราง เพิ่มคอลัมน์
+# สร้างดัชนีค้นหา และ seed ข้อมูล ทำด้วย flask db-upgrade ในขั้นตอน deploy
+# เพิ่ม migration ใหม่ต่อท้าย schema_migrations เสมอ ห้ามแก้ขั้นที่ปล่อยไปแล้ว
+
+# คอลัมน์ที่ init_db รุ่นก่อนเพิ่มด้วย ALTER TABLE ให้ฐานข้อมูลที่สร้างก่อนมีคอลัมน์เหล่านี้
+LEGACY_COLUMNS = [
+    ('knowledge', 'image_path', 'VARCHAR(500)'),
+    ('knowledge', 'external_link', 'VARCHAR(500)'),
+    ('knowledge', 'link_type', 'VARCHAR(50)'),
+    ('activity', 'image_path', 'VARCHAR(500)'),
+    ('activity', 'external_link', 'VARCHAR(500)'),
+    ('activity', 'link_type', 'VARCHAR(50)'),
+    ('guideline', 'external_link', 'VARCHAR(500)'),
+    ('guideline', 'link_type', 'VARCHAR(50)'),
+    ('guideline', 'upload_status', 'VARCHAR(20)'),
+    ('knowledge', 'upload_status', 'VARCHAR(20)'),
+    ('activity', 'upload_status', 'VARCHAR(20)'),
+    ('upload_job', 'sha256', 'VARCHAR(64)'),
+    ('stored_asset', 'width', 'INTEGER'),
+    ('stored_asset', 'height', 'INTEGER'),
+    ('knowledge', 'image_width', 'INTEGER'),
+    ('knowledge', 'image_height', 'INTEGER'),
+    ('knowledge', 'image_variants', 'TEXT'),
+    ('activity', 'image_width', 'INTEGER'),
+    ('activity', 'image_height', 'INTEGER'),
+    ('activity', 'image_variants', 'TEXT'),
+]
+
+def _migrate_baseline(session, state):
+    connection = session.connection()
+    db.metadata.create_all(connection)
+    for table, column, col_type in LEGACY_COLUMNS:
+        add_column_if_missing(connection, table, column, col_type)
+
+def _migrate_search_index(session, state):
+    # ฐานข้อมูลที่ไม่รองรับ (SQLite ไม่มี FTS5, PostgreSQL ไม่มีสิทธิ์สร้าง pg_trgm) ปิดการค้นหาแทนการ deploy ไม่ผ่าน
+    try:
+        with session.begin_nested():
+            search_index.create_schema(session.connection())
+            search_index.rebuild(session.connection(), _iter_search_documents())
+        state.features.add('search')
+    except Exception as e:
+        search_index.available = False
+        print(f"Warning: search index unavailable ({e}). Search is disabled.")
+
+def _migrate_usage(session, state):
+    db.metadata.create_all(session.connection(), tables=[GuidelineUsage.__table__, DailyUsage.__table__])
+
+# คอลัมน์วันที่ที่หน้ารายการของแอดมินเรียงตรงๆ (ไม่ coalesce) เพื่อให้ใช้ index ได้ จึงต้องไม่มี NULL
+NOT_NULL_DATE_COLUMNS = [
+    ('guideline', 'upload_date'),
+    ('knowledge', 'created_at'),
+    ('knowledge', 'updated_at'),
+    ('activity', 'created_at'),
+]
+
+def _migrate_not_null_dates(session, state):
+    # แถวเก่าที่ไม่มีวันที่ได้ 1970-01-01 ซึ่งเป็นค่าแทน NULL เดิมของการเรียง ลำดับในหน้ารายการจึงไม่เปลี่ยน
+    # SQLite เพิ่ม NOT NULL ให้คอลัมน์เดิมไม่ได้ (ต้องสร้างตารางใหม่) จึงเติมค่าอย่างเดียว ค่าเริ่มต้นของ model กันแถวใหม่ไว้แล้ว
+    connection = session.connection()
+    for table, column in NOT_NULL_DATE_COLUMNS:
+        target = db.metadata.tables[table].c[column]
+        connection.execute(db.update(target.table).where(target.is_(None)).values({column: datetime(1970, 1, 1)}))
+        if connection.dialect.name == 'postgresql':
+            connection.execute(db.text(f'ALTER TABLE {table} ALTER COLUMN {column} SET NOT NULL'))
+
+def _migrate_session_version(session, state):
+    add_column_if_missing(session.connection(), 'admin_user', 'session_version', 'INTEGER NOT NULL DEFAULT 1')
+
+def _migrate_indexes(session, state):
+    # ฐานข้อมูลใหม่ได้ index จาก create_all แล้ว ขั้นนี้สร้างให้ตารางที่มีอยู่ก่อน (PostgreSQL ใช้ CONCURRENTLY)
+    create_missing_indexes(session.get_bind(), db.metadata)
+
+schema_migrations = MigrationRunner([
+    Migration(1, 'create tables and columns added by earlier releases', _migrate_baseline),
+    Migration(2, 'full-text search index', _migrate_search_index),
+    Migration(3, 'indexes for department pages, dashboard counts and upload jobs', _migrate_indexes,
+              transactional=False),
+    Migration(4, 'download and page view counters', _migrate_usage),
+    Migration(5, 'fill missing dates used to sort admin lists', _migrate_not_null_dates),
+    Migration(6, 'indexes for sorting admin lists', _migrate_indexes, transactional=False),
+    Migration(7, 'admin session version for revoking logins', _migrate_session_version),
+    Migration(8, 'bigram search index for short terms', _migrate_search_index),
+])
+
+# หน่วยงานเริ่มต้น (name, code, description)
+DEFAULT_DEPARTMENTS = [
+    ('หน่วยเบาหวาน', 'DM', 'หน่วยดูแลผู้ป่วยเบาหวาน'),
+    ('หน่วยปอดอุดกั้นเรื้อรัง', 'COPD', 'หน่วยดูแลผู้ป่วยโรคปอดอุดกั้นเรื้อรัง'),
+    ('หน่วยเลือดออกทางเดินอาหารส่วนต้น', 'UGIB', 'หน่วยดูแลผู้ป่วยเลือดออกทางเดินอาหารส่วนต้น'),
+    ('หน่วยไตเรื้อรัง', 'CKD', 'หน่วยดูแลผู้ป่วยไตเรื้อรัง'),
+    ('หน่วยหัวใจขาดเลือด', 'STEMI_NSTEMI', 'หน่วยดูแลผู้ป่วยหัวใจขาดเลือด'),
+    ('หน่วยโรคหลอดเลือดสมอง', 'STROKE', 'หน่วยดูแลผู้ป่วยโรคหลอดเลือดสมอง'),
+    ('หน่วยวัณโรค', 'TB', 'หน่วยดูแลผู้ป่วยวัณโรค'),
+    ('หน่วยเคมีบำบัด', 'CHEMO', 'หน่วยดูแลผู้ป่วยที่ได้รับเคมีบำบัด'),
+    ('หน่วยความดันโลหิตสูง', 'HTN', 'หน่วยดูแลผู้ป่วยโรคความดันโลหิตสูง'),
+    ('หน่วยภาวะติดเชื้อในกระแสเลือด', 'SEPSIS', 'หน่วยดูแลผู้ป่วยภาวะติดเชื้อในกระแสเลือด'),
+    ('หน่วยโรคข้อและรูมาติสซั่ม', 'RHEUMATO', 'หน่วยดูแลผู้ป่วยโรคข้อและรูมาติสซั่ม'),
+    ('หน่วยโรคอ้วน', 'OBESITY', 'หน่วยดูแลผู้ป่วยโรคอ้วน'),
+]
+
+def seed_db():
+    """ข้อมูลเริ่มต้น: หน่วยงาน (เมื่อยังไม่มีเลย) และบัญชีแอดมินจาก ADMIN_USERNAME/ADMIN_PASSWORD/ADMIN_EMAIL"""
+    if db.session.query(Department).count() == 0:
+        for name, code, description in DEFAULT_DEPARTMENTS:
+            db.session.add(Department(name=name, code=code, description=description))
         db.session.commit()
+    
+    # ===== ซิงค์ Admin User จาก Environment Variables ทุกครั้งที่รัน db-upgrade =====
+    admin_username = os.getenv('ADMIN_USERNAME', 'admin')
+    admin_password = os.getenv('ADMIN_PASSWORD', 'admin123')
+    admin_email = os.getenv('ADMIN_EMAIL', 'admin@hospital.local')
+    
+    # หา admin user ที่มีอยู่ (ตัวแรก)
+    admin = db.session.query(AdminUser).first()
+    
+    if admin:
+        # เช็คว่า credentials เปลี่ยนจริงไหม ถ้าตรงแล้วก็ไม่ต้องอัปเดต
+        needs_update = False
+        if admin.username != admin_username:
+            admin.username = admin_username
+            needs_update = True
+        if admin.email != admin_email:
+            admin.email = admin_email
+            needs_update = True
+        if not check_password_hash(admin.password_hash, admin_password):
+            admin.password_hash = generate_password_hash(admin_password)
+            needs_update = True
         
-        # สร้างข้อมูลเริ่มต้น (departments)
-        if db.session.query(Department).count() == 0:
-            departments = [
-                Department(name='หน่วยเบาหวาน', code='DM', description='หน่วยดูแลผู้ป่วยเบาหวาน'),
-                Department(name='หน่วยปอดอุดกั้นเรื้อรัง', code='COPD', description='หน่วยดูแลผู้ป่วยโรคปอดอุดกั้นเรื้อรัง'),
-                Department(name='หน่วยเลือดออกทางเดินอาหารส่วนต้น', code='UGIB', description='หน่วยดูแลผู้ป่วยเลือดออกทางเดินอาหารส่วนต้น'),
-                Department(name='หน่วยไตเรื้อรัง', code='CKD', description='หน่วยดูแลผู้ป่วยไตเรื้อรัง'),
-                Department(name='หน่วยหัวใจขาดเลือด', code='STEMI_NSTEMI', description='หน่วยดูแลผู้ป่วยหัวใจขาดเลือด'),
-                Department(name='หน่วยโรคหลอดเลือดสมอง', code='STROKE', description='หน่วยดูแลผู้ป่วยโรคหลอดเลือดสมอง'),
-                Department(name='หน่วยวัณโรค', code='TB', description='หน่วยดูแลผู้ป่วยวัณโรค'),
-                Department(name='หน่วยเคมีบำบัด', code='CHEMO', description='หน่วยดูแลผู้ป่วยที่ได้รับเคมีบำบัด'),
-                Department(name='หน่วยความดันโลหิตสูง', code='HTN', description='หน่วยดูแลผู้ป่วยโรคความดันโลหิตสูง'),
-                Department(name='หน่วยภาวะติดเชื้อในกระแสเลือด', code='SEPSIS', description='หน่วยดูแลผู้ป่วยภาวะติดเชื้อในกระแสเลือด'),
-                Department(name='หน่วยโรคข้อและรูมาติสซั่ม', code='RHEUMATO', description='หน่วยดูแลผู้ป่วยโรคข้อและรูมาติสซั่ม'),
-                Department(name='หน่วยโรคอ้วน', code='OBESITY', description='หน่วยดูแลผู้ป่วยโรคอ้วน')
-            ]
-            
-            for dept in departments:
-                db.session.add(dept)
+        if needs_update:
+            db.session.flush()
+            revoke_sessions(admin.id)
             db.session.commit()
+    else:
+        # ยังไม่มี admin → สร้างใหม่
+        admin = AdminUser(
+            username=admin_username,
+            password_hash=generate_password_hash(admin_password),
+            email=admin_email
+        )
+        db.session.add(admin)
+        db.session.commit()
+
+def init_db():
+    """migrate schema เป็นเวอร์ชันล่าสุดแล้ว seed ข้อมูล (flask db-upgrade) คืน SchemaState"""
+    with app.app_context():
+        state = schema_migrations.upgrade(db.session)
+        search_index.available = 'search' in state.features
+        seed_db()
+        return state
+
+def check_schema():
+    """ตรวจเวอร์ชัน schema ตอนเริ่มระบบด้วย query เดียว
+
+    ถ้าฐานข้อมูลเก่ากว่าโค้ดและ SCHEMA_AUTO_MIGRATE เปิดอยู่ (ค่าเริ่มต้นเมื่อไม่ได้รันบน Vercel) จะ migrate ให้เลย
+    ไม่เช่นนั้นพิมพ์คำเตือนให้รัน flask db-upgrade
+    """
+    with app.app_context():
+        state = read_state(db.session.connection())
+        db.session.rollback()
+        if state.version < schema_migrations.latest:
+            if app.config['SCHEMA_AUTO_MIGRATE']:
+                state = init_db()
+            else:
+                print(f"Warning: database schema is at version {state.version} but the code expects "
+                      f"{schema_migrations.latest}. Run `flask db-upgrade`.")
+        search_index.available = 'search' in state.features
         
-        # ===== ซิงค์ Admin User จาก Environment Variables ทุกครั้ง =====
-        admin_username = os.getenv('ADMIN_USERNAME', 'admin')
-        admin_password = os.getenv('ADMIN_PASSWORD', 'admin123')
-        admin_email = os.getenv('ADMIN_EMAIL', 'admin@hospital.local')
-        
-        # หา admin user ที่มีอยู่ (ตัวแรก)
-        admin = db.session.query(AdminUser).first()
-        
-        if admin:
-            # เช็คว่า credentials เปลี่ยนจริงไหม ถ้าตรงแล้วก็ไม่ต้องอัปเดต
-            needs_update = False
-            if admin.username != admin_username:
-                admin.username = admin_username
-                needs_update = True
-            if admin.email != admin_email:
-                admin.email = admin_email
-                needs_update = True
-            if not check_password_hash(admin.password_hash, admin_password):
-                admin.password_hash = generate_password_hash(admin_password)
-                needs_update = True
-            
-            if needs_update:
-                db.session.commit()
-        else:
-            # ยังไม่มี admin → สร้างใหม่
-            admin = AdminUser(
-                username=admin_username,
-                password_hash=generate_password_hash(admin_password),
-                email=admin_email
-            )
-            db.session.add(admin)
-            db.session.commit()
+        # งานอัปโหลดที่ค้างจากรอบก่อน (process ถูกปิดระหว่างอัปโหลด) ส่งเข้าคิวต่อ
+        # โหมด sync ไม่ทำตอนเริ่มระบบเพราะจะทำให้ cold start ช้า ใช้คำสั่ง flask uploads-run แทน
+        if upload_queue.mode == 'async' and state.version >= 1:
+            run_pending_uploads()
+
+@app.cli.command('static-export')
+@click.option('--dry-run', is_flag=True, help='แสดงหน้าที่จะเพิ่ม/เปลี่ยน/ลบ โดยไม่เขียนไฟล์')
+@click.option('--department', 'department_ids', type=int, multiple=True,
+              help='ส่งออกเฉพาะหน้าแรกและหน่วยงานนี้ (ระบุซ้ำได้) ค่าเริ่มต้นคือทุกหน้าพร้อม static/')
+def static_export_command(dry_run, department_ids):
+    """ส่งออกหน้าแรกและหน้าหน่วยงานเป็น HTML ไปที่ STATIC_EXPORT_DIR แล้วสลับ current แบบ atomic"""
+    if static_exporter is None:
+        raise click.ClickException('STATIC_EXPORT_DIR is not set')
+    urls = ['/'] + [f'/department/{dept_id}' for dept_id in department_ids] if department_ids else None
+    changes = static_exporter.export(urls, dry_run=dry_run)
+    for status, url in changes:
+        print(f"{status:8} {url}")
+    if dry_run:
+        print(f"Would update {len(changes)} pages")
+    else:
+        print(f"Updated {len(changes)} pages, serving {static_exporter.current_release()}")
+
+@app.cli.command('db-upgrade')
+def db_upgrade_command():
+    """migrate schema และ seed ข้อมูล (รันในขั้นตอน deploy และหลังเปลี่ยน ADMIN_* ใน environment)"""
+    state = init_db()
+    print(f"Schema is at version {state.version} (features: {', '.join(sorted(state.features)) or 'none'})")
+
+@app.cli.command('db-status')
+def db_status_command():
+    """แสดงเวอร์ชัน schema ปัจจุบันและ migration ที่ยังไม่ได้รัน"""
+    state = read_state(db.session.connection())
+    db.session.rollback()
+    print(f"Schema version {state.version}, latest {schema_migrations.latest}")
+    for migration in schema_migrations.pending(state):
+        print(f"  pending {migration.version}: {migration.description}")
+
+@app.cli.command('db-indexes')
+@click.option('--drop-duplicates', is_flag=True, help='ลบ index ที่ซ้ำซ้อนและไม่ได้ประกาศใน model')
+def db_indexes_command(drop_duplicates):
+    """ตรวจ index ที่ขาด ซ้ำซ้อน ไม่ได้ประกาศใน model หรือไม่เคยถูกใช้ (PostgreSQL)"""
+    findings = index_report(db.session.connection(), db.metadata)
+    db.session.rollback()
+    for finding in findings:
+        print(f"{finding['kind']:10} {finding['table']}.{finding['index']} {finding['detail']}")
+    if not findings:
+        print("No index problems found")
+    if drop_duplicates:
+        declared = {index.name for table in db.metadata.sorted_tables for index in table.indexes}
+        names = sorted({finding['index'] for finding in findings
+                        if finding['kind'] == 'duplicate' and finding['index'] not in declared})
+        drop_indexes(db.engine, names)
+        print(f"Dropped {len(names)} duplicate indexes")
 
-# เรียก init_db() ที่ module level เพื่อให้ Vercel เรียกได้ด้วย
-init_db()
+# ตรวจเวอร์ชัน schema ที่ module level (Vercel import app.py โดยตรง)
+check_schema()
 
 if __name__ == '__main__':
     # ใช้ environment variables สำหรับ host และ port
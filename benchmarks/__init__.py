@@ -0,0 +1,2 @@
+# -*- coding: utf-8 -*-
+"""สคริปต์วัดประสิทธิภาพ รันด้วย python -m benchmarks.<ชื่อ> จากโฟลเดอร์หลักของโปรเจกต์"""
@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+"""
+วัด cold start: เวลา import app และเวลาของ request แรก ใน process ใหม่ทุกรอบ (เหมือน instance ใหม่ของ Vercel)
+
+    python -m benchmarks.cold_start [--runs 10] [--compare /tmp/before]
+
+ฐานข้อมูลชั่วคราวถูก migrate ไว้ก่อน (รอบแรกไม่นับ) จึงวัดกรณีปกติที่ schema เป็นปัจจุบันแล้ว
+--compare ชี้ไปยังโฟลเดอร์ของโค้ดอีกรุ่น (เช่น git worktree add /tmp/before <commit>) เพื่อวัดเทียบกัน
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# รันใน process ลูก: พิมพ์ "<ms ที่ใช้ import app> <ms ของ request แรก> <จำนวน SQL ตอน import>"
+PROBE = '''
+import time
+started = time.perf_counter()
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+queries = []
+event.listen(Engine, 'before_cursor_execute', lambda *args: queries.append(1))
+import app
+imported = time.perf_counter()
+boot_queries = len(queries)
+response = app.app.test_client().get('/')
+assert response.status_code == 200, response.status_code
+print(f'{(imported - started) * 1000:.1f} {(time.perf_counter() - imported) * 1000:.1f} {boot_queries}')
+'''
+
+
+def measure(root, database_url, runs):
+    env = dict(os.environ, DATABASE_URL=database_url, UPLOAD_BACKEND='stub', UPLOAD_MODE='sync')
+    samples = []
+    for attempt in range(runs + 1):
+        output = subprocess.run([sys.executable, '-c', PROBE], cwd=root, env=env,
+                                capture_output=True, text=True, check=True).stdout
+        if attempt:  # รอบแรกสร้าง/migrate ฐานข้อมูล ไม่นับ
+            samples.append([float(value) for value in output.split()[-3:]])
+    return [statistics.median(column) for column in zip(*samples)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--compare', help='โฟลเดอร์ของโค้ดอีกรุ่นที่จะวัดเทียบ')
+    args = parser.parse_args()
+
+    targets = [('current', ROOT)]
+    if args.compare:
+        targets.insert(0, (os.path.basename(os.path.normpath(args.compare)), args.compare))
+    print(f'{"code":12} {"import app (ms)":>16} {"first request (ms)":>19} {"total (ms)":>11} {"boot queries":>13}')
+    for label, root in targets:
+        database_url = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'cold_start.db')
+        import_ms, request_ms, queries = measure(root, database_url, args.runs)
+        print(f'{label:12} {import_ms:16.1f} {request_ms:19.1f} {import_ms + request_ms:11.1f} {queries:13.0f}')
+
+
+if __name__ == '__main__':
+    main()
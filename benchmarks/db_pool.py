@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+"""
+วัดเวลาตอบของหน้า public เมื่อมี request พร้อมกันหลาย thread แยกตาม DB_POOL_PROFILE
+
+    python -m benchmarks.db_pool [--threads 8] [--requests 50] [--connect-ms 60] [--database-url URL]
+
+แต่ละ profile รันใน process ใหม่ (engine ถูกสร้างตอน import app) และปิด page cache เพื่อให้ทุก request ใช้ฐานข้อมูล
+--connect-ms จำลองเวลาเปิด connection ใหม่ (TCP + TLS ไป Neon) เพราะ SQLite ในเครื่องเปิด connection แทบไม่เสียเวลา
+ถ้ามี PostgreSQL จริงให้ส่ง --database-url และ --connect-ms 0
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+from db_pool import POOL_PROFILES
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = '''
+import json, statistics, sys, threading, time
+from sqlalchemy import event
+import app as m
+
+threads, requests, connect_ms = int(sys.argv[1]), int(sys.argv[2]), float(sys.argv[3])
+with m.app.app_context():
+    if connect_ms:
+        event.listen(m.db.engine, 'do_connect', lambda *args: time.sleep(connect_ms / 1000))
+    department_ids = [row.id for row in m.Department.query.all()]
+
+latencies, errors = [], []
+def worker(index):
+    client = m.app.test_client()
+    for n in range(requests):
+        url = '/' if n % 2 else f'/department/{department_ids[(index + n) % len(department_ids)]}'
+        started = time.perf_counter()
+        try:
+            status = client.get(url).status_code
+            if status != 200:
+                errors.append(status)
+        except Exception as e:
+            errors.append(repr(e))
+        latencies.append((time.perf_counter() - started) * 1000)
+
+started = time.perf_counter()
+workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+for thread in workers:
+    thread.start()
+for thread in workers:
+    thread.join()
+elapsed = time.perf_counter() - started
+latencies.sort()
+stats = m.pool_monitor.stats()
+print(json.dumps({
+    'rps': len(latencies) / elapsed,
+    'p50': statistics.median(latencies),
+    'p95': latencies[int(len(latencies) * 0.95) - 1],
+    'max': latencies[-1],
+    'connects': stats['connects'],
+    'errors': len(errors),
+}))
+'''
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=50, help='จำนวน request ต่อ thread')
+    parser.add_argument('--connect-ms', type=float, default=60.0)
+    parser.add_argument('--database-url')
+    parser.add_argument('--profile', action='append', dest='profiles', choices=sorted(POOL_PROFILES))
+    args = parser.parse_args()
+
+    database_url = args.database_url or 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'db_pool.db')
+    env = dict(os.environ, DATABASE_URL=database_url, UPLOAD_BACKEND='stub', UPLOAD_MODE='sync',
+               PAGE_CACHE_BACKEND='none', STATS_CACHE_TTL='0')
+    # สร้าง schema ก่อน ไม่ให้เวลา migrate ไปปนกับรอบที่วัด
+    subprocess.run([sys.executable, '-c', 'import app'], cwd=ROOT, env=env, check=True, capture_output=True)
+
+    print(f'{args.threads} threads x {args.requests} requests, simulated connect {args.connect_ms:.0f} ms')
+    print(f'{"profile":12} {"req/s":>8} {"p50 ms":>8} {"p95 ms":>8} {"max ms":>8} {"connects":>9} {"errors":>7}')
+    for profile in args.profiles or list(POOL_PROFILES):
+        output = subprocess.run(
+            [sys.executable, '-c', PROBE, str(args.threads), str(args.requests), str(args.connect_ms)],
+            cwd=ROOT, env=dict(env, DB_POOL_PROFILE=profile), capture_output=True, text=True, check=True,
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        print(f'{profile:12} {result["rps"]:8.0f} {result["p50"]:8.1f} {result["p95"]:8.1f} {result["max"]:8.1f} '
+              f'{result["connects"]:9d} {result["errors"]:7d}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+"""
+สร้างข้อมูลจำลองปริมาณมากสำหรับวัดประสิทธิภาพ (SQLite หรือ PostgreSQL)
+
+    python -m benchmarks.generate [--guidelines 10000] [--knowledge 10000] [--activities 10000]
+                                  [--departments 12] [--skew 1.1] [--batch 10000] [--database-url URL]
+
+ข้อมูลกระจายไปตามหน่วยงานแบบเบ้ (Zipf: หน่วยงานลำดับที่ k มีข้อมูลราว 1/k^skew เท่าของหน่วยงานแรก)
+เหมือนของจริงที่บางหน่วยงานมีเอกสารมากกว่าหน่วยงานอื่นหลายเท่า
+guideline เป็นลิงก์ภายนอกทั้งหมดและไม่มีรูปภาพ จึงไม่ต้องอัปโหลดไฟล์หรือสร้าง StoredAsset
+
+เพิ่มข้อมูลต่อจากที่มีอยู่ ถ้าต้องการชุดข้อมูลใหม่ให้ใช้ไฟล์/ฐานข้อมูลใหม่
+INSERT ทำผ่าน Core ทีละ --batch แถวซึ่งไม่ผ่าน after_flush ของ ORM จึงสร้างดัชนีค้นหาใหม่ (search-reindex)
+และเพิ่ม revision ของหน้าทุกหน่วยงานตอนท้าย
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# ใช้ร่วมกับ benchmarks.scenarios เมื่อไม่ได้ระบุ --database-url
+DEFAULT_DATABASE_URL = 'sqlite:///' + os.path.join(tempfile.gettempdir(), 'ha_benchmark.db')
+
+WORDS = (
+    'แนวทาง การดูแล ผู้ป่วย เบาหวาน ความดันโลหิตสูง ไตเรื้อรัง วัณโรค ยา การให้ยา อินซูลิน ออกซิเจน '
+    'การประเมิน การคัดกรอง ภาวะแทรกซ้อน การติดตาม การส่งต่อ พยาบาล แพทย์ เภสัชกร โภชนาการ การออกกำลังกาย '
+    'คลินิก หอผู้ป่วย ฉุกเฉิน ห้องปฏิบัติการ ผลเลือด น้ำตาล ไขมัน หัวใจ ปอด สมอง การฟื้นฟู การป้องกัน '
+    'sepsis stroke STEMI COPD HbA1c eGFR protocol checklist guideline update 2024 2025'
+).split()
+
+LINK_TYPES = ('Google Drive', 'OneDrive', 'Website')
+
+
+def department_weights(count, skew):
+    return [1 / (rank ** skew) for rank in range(1, count + 1)]
+
+
+def sentence(rng, words):
+    return ' '.join(rng.choice(WORDS) for _ in range(words))
+
+
+def random_time(rng, now, days=3 * 365):
+    return now - timedelta(seconds=rng.randrange(days * 86400))
+
+
+def guideline_row(rng, department_id, n, now):
+    return {
+        'department_id': department_id,
+        'title': f'{sentence(rng, 5)} #{n}',
+        'description': sentence(rng, rng.randint(10, 60)),
+        'external_link': f'https://example.org/guidelines/{n}',
+        'link_type': rng.choice(LINK_TYPES),
+        'upload_date': random_time(rng, now),
+    }
+
+
+def knowledge_row(rng, department_id, n, now):
+    created_at = random_time(rng, now)
+    return {
+        'department_id': department_id,
+        'title': f'{sentence(rng, 5)} #{n}',
+        'content': sentence(rng, rng.randint(20, 80))[:500],
+        'created_at': created_at,
+        'updated_at': created_at + timedelta(seconds=rng.randrange(30 * 86400)),
+    }
+
+
+def activity_row(rng, department_id, n, now):
+    created_at = random_time(rng, now)
+    return {
+        'department_id': department_id,
+        'title': f'{sentence(rng, 5)} #{n}',
+        'description': sentence(rng, rng.randint(10, 40))[:300],
+        'activity_date': created_at.date(),
+        'created_at': created_at,
+    }
+
+
+def insert_rows(m, model, make_row, count, department_ids, weights, batch, rng):
+    """INSERT count แถวทีละ batch คืนจำนวนแถวต่อวินาที"""
+    table = model.__table__
+    cumulative = []
+    total = 0.0
+    for weight in weights:
+        total += weight
+        cumulative.append(total)
+    now = datetime.now(timezone.utc)
+    started = time.perf_counter()
+    for offset in range(0, count, batch):
+        size = min(batch, count - offset)
+        chosen = rng.choices(department_ids, cum_weights=cumulative, k=size)
+        m.db.session.execute(m.db.insert(table), [
+            make_row(rng, department_id, offset + i + 1, now) for i, department_id in enumerate(chosen)
+        ])
+        m.db.session.commit()
+        done = offset + size
+        print(f'  {table.name}: {done:,}/{count:,} ({done / (time.perf_counter() - started):,.0f} rows/s)',
+              end='\r', flush=True)
+    elapsed = time.perf_counter() - started
+    if count:
+        print()
+    return count / elapsed if elapsed else 0.0
+
+
+def ensure_departments(m, count):
+    """เพิ่มหน่วยงานสมมติจนครบ count หน่วยงาน คืน id ทั้งหมดเรียงตาม id (หน่วยงานแรกได้ข้อมูลมากที่สุด)"""
+    existing = m.db.session.scalar(m.db.select(m.db.func.count()).select_from(m.Department))
+    for n in range(existing + 1, count + 1):
+        m.db.session.add(m.Department(name=f'หน่วยงานทดสอบ {n}', code=f'BENCH{n}', description='ข้อมูลจำลอง'))
+    m.db.session.commit()
+    return list(m.db.session.scalars(m.db.select(m.Department.id).order_by(m.Department.id)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--guidelines', type=int, default=10000)
+    parser.add_argument('--knowledge', type=int, default=10000)
+    parser.add_argument('--activities', type=int, default=10000)
+    parser.add_argument('--departments', type=int, default=12, help='จำนวนหน่วยงานขั้นต่ำ (เพิ่มหน่วยงานสมมติถ้าไม่ครบ)')
+    parser.add_argument('--skew', type=float, default=1.1, help='ค่า s ของ Zipf (0 = กระจายเท่ากัน)')
+    parser.add_argument('--batch', type=int, default=10000, help='จำนวนแถวต่อหนึ่ง INSERT/commit')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--database-url', default=os.getenv('DATABASE_URL') or DEFAULT_DATABASE_URL)
+    parser.add_argument('--no-search-index', action='store_true', help='ไม่สร้างดัชนีค้นหาใหม่ (เร็วกว่ามากสำหรับข้อมูลหลักล้าน)')
+    args = parser.parse_args()
+
+    os.environ['DATABASE_URL'] = args.database_url
+    os.environ['SCHEMA_AUTO_MIGRATE'] = 'true'
+    sys.path.insert(0, ROOT)
+    import app as m
+
+    rng = random.Random(args.seed)
+    with m.app.app_context():
+        print(f'Database: {m.db.engine.url.render_as_string(hide_password=True)}')
+        department_ids = ensure_departments(m, args.departments)
+        weights = department_weights(len(department_ids), args.skew)
+        for model, make_row, count in ((m.Guideline, guideline_row, args.guidelines),
+                                       (m.Knowledge, knowledge_row, args.knowledge),
+                                       (m.Activity, activity_row, args.activities)):
+            insert_rows(m, model, make_row, count, department_ids, weights, args.batch, rng)
+
+        # สถิติของตารางให้ query planner เลือก index ได้เหมือนฐานข้อมูลจริงที่มีข้อมูลมาก
+        m.db.session.execute(m.db.text('ANALYZE'))
+        m.db.session.commit()
+        m.notify_content_changed(*department_ids, department_changed=True)
+
+    if not args.no_search_index:
+        started = time.perf_counter()
+        result = m.app.test_cli_runner().invoke(args=['search-reindex'])
+        print(f'  {result.output.strip()} in {time.perf_counter() - started:.1f} s')
+
+    with m.app.app_context():
+        for model in (m.Guideline, m.Knowledge, m.Activity):
+            total = m.db.session.scalar(m.db.select(m.db.func.count()).select_from(model))
+            print(f'{model.__tablename__:10} {total:>12,} rows')
+
+
+if __name__ == '__main__':
+    main()
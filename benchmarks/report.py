@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+"""
+รายงานผลของ benchmarks.scenarios เป็นไฟล์ JSON และเปรียบเทียบสองรอบ
+
+    python -m benchmarks.report OLD.json NEW.json
+
+ไฟล์หนึ่งไฟล์คือหนึ่งรอบ: meta (commit, เวลา, ฐานข้อมูล, จำนวนแถว) และผลของแต่ละ scenario
+(p50/p95/p99 ms, จำนวน query ต่อ request, peak RSS) เก็บไว้ใน benchmarks/results/ เพื่อดูแนวโน้มข้ามเวลา
+"""
+
+import argparse
+import json
+import os
+import resource
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(ROOT, 'benchmarks', 'results')
+
+# (ชื่อใน JSON, หัวตาราง) ที่ใช้เปรียบเทียบ ค่าน้อยกว่าดีกว่าทุกตัว
+COMPARED = (('p50_ms', 'p50 ms'), ('p95_ms', 'p95 ms'), ('p99_ms', 'p99 ms'),
+            ('queries_per_request', 'queries'), ('peak_rss_mb', 'RSS MB'))
+
+
+def percentile(values, fraction):
+    """values ต้องเรียงแล้ว"""
+    return values[max(0, int(len(values) * fraction) - 1)] if values else 0.0
+
+
+def summarize(latencies, queries, errors):
+    latencies = sorted(latencies)
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'mean_ms': round(statistics.fmean(latencies), 2) if latencies else 0.0,
+        'p50_ms': round(percentile(latencies, 0.50), 2),
+        'p95_ms': round(percentile(latencies, 0.95), 2),
+        'p99_ms': round(percentile(latencies, 0.99), 2),
+        'max_ms': round(latencies[-1], 2) if latencies else 0.0,
+        'queries_per_request': round(queries / len(latencies), 2) if latencies else 0.0,
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+
+def peak_rss_mb():
+    """RSS สูงสุดของ process นี้ตั้งแต่เริ่ม (ค่าสะสม ไม่ลดลงระหว่าง scenario)"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)  # macOS เป็น byte, Linux เป็น KB
+
+
+def git_commit():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                                text=True, check=True).stdout.strip()
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=ROOT,
+                               capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return commit + ('-dirty' if dirty else '')
+
+
+def write(report, path=None):
+    if path is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        stamp = report['meta']['timestamp'].replace(':', '').replace('-', '')[:15]
+        path = os.path.join(RESULTS_DIR, f'{stamp}-{report["meta"]["commit"] or "nogit"}.json')
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    return path
+
+
+def load(path):
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def print_table(report):
+    print(f'{"scenario":20} {"reqs":>5} {"err":>4} {"p50 ms":>8} {"p95 ms":>8} {"p99 ms":>8} '
+          f'{"queries":>8} {"RSS MB":>7}')
+    for name, result in report['scenarios'].items():
+        print(f'{name:20} {result["requests"]:5d} {result["errors"]:4d} {result["p50_ms"]:8.1f} '
+              f'{result["p95_ms"]:8.1f} {result["p99_ms"]:8.1f} {result["queries_per_request"]:8.1f} '
+              f'{result["peak_rss_mb"]:7.1f}')
+
+
+def print_comparison(old, new):
+    """ตารางค่าเดิม -> ค่าใหม่ (เปลี่ยนไปกี่ %) ของ scenario ที่มีในทั้งสองรอบ"""
+    for label, report in (('old', old), ('new', new)):
+        meta = report['meta']
+        rows = ', '.join(f'{table} {count:,}' for table, count in meta['rows'].items())
+        print(f'{label}: {meta["commit"]} {meta["timestamp"]} {meta["backend"]} ({rows})')
+    if old['meta']['rows'] != new['meta']['rows'] or old['meta']['backend'] != new['meta']['backend']:
+        print('warning: the runs used different data sets, numbers are not directly comparable')
+    print(f'{"scenario":20} ' + ' '.join(f'{title:>22}' for _, title in COMPARED))
+    for name, result in new['scenarios'].items():
+        before = old['scenarios'].get(name)
+        if before is None:
+            continue
+        cells = []
+        for key, _ in COMPARED:
+            change = f'{(result[key] - before[key]) / before[key] * 100:+.0f}%' if before[key] else 'n/a'
+            cells.append(f'{before[key]:.1f} -> {result[key]:.1f} ({change})'.rjust(22))
+        print(f'{name:20} ' + ' '.join(cells))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('old')
+    parser.add_argument('new')
+    args = parser.parse_args()
+    print_comparison(load(args.old), load(args.new))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+"""
+วัด route จริงของแอปผ่าน Flask test client บนฐานข้อมูลที่สร้างด้วย benchmarks.generate
+
+    python -m benchmarks.scenarios [--requests 20] [--scenario NAME ...] [--page-cache]
+                                   [--upload-latency 0.0] [--database-url URL] [--output FILE] [--compare OLD.json]
+
+scenario: หน้าแรก, หน้าหน่วยงานที่มีข้อมูลมากที่สุด/น้อยที่สุด, แท็บความรู้ของหน่วยงานที่ใหญ่ที่สุด, ค้นหา, รายการของแอดมิน, แดชบอร์ด
+และอัปโหลด guideline ผ่าน stub uploader (รันท้ายสุดเพราะเพิ่มข้อมูลลงฐานข้อมูล)
+ปิด page cache และ cache สถิติแดชบอร์ดเป็นค่าเริ่มต้น เพื่อให้ทุก request ทำงานกับฐานข้อมูลจริง
+ผลเขียนเป็น JSON ใน benchmarks/results/ (ดู benchmarks.report)
+"""
+
+import argparse
+import io
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+from benchmarks import report
+from benchmarks.generate import DEFAULT_DATABASE_URL, ROOT
+
+SCENARIOS = ('home', 'department_large', 'department_small', 'department_tab', 'search', 'admin_guidelines', 'admin_knowledge',
+             'admin_activities', 'admin_dashboard', 'upload_guideline')
+
+
+class QueryCounter:
+    """นับ statement ที่ส่งไปฐานข้อมูล (ทุก engine) ระหว่างรัน scenario"""
+
+    def __init__(self):
+        self.count = 0
+
+    def install(self):
+        from sqlalchemy import event
+        from sqlalchemy.engine import Engine
+
+        event.listen(Engine, 'before_cursor_execute', self._count)
+
+    def _count(self, *args):
+        self.count += 1
+
+
+def build_requests(m, upload_kb):
+    """คืน {scenario: (ต้องล็อกอินไหม, ฟังก์ชันที่รับ client และลำดับครั้งแล้วส่ง request)}"""
+    with m.app.app_context():
+        counts = m.db.session.execute(
+            m.db.select(m.Department.id, m.db.func.count(m.Guideline.id))
+            .outerjoin(m.Guideline, m.Guideline.department_id == m.Department.id)
+            .group_by(m.Department.id)
+            .order_by(m.db.func.count(m.Guideline.id).desc(), m.Department.id)
+        ).all()
+    largest, smallest = counts[0][0], counts[-1][0]
+    terms = ('เบาหวาน', 'การดูแล ผู้ป่วย', 'sepsis', 'HbA1c', 'การฟื้นฟู')
+    payload = b'%PDF-1.4 ' + os.urandom(max(upload_kb, 1) * 1024)
+
+    def upload(client, n):
+        return client.post('/admin/upload_guideline', data={
+            'department_id': largest, 'title': f'benchmark upload {n}', 'description': '',
+            'upload_type': 'file', 'file': (io.BytesIO(payload), f'benchmark-{n}.pdf'),
+        }, content_type='multipart/form-data')
+
+    return {
+        'home': (False, lambda client, n: client.get('/')),
+        'department_large': (False, lambda client, n: client.get(f'/department/{largest}')),
+        'department_small': (False, lambda client, n: client.get(f'/department/{smallest}')),
+        'department_tab': (False, lambda client, n: client.get(f'/department/{largest}/tab/knowledge')),
+        'search': (False, lambda client, n: client.get('/search', query_string={'q': terms[n % len(terms)]})),
+        'admin_guidelines': (True, lambda client, n: client.get('/admin/guidelines')),
+        'admin_knowledge': (True, lambda client, n: client.get('/admin/knowledge')),
+        'admin_activities': (True, lambda client, n: client.get('/admin/activities')),
+        'admin_dashboard': (True, lambda client, n: client.get('/admin/dashboard')),
+        'upload_guideline': (True, upload),
+    }
+
+
+def row_counts(m):
+    with m.app.app_context():
+        return {model.__tablename__: m.db.session.scalar(m.db.select(m.db.func.count()).select_from(model))
+                for model in (m.Department, m.Guideline, m.Knowledge, m.Activity)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--requests', type=int, default=20, help='จำนวน request ที่วัดต่อ scenario')
+    parser.add_argument('--warmup', type=int, default=1, help='request แรกที่ไม่นับ (โหลด template, เปิด connection)')
+    parser.add_argument('--scenario', action='append', dest='scenarios', choices=SCENARIOS)
+    parser.add_argument('--page-cache', action='store_true', help='ใช้ page cache ตาม PAGE_CACHE_BACKEND')
+    parser.add_argument('--upload-latency', type=float, default=0.0, help='เวลาที่ stub จำลองการอัปโหลดต่อไฟล์ (วินาที)')
+    parser.add_argument('--upload-kb', type=int, default=256)
+    parser.add_argument('--database-url', default=os.getenv('DATABASE_URL') or DEFAULT_DATABASE_URL)
+    parser.add_argument('--output', help='ไฟล์ JSON ของผล (ค่าเริ่มต้น benchmarks/results/<เวลา>-<commit>.json)')
+    parser.add_argument('--compare', metavar='OLD_JSON', help='เปรียบเทียบกับผลรอบก่อน')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    os.environ.update({
+        'DATABASE_URL': args.database_url,
+        'UPLOAD_BACKEND': 'stub',
+        'UPLOAD_MODE': 'sync',
+        'UPLOAD_STUB_LATENCY': str(args.upload_latency),
+        'UPLOAD_SPOOL_DIR': os.path.join(workdir, 'spool'),
+        'STORAGE_ROOT': os.path.join(workdir, 'storage'),
+        'STATS_CACHE_TTL': '0',
+        'SLOW_REQUEST_LOG': os.devnull,
+    })
+    if not args.page_cache:
+        os.environ['PAGE_CACHE_BACKEND'] = 'none'
+    sys.path.insert(0, ROOT)
+    import app as m
+
+    requests = build_requests(m, args.upload_kb)
+    counter = QueryCounter()
+    counter.install()
+    anonymous, admin = m.app.test_client(), m.app.test_client()
+    admin.post('/admin/login', data={'username': os.getenv('ADMIN_USERNAME', 'admin'),
+                                     'password': os.getenv('ADMIN_PASSWORD', 'admin123')})
+
+    with m.app.app_context():
+        engine_url = m.db.engine.url
+    result = {
+        'meta': {
+            'commit': report.git_commit(),
+            'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'python': sys.version.split()[0],
+            'backend': engine_url.get_backend_name(),
+            'database': engine_url.render_as_string(hide_password=True),
+            'rows': row_counts(m),
+            'requests_per_scenario': args.requests,
+            'page_cache': args.page_cache,
+            'instrumentation': m.app.config['INSTRUMENTATION'],
+        },
+        'scenarios': {},
+    }
+    for name in args.scenarios or SCENARIOS:
+        login, send = requests[name]
+        client = admin if login else anonymous
+        for n in range(args.warmup):
+            send(client, -n - 1)
+        latencies, errors = [], 0
+        counter.count = 0
+        for n in range(args.requests):
+            started = time.perf_counter()
+            status = send(client, n).status_code
+            latencies.append((time.perf_counter() - started) * 1000)
+            if status >= 400:
+                errors += 1
+        result['scenarios'][name] = report.summarize(latencies, counter.count, errors)
+        print(f'  {name}: p50 {result["scenarios"][name]["p50_ms"]:.1f} ms', flush=True)
+
+    report.print_table(result)
+    print(f'Report written to {report.write(result, args.output)}')
+    if args.compare:
+        report.print_comparison(report.load(args.compare), result)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+"""
+วัดเวลาตอบของหน้า public บน SQLite ขณะมีแอดมินเขียนข้อมูลพร้อมกัน เทียบ PRAGMA เดิมกับค่าที่ปรับแล้ว
+
+    python -m benchmarks.sqlite_concurrency [--readers 3] [--writers 1] [--seconds 10] [--batch 2000]
+
+ผู้อ่านเปิด / และ /department/<id> วนไปเรื่อยๆ (ปิด page cache) ผู้เขียนเพิ่ม knowledge ทีละ --batch แถวต่อ commit
+(transaction เขียนขนาดใหญ่ที่ถือ lock นานพอให้เห็นผล) แต่ละโหมดใช้ไฟล์ฐานข้อมูลใหม่ใน process ใหม่
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MODES = {
+    # ค่าเริ่มต้นของ SQLite ก่อนมี SQLITE_* (rollback journal, synchronous=FULL, cache ~2MB)
+    'legacy': {'SQLITE_JOURNAL_MODE': 'DELETE', 'SQLITE_SYNCHRONOUS': 'FULL', 'SQLITE_MMAP_SIZE': '',
+               'SQLITE_CACHE_SIZE': '', 'SQLITE_TEMP_STORE': '', 'SQLITE_BUSY_TIMEOUT': '',
+               'SQLITE_READ_ONLY_ENGINE': 'false'},
+    'wal': {'SQLITE_READ_ONLY_ENGINE': 'false'},
+    'wal+ro': {},
+}
+
+# รันใน process ลูกหนึ่งตัวต่อผู้อ่าน/ผู้เขียน (เหมือน gunicorn worker ที่ใช้ไฟล์ฐานข้อมูลเดียวกัน)
+# ไม่ใช้ thread เพราะ GIL และการ render template จะกลบเวลาที่รอ lock ของ SQLite จนวัดไม่ได้
+PROBE = '''
+import json, sys, time
+import app as m
+
+role, index, seconds, batch = sys.argv[1], int(sys.argv[2]), float(sys.argv[3]), int(sys.argv[4])
+with m.app.app_context():
+    department_ids = [row.id for row in m.Department.query.all()]
+client = m.app.test_client()
+latencies, errors, commits = [], 0, 0
+stop = time.perf_counter() + seconds
+n = 0
+while time.perf_counter() < stop:
+    dept_id = department_ids[(index + n) % len(department_ids)]
+    started = time.perf_counter()
+    if role == 'read':
+        try:
+            if client.get('/' if n % 4 == 0 else f'/department/{dept_id}').status_code != 200:
+                errors += 1
+        except Exception:
+            errors += 1
+        latencies.append((time.perf_counter() - started) * 1000)
+    else:
+        with m.app.app_context():
+            try:
+                m.db.session.add_all(
+                    m.Knowledge(department_id=dept_id, title=f'bench {index}-{n}-{i}', content='x' * 400)
+                    for i in range(batch)
+                )
+                m.db.session.commit()
+                commits += 1
+            except Exception:
+                m.db.session.rollback()
+                errors += 1
+    n += 1
+print(json.dumps({'latencies': latencies, 'errors': errors, 'commits': commits}))
+'''
+
+
+def percentile(values, fraction):
+    return values[max(0, int(len(values) * fraction) - 1)] if values else 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--readers', type=int, default=3)
+    parser.add_argument('--writers', type=int, default=1)
+    parser.add_argument('--seconds', type=int, default=10)
+    parser.add_argument('--batch', type=int, default=2000, help='จำนวนแถวต่อหนึ่ง commit ของผู้เขียน')
+    parser.add_argument('--mode', action='append', dest='modes', choices=sorted(MODES))
+    args = parser.parse_args()
+
+    print(f'{args.readers} readers, {args.writers} writers x {args.batch} rows/commit, {args.seconds} s')
+    print(f'{"mode":8} {"reads/s":>8} {"p50 ms":>8} {"p95 ms":>8} {"p99 ms":>8} {"read err":>9} '
+          f'{"commits/s":>10} {"write err":>10}')
+    for mode in args.modes or list(MODES):
+        env = dict(os.environ, DATABASE_URL='sqlite:///' + os.path.join(tempfile.mkdtemp(), 'concurrency.db'),
+                   UPLOAD_BACKEND='stub', UPLOAD_MODE='sync', PAGE_CACHE_BACKEND='none', **MODES[mode])
+        subprocess.run([sys.executable, '-c', 'import app'], cwd=ROOT, env=env, check=True, capture_output=True)
+        roles = [('read', i) for i in range(args.readers)] + [('write', i) for i in range(args.writers)]
+        processes = [
+            (role, subprocess.Popen(
+                [sys.executable, '-c', PROBE, role, str(index), str(args.seconds), str(args.batch)],
+                cwd=ROOT, env=env, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True,
+            ))
+            for role, index in roles
+        ]
+        latencies, read_errors, commits, write_errors = [], 0, 0, 0
+        for role, process in processes:
+            result = json.loads(process.communicate()[0].strip().splitlines()[-1])
+            if role == 'read':
+                latencies += result['latencies']
+                read_errors += result['errors']
+            else:
+                commits += result['commits']
+                write_errors += result['errors']
+        latencies.sort()
+        print(f'{mode:8} {len(latencies) / args.seconds:8.0f} {statistics.median(latencies):8.1f} '
+              f'{percentile(latencies, 0.95):8.1f} {percentile(latencies, 0.99):8.1f} {read_errors:9d} '
+              f'{commits / args.seconds:10.1f} {write_errors:10d}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+"""
+วัด throughput ของ /storage/ เทียบวิธีเดิม (os.path.exists + send_file) กับ StorageFileServer
+
+    python -m benchmarks.storage [--requests 2000] [--file uploads/images/department_icons.svg]
+
+ใช้ test client ของ Flask จึงวัดเฉพาะงานฝั่งแอป (ไม่รวม network และ web server)
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+# ใช้ฐานข้อมูลชั่วคราว ไม่ให้ไปแตะ hospital.db ตอน import app
+os.environ.setdefault('DATABASE_URL', 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.db'))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import abort, send_file  # noqa: E402
+
+from app import app, storage_server  # noqa: E402
+
+
+@app.route('/legacy-storage/<path:filename>')
+def legacy_storage(filename):
+    """สำเนาของ serve_storage เดิม ไว้เป็น baseline"""
+    file_path = os.path.join('storage', filename)
+    if os.path.exists(file_path):
+        return send_file(file_path)
+    abort(404)
+
+
+def run(client, url, count, headers=None):
+    response = client.get(url, headers=headers)
+    assert response.status_code in (200, 206, 304), (url, response.status_code)
+    response.close()
+    started = time.perf_counter()
+    for _ in range(count):
+        # อ่าน body ให้ครบ เหมือน client จริงที่ต้องรับไฟล์ทั้งไฟล์
+        response = client.get(url, headers=headers)
+        response.get_data()
+        response.close()
+    elapsed = time.perf_counter() - started
+    return count / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--file', action='append', dest='files')
+    args = parser.parse_args()
+    files = args.files or ['uploads/images/department_icons.svg', 'uploads/guidelines/dm/ADA2005.pdf']
+
+    client = app.test_client()
+    os.chdir(app.root_path)
+    print(f'{"file":45} {"mode":22} {"req/s":>10}')
+    for name in files:
+        size = os.path.getsize(os.path.join(storage_server.root, name))
+        label = f'{name} ({size // 1024} KB)'
+        etag = client.get(f'/storage/{name}').headers['ETag']
+
+        storage_server.accel_mode = ''
+        hot_cache, storage_server.hot_cache = storage_server.hot_cache, None
+        modes = [
+            ('legacy send_file', lambda: run(client, f'/legacy-storage/{name}', args.requests)),
+            ('send_file + etag', lambda: run(client, f'/storage/{name}', args.requests)),
+        ]
+        for mode, bench in modes:
+            print(f'{label:45} {mode:22} {bench():10.0f}')
+        storage_server.hot_cache = hot_cache
+
+        if size <= storage_server.hot_file_max_size:
+            print(f'{label:45} {"hot cache":22} {run(client, f"/storage/{name}", args.requests):10.0f}')
+        print(f'{label:45} {"304 revalidation":22} '
+              f'{run(client, f"/storage/{name}", args.requests, {"If-None-Match": etag}):10.0f}')
+        storage_server.accel_mode = 'x-accel'
+        print(f'{label:45} {"x-accel-redirect":22} {run(client, f"/storage/{name}", args.requests):10.0f}')
+        storage_server.accel_mode = ''
+
+
+if __name__ == '__main__':
+    main()
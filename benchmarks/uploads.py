@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+"""
+วัดเวลาตอบของหน้าอัปโหลด guideline เทียบโหมด sync กับ async ด้วย stub uploader (ไม่ใช้ network)
+
+    python -m benchmarks.uploads [--uploads 20] [--size-kb 2048] [--latency 0.5] [--failure-rate 0.0]
+
+latency คือเวลาที่ stub จำลองการส่งไฟล์ขึ้น Cloudinary ต่อไฟล์
+"""
+
+import argparse
+import io
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+parser.add_argument('--uploads', type=int, default=20)
+parser.add_argument('--size-kb', type=int, default=2048)
+parser.add_argument('--latency', type=float, default=0.5)
+parser.add_argument('--failure-rate', type=float, default=0.0)
+args = parser.parse_args()
+
+workdir = tempfile.mkdtemp()
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(workdir, 'bench.db')
+os.environ['UPLOAD_BACKEND'] = 'stub'
+os.environ['UPLOAD_STUB_LATENCY'] = str(args.latency)
+os.environ['UPLOAD_STUB_FAILURE_RATE'] = str(args.failure_rate)
+os.environ['UPLOAD_RETRY_BASE'] = '0.1'
+os.environ['UPLOAD_SPOOL_DIR'] = os.path.join(workdir, 'spool')
+os.environ['STORAGE_ROOT'] = os.path.join(workdir, 'storage')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import Department, UploadJob, app, db, upload_queue  # noqa: E402
+
+
+def run(mode):
+    upload_queue.mode = mode
+    client = app.test_client()
+    client.post('/admin/login', data={
+        'username': os.getenv('ADMIN_USERNAME', 'admin'),
+        'password': os.getenv('ADMIN_PASSWORD', 'admin123'),
+    })
+    with app.app_context():
+        department_id = db.session.query(Department.id).first()[0]
+        first_job = (db.session.query(db.func.max(UploadJob.id)).scalar() or 0) + 1
+    payload = b'0' * (args.size_kb * 1024)
+
+    latencies = []
+    started = time.perf_counter()
+    for i in range(args.uploads):
+        request_started = time.perf_counter()
+        response = client.post('/admin/upload_guideline', data={
+            'department_id': department_id, 'title': f'bench {mode} {i}', 'description': '',
+            'upload_type': 'file', 'file': (io.BytesIO(payload), f'bench-{i}.pdf'),
+        }, content_type='multipart/form-data')
+        assert response.status_code == 302, response.status_code
+        latencies.append(time.perf_counter() - request_started)
+    upload_queue.shutdown(wait=True)
+    total = time.perf_counter() - started
+
+    with app.app_context():
+        statuses = dict(db.session.query(UploadJob.status, db.func.count()).where(
+            UploadJob.id >= first_job).group_by(UploadJob.status).all())
+    latencies.sort()
+    print(f'{mode:6} request p50 {statistics.median(latencies) * 1000:8.1f} ms'
+          f'  p95 {latencies[int(len(latencies) * 0.95) - 1] * 1000:8.1f} ms'
+          f'  all uploads finished in {total:6.2f} s  jobs {statuses}')
+
+
+if __name__ == '__main__':
+    print(f'{args.uploads} uploads x {args.size_kb} KB, stub latency {args.latency}s, '
+          f'{app.config["UPLOAD_WORKERS"]} workers')
+    run('sync')
+    run('async')
@@ -0,0 +1,210 @@
+# -*- coding: utf-8 -*-
+"""
+นำเข้า guideline / knowledge / activity จำนวนมากจาก manifest (CSV หรือ JSON)
+
+manifest หนึ่งแถวต่อหนึ่งรายการ มีคอลัมน์
+- kind: guideline, knowledge หรือ activity
+- department: รหัสหน่วยงาน (Department.code)
+- title, description
+- file: ชื่อไฟล์ใน ZIP (เทียบกับโฟลเดอร์ที่มี manifest) หรือ link และ link_type สำหรับลิงก์ภายนอก
+- date: YYYY-MM-DD หรือ DD/MM/YYYY (วันที่อัปโหลดของ guideline, วันที่สร้างของ knowledge, วันที่จัดกิจกรรม)
+- key: (ไม่บังคับ) รหัสของแถวสำหรับตรวจว่าเคยนำเข้าแล้ว ถ้าไม่ระบุจะคำนวณจาก kind/department/title/file/link
+
+ไฟล์นี้อ่านและตรวจ manifest และแตกไฟล์จาก ZIP ลง spool เท่านั้น
+การอัปโหลดและบันทึกลงฐานข้อมูลอยู่ใน run_bulk_import ของ app.py
+"""
+
+import csv
+import hashlib
+import io
+import json
+import os
+import zipfile
+from datetime import datetime
+
+from werkzeug.security import safe_join
+
+from uploads import spool_path_for
+
+KINDS = ('guideline', 'knowledge', 'activity')
+MANIFEST_NAMES = ('manifest.csv', 'manifest.json')
+DATE_FORMATS = ('%Y-%m-%d', '%d/%m/%Y')
+# ความยาวคำอธิบายสูงสุดเท่ากับที่ฟอร์มของแอดมินกำหนด
+DESCRIPTION_LIMITS = {'knowledge': 500, 'activity': 300}
+TITLE_LIMIT = 200
+
+
+class ManifestError(Exception):
+    """อ่าน manifest ไม่ได้ทั้งไฟล์ (ไม่พบ manifest, รูปแบบผิด)"""
+
+
+class ImportRow:
+    """หนึ่งแถวของ manifest หลังตรวจแล้ว ถ้าข้อมูลไม่ถูกต้อง error จะมีข้อความและแถวนี้จะไม่ถูกนำเข้า"""
+
+    def __init__(self, number, data):
+        def field(name):
+            value = data.get(name)
+            return str(value).strip() if value is not None else ''
+
+        self.number = number
+        self.kind = field('kind').lower()
+        self.department = field('department')
+        self.title = field('title')
+        self.description = field('description')
+        self.file = field('file')
+        self.link = field('link')
+        self.link_type = field('link_type') or 'Other'
+        self.date = None
+        self.error = self._validate(field('date'))
+        identity = '\0'.join((self.kind, self.department.lower(), self.title, self.file or self.link))
+        self.key = field('key')[:64] or hashlib.sha256(identity.encode('utf-8')).hexdigest()
+
+    def _validate(self, raw_date):
+        if self.kind not in KINDS:
+            return f'kind ต้องเป็น {", ".join(KINDS)}'
+        if not self.department:
+            return 'ไม่ได้ระบุรหัสหน่วยงาน'
+        if not self.title:
+            return 'ไม่ได้ระบุชื่อเรื่อง'
+        if len(self.title) > TITLE_LIMIT:
+            return f'ชื่อเรื่องยาวเกิน {TITLE_LIMIT} ตัวอักษร'
+        limit = DESCRIPTION_LIMITS.get(self.kind)
+        if limit and len(self.description) > limit:
+            return f'คำอธิบายยาวเกิน {limit} ตัวอักษร'
+        if self.file and self.link:
+            return 'ระบุได้อย่างใดอย่างหนึ่งระหว่าง file และ link'
+        if self.kind == 'guideline' and not (self.file or self.link):
+            return 'guideline ต้องมี file หรือ link'
+        if raw_date:
+            for fmt in DATE_FORMATS:
+                try:
+                    self.date = datetime.strptime(raw_date, fmt)
+                    break
+                except ValueError:
+                    continue
+            else:
+                return f'รูปแบบวันที่ไม่ถูกต้อง: {raw_date}'
+        elif self.kind == 'activity':
+            return 'activity ต้องมีวันที่ (date)'
+        return None
+
+
+def parse_manifest(stream, name):
+    """อ่าน manifest จาก binary stream ตามนามสกุลของ name คืน list ของ ImportRow"""
+    try:
+        if name.lower().endswith('.json'):
+            data = json.load(io.TextIOWrapper(stream, encoding='utf-8-sig'))
+            if isinstance(data, dict):
+                data = data.get('items')
+            if not isinstance(data, list) or not all(isinstance(item, dict) for item in data):
+                raise ManifestError('manifest JSON ต้องเป็น list ของ object (หรือ {"items": [...]})')
+            records = [{str(k).strip().lower(): v for k, v in item.items()} for item in data]
+        else:
+            reader = csv.DictReader(io.TextIOWrapper(stream, encoding='utf-8-sig', newline=''))
+            records = [{(k or '').strip().lower(): v for k, v in item.items()} for item in reader]
+    except (UnicodeDecodeError, ValueError, csv.Error) as e:
+        raise ManifestError(f'อ่าน manifest ไม่ได้: {e}') from e
+    return [ImportRow(number, record) for number, record in enumerate(records, start=1)]
+
+
+def _copy_to_spool(source, spool_dir, filename, max_size, buffer_size=1024 * 1024):
+    """คัดลอก stream ลง spool พร้อมคำนวณ SHA-256 คืน (path, sha256) หยุดเมื่อเกิน max_size"""
+    path = spool_path_for(spool_dir, filename)
+    digest = hashlib.sha256()
+    written = 0
+    try:
+        with open(path, 'wb') as f:
+            for data in iter(lambda: source.read(buffer_size), b''):
+                written += len(data)
+                if written > max_size:
+                    raise ValueError(f'ไฟล์ {filename} มีขนาดใหญ่เกินกำหนด')
+                digest.update(data)
+                f.write(data)
+    except Exception:
+        os.unlink(path)
+        raise
+    return path, digest.hexdigest()
+
+
+class ZipImportSource:
+    """ZIP ที่มี manifest.csv หรือ manifest.json (อยู่ที่ root หรือในโฟลเดอร์ชั้นแรกก็ได้) พร้อมไฟล์ที่อ้างถึง"""
+
+    def __init__(self, path):
+        self.zip = zipfile.ZipFile(path)
+        manifests = [name for name in self.zip.namelist()
+                     if os.path.basename(name).lower() in MANIFEST_NAMES and name.count('/') <= 1]
+        if not manifests:
+            self.zip.close()
+            raise ManifestError(f'ไม่พบ {" หรือ ".join(MANIFEST_NAMES)} ใน ZIP')
+        self.manifest = min(manifests, key=lambda name: name.count('/'))
+        self.base = os.path.dirname(self.manifest)
+
+    def read_rows(self):
+        with self.zip.open(self.manifest) as stream:
+            return parse_manifest(stream, self.manifest)
+
+    def _info(self, name, max_size):
+        member = f'{self.base}/{name}' if self.base else name
+        try:
+            info = self.zip.getinfo(member)
+        except KeyError:
+            raise ValueError(f'ไม่พบไฟล์ {name} ใน ZIP') from None
+        if info.file_size > max_size:
+            raise ValueError(f'ไฟล์ {name} มีขนาดใหญ่เกินกำหนด')
+        return info
+
+    def file_size(self, name, max_size):
+        """ขนาดไฟล์ (โยน ValueError ถ้าไม่พบหรือใหญ่เกิน max_size)"""
+        return self._info(name, max_size).file_size
+
+    def extract(self, name, spool_dir, max_size):
+        """แตกไฟล์ลง spool คืน (path, sha256)"""
+        with self.zip.open(self._info(name, max_size)) as stream:
+            return _copy_to_spool(stream, spool_dir, os.path.basename(name), max_size)
+
+    def close(self):
+        self.zip.close()
+
+
+class ManifestImportSource:
+    """manifest ที่อยู่ในโฟลเดอร์ ไฟล์ที่อ้างถึงอ่านจากโฟลเดอร์เดียวกัน (ใช้กับ CLI)
+
+    allow_files=False ใช้กับ manifest ที่อัปโหลดผ่านหน้าเว็บ ซึ่งนำเข้าได้เฉพาะลิงก์
+    """
+
+    def __init__(self, path, allow_files=True, name=None):
+        self.path = path
+        self.name = name or path  # ชื่อที่ใช้ดูนามสกุล (ชื่อไฟล์เดิมที่อัปโหลด)
+        self.base = os.path.dirname(os.path.abspath(path)) if allow_files else None
+
+    def read_rows(self):
+        with open(self.path, 'rb') as stream:
+            return parse_manifest(stream, self.name)
+
+    def _path(self, name, max_size):
+        path = safe_join(self.base, name) if self.base else None
+        if path is None or not os.path.isfile(path):
+            raise ValueError(f'ไม่พบไฟล์ {name}')
+        if os.path.getsize(path) > max_size:
+            raise ValueError(f'ไฟล์ {name} มีขนาดใหญ่เกินกำหนด')
+        return path
+
+    def file_size(self, name, max_size):
+        return os.path.getsize(self._path(name, max_size))
+
+    def extract(self, name, spool_dir, max_size):
+        with open(self._path(name, max_size), 'rb') as stream:
+            return _copy_to_spool(stream, spool_dir, os.path.basename(name), max_size)
+
+    def close(self):
+        pass
+
+
+def open_import_source(path, allow_files=True, filename=None):
+    """เปิดไฟล์นำเข้า: ZIP หรือ manifest .csv/.json (ดูนามสกุลจาก filename ถ้าระบุ ไม่เช่นนั้นจาก path)"""
+    if zipfile.is_zipfile(path):
+        return ZipImportSource(path)
+    name = filename or path
+    if name.lower().endswith(('.csv', '.json')):
+        return ManifestImportSource(path, allow_files=allow_files, name=name)
+    raise ManifestError('ไฟล์นำเข้าต้องเป็น ZIP หรือ manifest .csv/.json')
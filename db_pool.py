@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+"""
+ตั้งค่า connection pool ของ SQLAlchemy ตามสภาพแวดล้อมที่รัน (profile)
+
+- default: QueuePool ขนาดปกติของ SQLAlchemy (5 + overflow 10) สำหรับ server ที่รันต่อเนื่อง
+- serverless: Vercel หนึ่ง instance รับทีละ request เก็บ connection ไว้น้อย และ recycle ก่อนที่ Neon
+  จะตัด connection ที่ idle ทิ้ง (ไม่อย่างนั้น query แรกหลังเงียบไปสักพักจะ error)
+- pgbouncer: endpoint แบบ pooled ของ Neon (host มี -pooler) ซึ่งเป็น PgBouncer โหมด transaction
+  ปิด prepared statement ฝั่ง server (PgBouncer ส่ง statement ของ client เดียวกันไปคนละ backend ได้)
+- null: NullPool เปิด connection ใหม่ทุกครั้งที่ใช้และปิดเมื่อคืน ไม่มี connection ค้างระหว่าง request เลย
+
+ทุก profile ใช้ pool_pre_ping (ยกเว้น null) เพื่อทิ้ง connection ที่ถูกตัดไปแล้วก่อนใช้งาน
+PoolMonitor นับจำนวน connection ที่เปิดใหม่/checkout/invalidate จาก pool events ไว้ดูสถิติ
+และจับเวลาที่แต่ละ checkout รอ connection (pool เต็ม, pre-ping, เปิด connection ใหม่)
+
+SQLite (เครื่อง server ในโรงพยาบาลที่ไม่ได้ตั้ง DATABASE_URL) ตั้ง PRAGMA ทุกครั้งที่เปิด connection
+ด้วย install_sqlite_pragmas: WAL ให้ผู้อ่านไม่ต้องรอ commit ของแอดมิน, synchronous=NORMAL (ปลอดภัยใน WAL),
+mmap/cache ขนาดใหญ่ขึ้น และ busy_timeout ให้รอ lock แทนการ error "database is locked" ทันที
+sqlite_read_engine สร้าง engine แบบ mode=ro สำหรับหน้า public ที่อ่านอย่างเดียว
+"""
+
+import threading
+import time
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import URL, make_url
+from sqlalchemy.pool import NullPool
+
+POOL_PROFILES = {
+    'default': {'pool_pre_ping': True, 'pool_recycle': 1800},
+    'serverless': {'pool_size': 1, 'max_overflow': 2, 'pool_timeout': 10, 'pool_pre_ping': True, 'pool_recycle': 240},
+    'pgbouncer': {'pool_size': 1, 'max_overflow': 4, 'pool_timeout': 10, 'pool_pre_ping': True, 'pool_recycle': 240},
+    'null': {'poolclass': NullPool},
+}
+
+# TCP keepalive ให้ระบบปฏิบัติการตรวจพบ connection ที่ถูกตัดระหว่าง idle (libpq/psycopg2)
+POSTGRES_CONNECT_ARGS = {'connect_timeout': 10, 'keepalives': 1, 'keepalives_idle': 30,
+                         'keepalives_interval': 10, 'keepalives_count': 3}
+
+
+def normalize_database_url(url):
+    """แปลง DATABASE_URL ของ PostgreSQL ที่ไม่ได้ระบุ driver ให้ใช้ psycopg2 ตาม requirements.txt
+
+    Neon/Heroku ให้ URL แบบ postgres:// ซึ่ง SQLAlchemy ไม่รู้จัก และตั้งแต่ SQLAlchemy 2.1
+    postgresql:// หมายถึง psycopg 3 ซึ่งไม่ได้ติดตั้งไว้
+    """
+    for scheme in ('postgres://', 'postgresql://'):
+        if url and url.startswith(scheme):
+            return 'postgresql+psycopg2://' + url[len(scheme):]
+    return url
+
+
+def default_pool_profile(url, serverless=False):
+    """เลือก profile จาก URL: SQLite ใช้ default, host ของ Neon ที่มี -pooler ใช้ pgbouncer"""
+    url = make_url(url)
+    if url.get_backend_name() != 'postgresql':
+        return 'default'
+    if '-pooler' in (url.host or ''):
+        return 'pgbouncer'
+    return 'serverless' if serverless else 'default'
+
+
+def engine_options(url, profile, overrides=None):
+    """SQLALCHEMY_ENGINE_OPTIONS ของ profile นี้ (overrides คือค่าจาก environment ที่ไม่ใช่ None)"""
+    if profile not in POOL_PROFILES:
+        raise ValueError(f'Unknown DB_POOL_PROFILE: {profile}')
+    url = make_url(url)
+    options = dict(POOL_PROFILES[profile])
+    if profile != 'null':
+        options.update({key: value for key, value in (overrides or {}).items() if value is not None})
+
+    if url.get_backend_name() == 'postgresql':
+        connect_args = {}
+        if url.get_driver_name() in ('psycopg2', 'psycopg'):
+            connect_args.update(POSTGRES_CONNECT_ARGS)
+        if profile == 'pgbouncer' and url.get_driver_name() == 'psycopg':
+            connect_args['prepare_threshold'] = None  # psycopg 3 (psycopg2 ไม่ใช้ prepared statement อยู่แล้ว)
+        if connect_args:
+            options['connect_args'] = connect_args
+    return options
+
+
+def is_sqlite_file(url):
+    url = make_url(url)
+    return url.get_backend_name() == 'sqlite' and url.database not in (None, '', ':memory:')
+
+
+def install_sqlite_pragmas(engine, pragmas, read_only=False):
+    """ตั้ง PRAGMA ทุกครั้งที่ engine เปิด connection ใหม่ (ค่าที่เป็น None หรือ '' ข้าม)
+
+    connection แบบ read-only เปลี่ยน journal_mode ไม่ได้ (เป็นค่าของไฟล์ ผู้เขียนตั้งไว้แล้ว) จึงข้าม
+    และเปิด query_only กันการเขียนโดยไม่ตั้งใจ
+    """
+    statements = [f'PRAGMA {name}={value}' for name, value in pragmas.items()
+                  if value not in (None, '') and not (read_only and name == 'journal_mode')]
+    if read_only:
+        statements.append('PRAGMA query_only=ON')
+
+    @event.listens_for(engine, 'connect')
+    def _set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for statement in statements:
+                cursor.execute(statement)
+        finally:
+            cursor.close()
+
+
+def sqlite_read_engine(url, pragmas, **options):
+    """engine อ่านอย่างเดียวของไฟล์ SQLite เดียวกับ url (เปิดด้วย URI mode=ro)"""
+    database = make_url(url).database
+    engine = create_engine(URL.create('sqlite', database=f'file:{database}', query={'mode': 'ro', 'uri': 'true'}),
+                           **options)
+    install_sqlite_pragmas(engine, pragmas, read_only=True)
+    return engine
+
+
+class PoolMonitor:
+    """นับเหตุการณ์ของ pool (ทุก thread ใช้ร่วมกัน) และรวมกับสถานะปัจจุบันของ pool ใน stats()"""
+
+    def __init__(self, profile, on_checkout=None):
+        self.profile = profile
+        self.on_checkout = on_checkout  # รับเวลารอ checkout (วินาที) เช่น histogram ของ metrics
+        self._lock = threading.Lock()
+        self._engines = []
+        self.connects = 0
+        self.connect_seconds = 0.0
+        self.checkouts = 0
+        self.checkout_seconds = 0.0
+        self.invalidations = 0
+
+    def _add(self, **counts):
+        with self._lock:
+            for name, value in counts.items():
+                setattr(self, name, getattr(self, name) + value)
+
+    def install(self, engine):
+        pending = {}
+
+        @event.listens_for(engine, 'do_connect')
+        def _before_connect(dialect, conn_rec, cargs, cparams):
+            pending[id(conn_rec)] = time.perf_counter()
+
+        @event.listens_for(engine, 'connect')
+        def _on_connect(dbapi_connection, connection_record):
+            started = pending.pop(id(connection_record), None)
+            elapsed = time.perf_counter() - started if started is not None else 0.0
+            self._add(connects=1, connect_seconds=elapsed)
+
+        @event.listens_for(engine, 'checkout')
+        def _on_checkout(dbapi_connection, connection_record, connection_proxy):
+            self._add(checkouts=1)
+
+        @event.listens_for(engine, 'invalidate')
+        def _on_invalidate(dbapi_connection, connection_record, exception):
+            self._add(invalidations=1)
+
+        # pool ไม่มี event ก่อนเริ่ม checkout จึงจับเวลา Pool.connect() ด้วย subclass ของ class เดิม
+        # (recreate() ตอน dispose สร้าง pool ใหม่จาก class เดียวกัน จึงยังจับเวลาอยู่)
+        monitor = self
+
+        def connect(pool):
+            started = time.perf_counter()
+            try:
+                return super(timed_class, pool).connect()
+            finally:
+                monitor._checked_out(time.perf_counter() - started)
+
+        pool_class = type(engine.pool)
+        timed_class = type(f'Timed{pool_class.__name__}', (pool_class,), {'connect': connect})
+        engine.pool.__class__ = timed_class
+        self._engines.append(engine)
+
+    def _checked_out(self, seconds):
+        self._add(checkout_seconds=seconds)
+        if self.on_checkout is not None:
+            self.on_checkout(seconds)
+
+    def stats(self):
+        with self._lock:
+            stats = {
+                'profile': self.profile,
+                'connects': self.connects,
+                'connect_ms_avg': round(self.connect_seconds * 1000 / self.connects, 2) if self.connects else None,
+                'checkouts': self.checkouts,
+                'checkout_ms_avg': round(self.checkout_seconds * 1000 / self.checkouts, 3) if self.checkouts else None,
+                'invalidations': self.invalidations,
+            }
+        pools = []
+        for engine in self._engines:
+            pool = engine.pool
+            info = {'url': engine.url.render_as_string(hide_password=True), 'class': type(pool).__mro__[1].__name__}
+            for name in ('size', 'checkedin', 'checkedout', 'overflow'):
+                method = getattr(pool, name, None)
+                if callable(method):
+                    info[name] = method()
+            pools.append(info)
+        stats['pools'] = pools
+        return stats
@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+"""
+ส่ง query อ่านของ route ที่อ่านอย่างเดียวไปยัง engine อ่าน แทน engine หลัก
+
+engine อ่านคือ read replica ของ PostgreSQL (DATABASE_REPLICA_URL) หรือ connection แบบ read-only ของไฟล์ SQLite
+- RoutingSession ใช้เป็น session class ของ Flask-SQLAlchemy เมื่อ session.info['reader'] มี engine
+  (ตั้งโดย decorator read_only_view ใน app.py) query อ่านจะใช้ engine นั้นทั้ง request
+  ส่วน flush และคำสั่ง INSERT/UPDATE/DELETE ยังไปที่ engine หลักเสมอ
+- ReadRouter เลือก engine อ่านแบบวนรอบ และตรวจ lag ของ replica เป็นระยะ replica ที่ตามหลังเกิน max_lag
+  หรือเชื่อมต่อไม่ได้จะถูกข้าม (ถ้าไม่เหลือตัวไหนเลย query อ่านจะใช้ engine หลัก)
+- read-your-writes: หลังแอดมิน commit ให้ app.py จำ WAL position (LSN) ของ primary ไว้ แล้วใช้ caught_up()
+  ตรวจว่า replica เล่นถึงตำแหน่งนั้นแล้วหรือยังก่อนจะกลับไปอ่านจาก replica
+"""
+
+import itertools
+import threading
+import time
+
+from flask_sqlalchemy.session import Session
+from sqlalchemy import text
+
+
+def parse_lsn(lsn):
+    """แปลง LSN ของ PostgreSQL ('16/B374D848') เป็นตัวเลขที่เปรียบเทียบกันได้"""
+    high, low = lsn.split('/')
+    return (int(high, 16) << 32) + int(low, 16)
+
+
+class ReadRouter:
+    """engine อ่านที่ใช้ได้ (ว่าง = อ่านจาก engine หลัก) และสถานะ lag ของ replica แต่ละตัว"""
+
+    def __init__(self, max_lag=None, check_interval=5.0):
+        self.engines = []
+        self.primary = None
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self._status = {}
+        self._checked_at = 0.0
+        self._check_lock = threading.Lock()
+        self._counter = itertools.count()
+
+    def add(self, engine):
+        self.engines.append(engine)
+
+    @property
+    def replicated(self):
+        """มี replica ที่อาจตามหลัง primary (connection read-only ของ SQLite อ่านไฟล์เดียวกันจึงไม่มี lag)"""
+        return any(engine.dialect.name == 'postgresql' for engine in self.engines)
+
+    def reader(self):
+        """engine อ่านตัวถัดไปที่ใช้ได้ หรือ None ถ้าต้องอ่านจาก engine หลัก"""
+        if not self.engines:
+            return None
+        if self.replicated and time.monotonic() - self._checked_at >= self.check_interval:
+            self.refresh()
+        usable = [engine for engine in self.engines if self._status.get(engine, {}).get('usable', True)]
+        if not usable:
+            return None
+        return usable[next(self._counter) % len(usable)]
+
+    def primary_lsn(self):
+        """WAL position ปัจจุบันของ primary (PostgreSQL เท่านั้น)"""
+        if self.primary is None or self.primary.dialect.name != 'postgresql':
+            return None
+        with self.primary.connect() as connection:
+            return connection.execute(text('SELECT pg_current_wal_lsn()::text')).scalar()
+
+    def caught_up(self, engine, lsn):
+        """replica เล่น WAL ถึง lsn แล้วหรือยัง (ตรวจไม่ได้ถือว่ายัง)"""
+        try:
+            with engine.connect() as connection:
+                replayed = connection.execute(text('SELECT pg_last_wal_replay_lsn()::text')).scalar()
+        except Exception:
+            return False
+        # replay LSN เป็น NULL เมื่อ engine นี้ไม่ใช่ standby (เช่นชี้ไปที่ primary เอง)
+        return replayed is None or parse_lsn(replayed) >= parse_lsn(lsn)
+
+    def _measure(self, engine, primary_lsn):
+        status = {'url': engine.url.render_as_string(hide_password=True), 'checked_at': time.time(),
+                  'lag_seconds': 0.0, 'lag_bytes': 0, 'usable': True, 'error': None}
+        if engine.dialect.name != 'postgresql':
+            return status
+        try:
+            with engine.connect() as connection:
+                replayed, replay_age = connection.execute(text(
+                    'SELECT pg_last_wal_replay_lsn()::text, '
+                    'EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())'
+                )).one()
+        except Exception as e:
+            status.update(usable=False, error=str(e).splitlines()[0], lag_seconds=None, lag_bytes=None)
+            return status
+        if replayed is not None and primary_lsn is not None:
+            status['lag_bytes'] = max(0, parse_lsn(primary_lsn) - parse_lsn(replayed))
+            # primary ที่ไม่มีการเขียนเลยทำให้ replay timestamp เก่าไปเรื่อยๆ ทั้งที่ replica ตามทันแล้ว
+            status['lag_seconds'] = float(replay_age or 0) if status['lag_bytes'] else 0.0
+        if self.max_lag is not None and status['lag_seconds'] > self.max_lag:
+            status['usable'] = False
+        return status
+
+    def refresh(self):
+        """วัด lag ของ replica ทุกตัว (ถ้ามี thread อื่นกำลังวัดอยู่ให้ใช้ผลเดิมไปก่อน) คืน list ของสถานะ"""
+        if self._check_lock.acquire(blocking=False):
+            try:
+                try:
+                    primary_lsn = self.primary_lsn()
+                except Exception:
+                    primary_lsn = None
+                self._status = {engine: self._measure(engine, primary_lsn) for engine in self.engines}
+                self._checked_at = time.monotonic()
+            finally:
+                self._check_lock.release()
+        return [self._status[engine] for engine in self.engines if engine in self._status]
+
+
+class RoutingSession(Session):
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        reader = self.info.get('reader')
+        if bind is None and reader is not None and not self._flushing and not getattr(clause, 'is_dml', False):
+            return reader
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+    def commit(self):
+        super().commit()
+        self.info['committed'] = True  # app.py ใช้ตัดสินว่าต้องอ่านจาก primary ต่ออีกระยะ (read-your-writes)
@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+"""
+ส่งไฟล์จากโฟลเดอร์ storage/ (รูปภาพและไฟล์ guideline รุ่นเก่าที่เก็บในเครื่อง)
+
+- stat ไฟล์ครั้งเดียวต่อ request และป้องกัน path traversal ด้วย safe_join
+- ETag แบบ strong: ไฟล์เล็กใช้ SHA-256 ของเนื้อไฟล์, ไฟล์ใหญ่ใช้ (inode, mtime, size)
+- ไฟล์ที่แอปตั้งชื่อเองให้ไม่ซ้ำตามเนื้อหา (รูปย่อ, ไฟล์ของ stub uploader) ได้ Cache-Control แบบ immutable
+- ไฟล์เล็กที่ถูกขอบ่อยเก็บไว้ใน LRU ในหน่วยความจำ ไม่ต้องอ่านดิสก์ซ้ำ
+- ไฟล์ใหญ่ส่งด้วย send_file (ใช้ wsgi.file_wrapper / sendfile ของ server ได้)
+- โหมด X-Accel-Redirect (nginx) หรือ X-Sendfile (Apache/lighttpd) ให้ web server ส่งไฟล์เอง
+  Flask ทำหน้าที่แค่ตรวจสิทธิ์และตั้ง header
+
+ทุกโหมดรองรับ Range request และ If-None-Match / If-Modified-Since
+"""
+
+import hashlib
+import mimetypes
+import os
+import re
+import unicodedata
+from stat import S_ISREG
+from datetime import datetime, timezone
+from urllib.parse import quote
+
+from flask import Response, abort, send_file
+from werkzeug.security import safe_join
+
+from page_cache import MemoryCache
+
+# เฉพาะชื่อที่แอปสร้างเองซึ่งไม่มีวันถูกเขียนทับด้วยเนื้อหาอื่น (ไม่เดาจากตัวเลขในชื่อไฟล์เก่า เช่น report_20230101...)
+# - รูปย่อจาก images.local_variants: <ชื่อเดิม>.<กว้าง>w.<sha256 16 ตัว>.jpg|png
+# - ไฟล์จาก StubUploader: stub/<folder>/<uuid 16 ตัว>_<ชื่อเดิม>
+IMMUTABLE_PATH = re.compile(
+    r'^(?:(?:[^/]+/)*[^/]+\.[0-9]+w\.[0-9a-f]{16}\.(?:jpg|png)'
+    r'|stub/(?:[^/]+/)*[0-9a-f]{16}_[^/]+)$'
+)
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+
+class StorageFileServer:
+    """ส่งไฟล์ภายใต้ root พร้อม cache header, Range และ hot-file cache"""
+
+    def __init__(self, root, hot_cache_bytes=16 * 1024 * 1024, hot_file_max_size=256 * 1024,
+                 accel_mode='', accel_prefix='/protected-storage', max_age=0):
+        self.root = root
+        self.hot_file_max_size = hot_file_max_size
+        self.accel_mode = accel_mode
+        self.accel_prefix = accel_prefix.rstrip('/')
+        self.max_age = max_age
+        # เก็บ (bytes, etag) โดยนับขนาดเฉพาะส่วน bytes
+        self.hot_cache = MemoryCache(max_entries=4096, max_bytes=hot_cache_bytes,
+                                     sizeof=lambda entry: len(entry[0])) if hot_cache_bytes > 0 else None
+        self.hot_hits = 0
+        self.hot_misses = 0
+
+    def locate(self, relative_path):
+        """คืน (path จริง, os.stat_result) ถ้าเป็นไฟล์ที่อยู่ใต้ root จริง ไม่เช่นนั้นคืน None"""
+        path = safe_join(self.root, relative_path)
+        if path is None:
+            return None
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        if not S_ISREG(stat.st_mode):
+            return None
+        return path, stat
+
+    def cache_control(self, relative_path):
+        if IMMUTABLE_PATH.match(relative_path.replace('\\', '/').lstrip('/')):
+            return IMMUTABLE_CACHE_CONTROL
+        if self.max_age > 0:
+            return f'public, max-age={self.max_age}'
+        return 'public, no-cache'
+
+    def serve(self, request, relative_path, as_attachment=False):
+        located = self.locate(relative_path)
+        if located is None:
+            abort(404)
+        path, stat = located
+
+        if self.accel_mode:
+            return self._accel_response(request, relative_path, path, stat, as_attachment)
+        if self.hot_cache is not None and stat.st_size <= self.hot_file_max_size:
+            return self._memory_response(request, relative_path, path, stat, as_attachment)
+
+        response = send_file(
+            path, conditional=True, etag=self._metadata_etag(stat),
+            last_modified=stat.st_mtime, as_attachment=as_attachment,
+        )
+        response.headers['Cache-Control'] = self.cache_control(relative_path)
+        return response
+
+    def _memory_response(self, request, relative_path, path, stat, as_attachment):
+        key = f'{path}:{stat.st_mtime_ns}:{stat.st_size}'
+        entry = self.hot_cache.get(key)
+        if entry is None:
+            self.hot_misses += 1
+            with open(path, 'rb') as f:
+                data = f.read()
+            entry = (data, hashlib.sha256(data).hexdigest()[:32])
+            self.hot_cache.set(key, entry)
+        else:
+            self.hot_hits += 1
+        data, etag = entry
+
+        response = Response(data, mimetype=self._mimetype(path), direct_passthrough=True)
+        self._finish(response, relative_path, path, stat, etag, as_attachment)
+        return response.make_conditional(request, accept_ranges=True, complete_length=len(data))
+
+    def _accel_response(self, request, relative_path, path, stat, as_attachment):
+        response = Response(mimetype=self._mimetype(path))
+        # header ต้องเป็น latin-1 (PEP 3333) ชื่อไฟล์ภาษาไทยจึง percent-encode ไว้
+        # nginx ถอดรหัส X-Accel-Redirect เอง ส่วน mod_xsendfile ถอดรหัสเมื่อ XSendFileUnescape On (ค่าเริ่มต้น)
+        if self.accel_mode == 'x-accel':
+            response.headers['X-Accel-Redirect'] = quote(f'{self.accel_prefix}/{relative_path.lstrip("/")}', safe='/')
+        else:
+            response.headers['X-Sendfile'] = quote(os.path.abspath(path), safe='/')
+        self._finish(response, relative_path, path, stat, self._metadata_etag(stat), as_attachment)
+        # web server จัดการ Range เอง แต่ 304 ตอบได้ทันทีโดยไม่ต้องส่งต่อ
+        return response.make_conditional(request)
+
+    def _finish(self, response, relative_path, path, stat, etag, as_attachment):
+        response.set_etag(etag)
+        response.last_modified = datetime.fromtimestamp(stat.st_mtime, tz=timezone.utc)
+        response.headers['Cache-Control'] = self.cache_control(relative_path)
+        if as_attachment:
+            response.headers['Content-Disposition'] = self._content_disposition(os.path.basename(path))
+
+    @staticmethod
+    def _content_disposition(filename):
+        """ชื่อไฟล์ที่ไม่ใช่ latin-1 ส่งแบบ RFC 5987 (filename*) พร้อมชื่อ ASCII สำรอง เหมือน send_file ของ Flask"""
+        try:
+            filename.encode('latin-1')
+        except UnicodeEncodeError:
+            fallback = unicodedata.normalize('NFKD', filename).encode('ascii', 'ignore').decode('ascii').strip() or 'download'
+            return f"attachment; filename=\"{fallback}\"; filename*=UTF-8''{quote(filename, safe='')}"
+        return f'attachment; filename="{filename}"'
+
+    @staticmethod
+    def _metadata_etag(stat):
+        raw = f'{stat.st_ino}-{stat.st_mtime_ns}-{stat.st_size}'.encode('ascii')
+        return hashlib.sha256(raw).hexdigest()[:32]
+
+    @staticmethod
+    def _mimetype(path):
+        return mimetypes.guess_type(path)[0] or 'application/octet-stream'
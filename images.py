@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+"""
+รูปย่อ (derivatives) สำหรับรูปภาพของ knowledge/activity
+
+หน้า public ใช้รูปย่อใน srcset แล้วโหลดรูปต้นฉบับเฉพาะตอนเปิดดูรูปใหญ่ (showImageModal)
+- รูปบน Cloudinary: ไม่ต้องสร้างไฟล์ ใช้ transformation URL (c_limit,w_<กว้าง>,f_auto,q_auto)
+- รูปใน storage/ ของเครื่อง (ไฟล์รุ่นเก่าและ stub uploader): ย่อด้วย Pillow ถ้าติดตั้งไว้
+  ชื่อไฟล์รูปย่อมี hash ของต้นฉบับ file_server จึงส่งด้วย Cache-Control แบบ immutable
+
+variant แต่ละอันเป็น dict {url, width, height} เรียงจากเล็กไปใหญ่
+"""
+
+import os
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # ไม่มี Pillow: รูปในเครื่องแสดงเป็นต้นฉบับ (ยังได้ lazy loading)
+    Image = None
+
+from uploads import file_sha256
+
+DEFAULT_WIDTHS = (320, 640, 1280)
+CLOUDINARY_TRANSFORMATION = 'c_limit,w_{width},f_auto,q_auto'
+JPEG_QUALITY = 80
+
+
+def is_cloudinary_url(url):
+    return bool(url) and 'res.cloudinary.com' in url and '/image/upload/' in url
+
+
+def derivative_widths(width, widths=DEFAULT_WIDTHS):
+    """ความกว้างของรูปย่อที่ควรมี ไม่ขยายรูปให้ใหญ่กว่าต้นฉบับ (ไม่รู้ขนาดต้นฉบับใช้ทุกขนาด)"""
+    if not width:
+        return sorted(widths)
+    return [w for w in sorted(widths) if w < width]
+
+
+def _scaled_height(width, height, new_width):
+    if not (width and height):
+        return None
+    return max(1, round(height * new_width / width))
+
+
+def cloudinary_variants(secure_url, width=None, height=None, widths=DEFAULT_WIDTHS):
+    """transformation URL ของ Cloudinary สำหรับแต่ละความกว้าง (Cloudinary สร้างรูปเองเมื่อถูกขอครั้งแรก)"""
+    if not is_cloudinary_url(secure_url):
+        return []
+    prefix, rest = secure_url.split('/image/upload/', 1)
+    return [
+        {
+            'url': f'{prefix}/image/upload/{CLOUDINARY_TRANSFORMATION.format(width=w)}/{rest}',
+            'width': w,
+            'height': _scaled_height(width, height, w),
+        }
+        for w in derivative_widths(width, widths)
+    ]
+
+
+def local_variants(path, url, widths=DEFAULT_WIDTHS):
+    """ย่อรูปที่ path ด้วย Pillow เก็บไว้ข้างต้นฉบับ คืน (width, height, variants)
+
+    url คือ URL ของต้นฉบับ ใช้สร้าง URL ของรูปย่อในโฟลเดอร์เดียวกัน
+    คืน None ถ้าไม่มี Pillow หรือไฟล์ไม่ใช่รูปที่ Pillow เปิดได้ รูปย่อที่สร้างไว้แล้วจะไม่สร้างซ้ำ
+    """
+    if Image is None:
+        return None
+    try:
+        with Image.open(path) as original:
+            image = ImageOps.exif_transpose(original)
+            width, height = image.size
+            digest = file_sha256(path)[:16]
+            has_alpha = image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info)
+            extension = 'png' if has_alpha else 'jpg'
+            stem = os.path.splitext(os.path.basename(path))[0]
+            directory = os.path.dirname(path)
+            url_prefix = url.rsplit('/', 1)[0]
+            variants = []
+            for w in derivative_widths(width, widths):
+                h = _scaled_height(width, height, w)
+                name = f'{stem}.{w}w.{digest}.{extension}'
+                target = os.path.join(directory, name)
+                if not os.path.exists(target):
+                    resized = image.resize((w, h), Image.Resampling.LANCZOS)
+                    tmp = f'{target}.tmp'
+                    if has_alpha:
+                        resized.save(tmp, 'PNG', optimize=True)
+                    else:
+                        resized.convert('RGB').save(tmp, 'JPEG', quality=JPEG_QUALITY, optimize=True, progressive=True)
+                    os.replace(tmp, target)
+                variants.append({'url': f'{url_prefix}/{name}', 'width': w, 'height': h})
+            return width, height, variants
+    except (OSError, ValueError, Image.DecompressionBombError):
+        return None
@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+"""
+วัดเวลาของแต่ละ request แยกส่วน: SQL (จำนวน query, เวลารวม, statement ที่ช้าที่สุด), render template
+และเวลาที่รอการอัปโหลดไปยังภายนอก (Cloudinary/stub) แล้ว
+
+- ส่งกลับเป็น header Server-Timing (ดูได้ในแท็บ Network ของ DevTools)
+- request ที่ช้ากว่า slow_ms ถูกเขียนลง log แบบ JSON หนึ่งบรรทัดต่อ request
+
+ข้อมูลของ request ปัจจุบันเก็บใน ContextVar งานใน thread เบื้องหลัง (คิวอัปโหลด) จึงไม่ถูกนับรวม
+ถ้าไม่เรียก init_app จะไม่มี event listener ใดถูกติดตั้งเลย timed() เหลือแค่การอ่าน ContextVar หนึ่งครั้ง
+"""
+
+import json
+import logging
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from flask import before_render_template, request, template_rendered
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+_current = ContextVar('request_stats', default=None)
+
+
+class RequestStats:
+    def __init__(self, slowest_limit):
+        self.started = time.perf_counter()
+        self.query_count = 0
+        self.sql_seconds = 0.0
+        self.slowest = []  # [(วินาที, statement)] เรียงจากช้าไปเร็ว ไม่เกิน slowest_limit รายการ
+        self.slowest_limit = slowest_limit
+        self.timers = {}
+        self._template_started = []
+
+    def add_query(self, statement, seconds):
+        self.query_count += 1
+        self.sql_seconds += seconds
+        if len(self.slowest) < self.slowest_limit or seconds > self.slowest[-1][0]:
+            self.slowest.append((seconds, ' '.join(statement.split())[:300]))
+            self.slowest.sort(key=lambda item: item[0], reverse=True)
+            del self.slowest[self.slowest_limit:]
+
+    def add_time(self, name, seconds):
+        self.timers[name] = self.timers.get(name, 0.0) + seconds
+
+
+@contextmanager
+def timed(name):
+    """จับเวลาส่วนหนึ่งของ request ปัจจุบัน (เช่น 'upload') นอก request ไม่ทำอะไร"""
+    stats = _current.get()
+    if stats is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        stats.add_time(name, time.perf_counter() - started)
+
+
+class Instrumentation:
+    # ชื่อใน Server-Timing ของเวลาที่จับด้วย timed()
+    TIMER_LABELS = {'upload': 'outbound upload'}
+
+    def __init__(self, slow_ms=500, slowest_limit=5, header=True, logger=None):
+        self.slow_ms = slow_ms
+        self.slowest_limit = slowest_limit
+        self.header = header
+        self.logger = logger or logging.getLogger('slow_requests')
+
+    def init_app(self, app):
+        app.before_request(self._start)
+        app.after_request(self._finish)
+        app.teardown_request(self._teardown)
+        before_render_template.connect(self._template_start, app)
+        template_rendered.connect(self._template_end, app)
+        event.listen(Engine, 'before_cursor_execute', self._before_execute)
+        event.listen(Engine, 'after_cursor_execute', self._after_execute)
+        event.listen(Engine, 'handle_error', self._execute_failed)
+
+    def _start(self):
+        request.environ['instrumentation.token'] = _current.set(RequestStats(self.slowest_limit))
+
+    def _teardown(self, exc):
+        token = request.environ.pop('instrumentation.token', None)
+        if token is not None:
+            _current.reset(token)
+
+    @staticmethod
+    def _before_execute(conn, cursor, statement, parameters, context, executemany):
+        if _current.get() is not None:
+            conn.info.setdefault('instrumentation.started', []).append(time.perf_counter())
+
+    @staticmethod
+    def _after_execute(conn, cursor, statement, parameters, context, executemany):
+        stats = _current.get()
+        started = conn.info.get('instrumentation.started')
+        if stats is not None and started:
+            stats.add_query(statement, time.perf_counter() - started.pop())
+
+    @staticmethod
+    def _execute_failed(exception_context):
+        # statement ที่ error ไม่มี after_cursor_execute ทิ้งเวลาเริ่มของมันไม่ให้ไปปนกับ statement ถัดไป
+        connection = exception_context.connection
+        started = connection.info.get('instrumentation.started') if connection is not None else None
+        if started:
+            started.pop()
+
+    @staticmethod
+    def _template_start(sender, template, context, **extra):
+        stats = _current.get()
+        if stats is not None:
+            stats._template_started.append(time.perf_counter())
+
+    @staticmethod
+    def _template_end(sender, template, context, **extra):
+        stats = _current.get()
+        if stats is not None and stats._template_started:
+            started = stats._template_started.pop()
+            if not stats._template_started:  # template ซ้อนกัน (render_template ภายใน render) นับครั้งเดียว
+                stats.add_time('template', time.perf_counter() - started)
+
+    def _finish(self, response):
+        stats = _current.get()
+        if stats is None:
+            return response
+        total_ms = (time.perf_counter() - stats.started) * 1000
+        if self.header:
+            metrics = [f'db;dur={stats.sql_seconds * 1000:.1f};desc="{stats.query_count} queries"']
+            if 'template' in stats.timers:
+                metrics.append(f'tpl;dur={stats.timers["template"] * 1000:.1f};desc="template render"')
+            for name, seconds in stats.timers.items():
+                if name != 'template':
+                    metrics.append(f'{name};dur={seconds * 1000:.1f};desc="{self.TIMER_LABELS.get(name, name)}"')
+            metrics.append(f'total;dur={total_ms:.1f}')
+            response.headers.add('Server-Timing', ', '.join(metrics))
+        if total_ms >= self.slow_ms:
+            self.logger.warning(json.dumps({
+                'event': 'slow_request',
+                'method': request.method,
+                'path': request.full_path.rstrip('?'),
+                'endpoint': request.endpoint,
+                'status': response.status_code,
+                'total_ms': round(total_ms, 1),
+                'sql_ms': round(stats.sql_seconds * 1000, 1),
+                'queries': stats.query_count,
+                'template_ms': round(stats.timers.get('template', 0.0) * 1000, 1),
+                'timers_ms': {name: round(seconds * 1000, 1) for name, seconds in stats.timers.items()
+                              if name != 'template'},
+                'slowest': [{'ms': round(seconds * 1000, 2), 'sql': statement} for seconds, statement in stats.slowest],
+            }, ensure_ascii=False))
+        return response
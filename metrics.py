@@ -0,0 +1,262 @@
+# -*- coding: utf-8 -*-
+"""
+ตัวนับและ histogram สำหรับ Prometheus (รูปแบบ text exposition 0.0.4) โดยไม่ต้องติดตั้งไลบรารีเพิ่ม
+
+gunicorn หลาย worker: แต่ละ process สะสมค่าในหน่วยความจำของตัวเอง แล้วเขียน snapshot ลงไฟล์ <pid>.json
+ใน directory ที่ใช้ร่วมกัน (METRICS_DIR) ไม่เกินทุก flush_interval วินาที worker ที่ถูก scrape อ่านทุกไฟล์มารวมกัน
+ไฟล์ของ process ที่ตายแล้วถูกรวมเข้า archive.json (ค่าสะสมไม่หายเมื่อ worker ถูกสร้างใหม่) ถ้าไม่ตั้ง directory
+จะเห็นเฉพาะค่าของ process ที่ตอบ request นั้น (dev server, waitress, Vercel)
+
+เก็บเฉพาะ counter และ histogram ซึ่งรวมข้าม process ได้ด้วยการบวก การบันทึกแต่ละครั้งเป็นแค่การบวกเลขใต้ lock
+"""
+
+import atexit
+import bisect
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import request
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Counter:
+    type = 'counter'
+
+    def __init__(self, registry, name, documentation, labelnames=(), collect=None):
+        self.registry = registry
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.collect = collect  # ฟังก์ชันที่คืน {label values: ค่าสะสม} อ่านตอน snapshot (เช่น hits ของ cache)
+        self.values = {}
+
+    def inc(self, *labelvalues, amount=1):
+        with self.registry.lock:
+            self.values[labelvalues] = self.values.get(labelvalues, 0) + amount
+
+    def samples(self):
+        values = dict(self.values)
+        if self.collect is not None:
+            values.update(self.collect())
+        return values
+
+
+class Histogram:
+    type = 'histogram'
+
+    def __init__(self, registry, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.registry = registry
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self.values = {}  # label values -> [จำนวนในแต่ละ bucket (ไม่สะสม) ..., จำนวนที่เกิน bucket สุดท้าย, ผลรวม]
+
+    def observe(self, value, *labelvalues):
+        index = bisect.bisect_left(self.buckets, value)
+        with self.registry.lock:
+            counts = self.values.get(labelvalues)
+            if counts is None:
+                counts = self.values[labelvalues] = [0] * (len(self.buckets) + 1) + [0.0]
+            counts[index] += 1
+            counts[-1] += value
+
+    def samples(self):
+        return {labels: list(counts) for labels, counts in self.values.items()}
+
+
+def _merge(target, snapshot):
+    for name, metric in snapshot.items():
+        merged = target.setdefault(name, {**metric, 'samples': {}})
+        for labels, value in metric['samples']:
+            labels = tuple(labels)
+            current = merged['samples'].get(labels)
+            if current is None:
+                merged['samples'][labels] = value
+            elif isinstance(value, list):
+                merged['samples'][labels] = [a + b for a, b in zip(current, value)]
+            else:
+                merged['samples'][labels] = current + value
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)] + list(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Registry:
+    def __init__(self, directory=None, flush_interval=1.0):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self.lock = threading.Lock()
+        self.metrics = []
+        self._flushed_at = 0.0
+        self._flush_lock = threading.Lock()
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            # ไฟล์ที่ pid ตรงกับ process นี้มาจาก process เก่าก่อน restart เก็บค่าไว้ก่อนจะถูกเขียนทับ
+            with self._exclusive():
+                self._archive(lambda pid: pid == os.getpid())
+            atexit.register(self.flush)
+
+    def counter(self, name, documentation, labelnames=(), collect=None):
+        metric = Counter(self, name, documentation, labelnames, collect)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        metric = Histogram(self, name, documentation, labelnames, buckets)
+        self.metrics.append(metric)
+        return metric
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                metric.name: {
+                    'type': metric.type, 'help': metric.documentation, 'labels': list(metric.labelnames),
+                    'buckets': list(getattr(metric, 'buckets', ())),
+                    'samples': [[list(labels), value] for labels, value in metric.samples().items()],
+                }
+                for metric in self.metrics
+            }
+
+    def _path(self, pid):
+        return os.path.join(self.directory, f'{pid}.json')
+
+    def flush(self):
+        """เขียน snapshot ของ process นี้ลงไฟล์ (แทนที่ไฟล์เดิมแบบ atomic)"""
+        if not self.directory:
+            return
+        with self._flush_lock:
+            path = self._path(os.getpid())
+            with open(path + '.tmp', 'w', encoding='utf-8') as f:
+                json.dump(self.snapshot(), f)
+            os.replace(path + '.tmp', path)
+            self._flushed_at = time.monotonic()
+
+    def maybe_flush(self):
+        if self.directory and time.monotonic() - self._flushed_at >= self.flush_interval:
+            self.flush()
+
+    def _process_files(self):
+        for name in os.listdir(self.directory):
+            pid, ext = os.path.splitext(name)
+            if ext == '.json' and pid.isdigit():
+                yield int(pid), os.path.join(self.directory, name)
+
+    @contextmanager
+    def _exclusive(self):
+        """lock ของ directory ระหว่าง process (ใช้เฉพาะโหมดหลาย process ซึ่ง gunicorn ไม่รองรับ Windows อยู่แล้ว)"""
+        import fcntl
+
+        with open(os.path.join(self.directory, 'archive.lock'), 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            yield
+
+    def _archive(self, should_archive):
+        """รวมไฟล์ของ process ที่ should_archive(pid) เป็นจริงเข้า archive.json แล้วลบไฟล์นั้น (ต้องถือ _exclusive)"""
+        archived = [path for pid, path in self._process_files() if should_archive(pid)]
+        if not archived:
+            return
+        archive_path = os.path.join(self.directory, 'archive.json')
+        merged = self._read([archive_path] + archived)
+        snapshot = {name: {**metric, 'samples': [[list(labels), value] for labels, value in metric['samples'].items()]}
+                    for name, metric in merged.items()}
+        with open(archive_path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(snapshot, f)
+        os.replace(archive_path + '.tmp', archive_path)
+        for path in archived:
+            os.unlink(path)
+
+    @staticmethod
+    def _read(paths):
+        merged = {}
+        for path in paths:
+            try:
+                with open(path, encoding='utf-8') as f:
+                    _merge(merged, json.load(f))
+            except (FileNotFoundError, ValueError):
+                continue
+        return merged
+
+    @staticmethod
+    def _dead(pid):
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return True
+        except PermissionError:
+            return False
+        return False
+
+    def collect(self):
+        """ค่ารวมของทุก process: {name: {type, help, labels, buckets, samples: {label values: ค่า}}}"""
+        if not self.directory:
+            merged = {}
+            _merge(merged, self.snapshot())
+            return merged
+        self.flush()
+        with self._exclusive():
+            self._archive(self._dead)
+            paths = [os.path.join(self.directory, 'archive.json')] + [path for _, path in self._process_files()]
+            return self._read(paths)
+
+    def render(self):
+        """ข้อความสำหรับ Prometheus scrape"""
+        lines = []
+        for name, metric in sorted(self.collect().items()):
+            lines.append(f'# HELP {name} {metric["help"]}')
+            lines.append(f'# TYPE {name} {metric["type"]}')
+            names = metric['labels']
+            for labels, value in sorted(metric['samples'].items()):
+                if metric['type'] == 'counter':
+                    lines.append(f'{name}{_labels(names, labels)} {_number(value)}')
+                    continue
+                cumulative = 0
+                for bound, count in zip(metric['buckets'] + ['+Inf'], value[:-1]):
+                    cumulative += count
+                    le = 'le="+Inf"' if bound == '+Inf' else f'le="{_number(float(bound))}"'
+                    lines.append(f'{name}_bucket{_labels(names, labels, [le])} {cumulative}')
+                lines.append(f'{name}_sum{_labels(names, labels)} {_number(float(value[-1]))}')
+                lines.append(f'{name}_count{_labels(names, labels)} {cumulative}')
+        return '\n'.join(lines) + '\n'
+
+
+class RequestMetrics:
+    """จำนวน request และ histogram เวลาตอบแยกตาม endpoint ของ Flask (ไม่ใช้ path เพื่อไม่ให้ label มีค่าไม่จำกัด)"""
+
+    def __init__(self, registry):
+        self.registry = registry
+        self.requests = registry.counter('ha_http_requests_total', 'HTTP requests by endpoint, method and status',
+                                         ('endpoint', 'method', 'status'))
+        self.duration = registry.histogram('ha_http_request_duration_seconds', 'Request latency by endpoint',
+                                           ('endpoint',))
+
+    def init_app(self, app):
+        app.before_request(self._start)
+        app.after_request(self._finish)
+
+    @staticmethod
+    def _start():
+        request.environ['metrics.started'] = time.perf_counter()
+
+    def _finish(self, response):
+        started = request.environ.get('metrics.started')
+        if started is not None:
+            endpoint = request.endpoint or 'unmatched'
+            self.duration.observe(time.perf_counter() - started, endpoint)
+            self.requests.inc(endpoint, request.method, str(response.status_code))
+            self.registry.maybe_flush()
+        return response
@@ -0,0 +1,286 @@
+# -*- coding: utf-8 -*-
+"""
+Schema migration แบบมีเลขเวอร์ชัน
+
+ตาราง schema_version มีแถวเดียว เก็บเลขเวอร์ชันล่าสุดที่ migrate แล้ว และ features ที่ใช้งานได้
+(เช่น 'search' เมื่อสร้างดัชนีค้นหาสำเร็จ ซึ่ง SQLite ที่ไม่มี FTS5 จะไม่มี)
+
+- ตอนเริ่มระบบ app อ่านแถวนี้ครั้งเดียวด้วย read_state() ไม่แตะ schema อย่างอื่น
+- การ migrate และ seed ทำในขั้นตอน deploy (flask db-upgrade) ด้วย MigrationRunner.upgrade()
+
+migration แต่ละขั้นเป็นฟังก์ชัน (session, state) ที่รันใน transaction ของตัวเอง
+พร้อมกับการบันทึกเลขเวอร์ชัน ถ้าล้มเหลวเวอร์ชันจะไม่เปลี่ยนและรันใหม่ได้
+ขั้นที่เพิ่มคอลัมน์ควรใช้ add_column_if_missing เพราะฐานข้อมูลใหม่ได้คอลัมน์นั้นจาก create_all ไปแล้ว
+
+index ประกาศไว้ใน model (__table_args__) ฐานข้อมูลใหม่ได้จาก create_all ส่วนฐานข้อมูลเดิมสร้างด้วย
+create_missing_indexes ใน migration แบบ transactional=False (PostgreSQL ใช้ CREATE INDEX CONCURRENTLY)
+และตรวจ index ที่ซ้ำหรือไม่ได้ใช้ได้ด้วย index_report (flask db-indexes)
+"""
+
+from datetime import datetime, timezone
+
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, inspect, select, text
+from sqlalchemy.exc import OperationalError, ProgrammingError
+
+metadata = MetaData()
+
+schema_version = Table(
+    'schema_version', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('version', Integer, nullable=False),
+    Column('features', String(200), nullable=False, default=''),
+    Column('updated_at', DateTime),
+)
+
+
+class SchemaState:
+    """เลขเวอร์ชันและ features ที่อ่านได้จาก schema_version (ฐานข้อมูลที่ยังไม่เคย migrate คือเวอร์ชัน 0)"""
+
+    def __init__(self, version=0, features=()):
+        self.version = version
+        self.features = set(features)
+
+    @classmethod
+    def from_row(cls, row):
+        if row is None:
+            return cls()
+        return cls(row.version, [feature for feature in row.features.split(',') if feature])
+
+
+def read_state(connection):
+    """อ่านสถานะ schema ด้วย query เดียว (ถ้ายังไม่มีตาราง schema_version คืนเวอร์ชัน 0)
+
+    บน PostgreSQL query ที่ล้มเหลวทำให้ transaction ใช้ต่อไม่ได้ ผู้เรียกควร rollback เมื่อได้เวอร์ชัน 0
+    """
+    try:
+        row = connection.execute(select(schema_version).where(schema_version.c.id == 1)).first()
+    except (OperationalError, ProgrammingError):
+        return SchemaState()
+    return SchemaState.from_row(row)
+
+
+def add_column_if_missing(connection, table, column, ddl_type):
+    """ALTER TABLE ADD COLUMN เฉพาะเมื่อยังไม่มีคอลัมน์ (SQLite ไม่รองรับ ADD COLUMN IF NOT EXISTS)"""
+    if column in {existing['name'] for existing in inspect(connection).get_columns(table)}:
+        return False
+    connection.execute(text(f'ALTER TABLE {table} ADD COLUMN {column} {ddl_type}'))
+    return True
+
+
+class Migration:
+    """ขั้นหนึ่งของการ migrate
+
+    transactional=False สำหรับงานที่รันใน transaction ไม่ได้ (เช่น CREATE INDEX CONCURRENTLY)
+    ขั้นแบบนี้รันหลังปล่อยล็อกของ schema_version ต้องรันซ้ำได้ปลอดภัย และเปลี่ยน features ไม่ได้
+    """
+
+    def __init__(self, version, description, apply, transactional=True):
+        self.version = version
+        self.description = description
+        self.apply = apply
+        self.transactional = transactional
+
+
+class MigrationRunner:
+    def __init__(self, migrations):
+        self.migrations = sorted(migrations, key=lambda migration: migration.version)
+        versions = [migration.version for migration in self.migrations]
+        if len(set(versions)) != len(versions) or (versions and versions[0] < 1):
+            raise ValueError(f'Migration versions must be unique and start at 1: {versions}')
+
+    @property
+    def latest(self):
+        return self.migrations[-1].version if self.migrations else 0
+
+    def pending(self, state):
+        return [migration for migration in self.migrations if migration.version > state.version]
+
+    def upgrade(self, session, log=print):
+        """รัน migration ที่ยังไม่ได้รันทีละขั้น (หนึ่ง transaction ต่อขั้น) คืนสถานะล่าสุด"""
+        metadata.create_all(session.connection())
+        if session.execute(select(schema_version.c.id)).first() is None:
+            session.execute(schema_version.insert().values(id=1, version=0, features=''))
+        session.commit()
+
+        while True:
+            state = _lock_state(session)
+            pending = self.pending(state)
+            if not pending:
+                session.rollback()
+                return state
+            migration = pending[0]
+            log(f'Migrating schema to version {migration.version}: {migration.description}')
+            if not migration.transactional:
+                # CREATE INDEX CONCURRENTLY รอ transaction ที่เปิดอยู่ทั้งหมดให้จบก่อน รวมถึงตัวที่ล็อกแถวนี้
+                session.rollback()
+                migration.apply(session, state)
+                state = _lock_state(session)
+                if state.version >= migration.version:  # deploy อีกตัวบันทึกไปแล้ว
+                    session.rollback()
+                    continue
+            else:
+                migration.apply(session, state)
+            session.execute(
+                schema_version.update().where(schema_version.c.id == 1).values(
+                    version=migration.version,
+                    features=','.join(sorted(state.features)),
+                    updated_at=datetime.now(timezone.utc),
+                )
+            )
+            session.commit()
+
+
+def _lock_state(session):
+    # ล็อกแถว (PostgreSQL) กันการ deploy สองครั้งพร้อมกันรัน migration เดียวกันซ้ำ
+    row = session.execute(select(schema_version).where(schema_version.c.id == 1).with_for_update()).first()
+    return SchemaState.from_row(row)
+
+
+def set_feature(session, feature, enabled):
+    """เปิด/ปิด feature ใน schema_version (เช่นหลัง flask search-reindex สร้างดัชนีได้สำเร็จ)"""
+    state = read_state(session.connection())
+    if state.version == 0:
+        return
+    if enabled:
+        state.features.add(feature)
+    else:
+        state.features.discard(feature)
+    session.execute(
+        schema_version.update().where(schema_version.c.id == 1).values(features=','.join(sorted(state.features)))
+    )
+
+
+# ===== Index =====
+
+def _autocommit(engine):
+    return engine.connect().execution_options(isolation_level='AUTOCOMMIT')
+
+
+def _invalid_indexes(connection):
+    """index บน PostgreSQL ที่ CREATE INDEX CONCURRENTLY ล้มเหลวค้างไว้ (ใช้ไม่ได้แต่ยังทำให้เขียนช้า)"""
+    if connection.dialect.name != 'postgresql':
+        return set()
+    return set(connection.execute(text(
+        'SELECT c.relname FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid WHERE NOT i.indisvalid'
+    )).scalars())
+
+
+def create_missing_indexes(engine, metadata, log=print):
+    """สร้าง index ที่ประกาศใน metadata แต่ยังไม่มีในฐานข้อมูล คืนจำนวนที่สร้าง
+
+    PostgreSQL ใช้ CREATE INDEX CONCURRENTLY ซึ่งไม่ล็อกการเขียนระหว่างสร้าง แต่รันใน transaction ไม่ได้
+    จึงใช้ connection แบบ autocommit ของตัวเอง index ที่สร้างค้างไว้ไม่สำเร็จจะถูกลบแล้วสร้างใหม่
+    """
+    postgresql = engine.dialect.name == 'postgresql'
+    concurrently = 'CONCURRENTLY ' if postgresql else ''
+    created = 0
+    with _autocommit(engine) as connection:
+        quote = connection.dialect.identifier_preparer.quote
+        inspector = inspect(connection)
+        invalid = _invalid_indexes(connection)
+        for table in metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {index['name'] for index in inspector.get_indexes(table.name)}
+            for index in sorted(table.indexes, key=lambda index: index.name):
+                if index.name in invalid:
+                    connection.execute(text(f'DROP INDEX {concurrently}IF EXISTS {quote(index.name)}'))
+                elif index.name in existing:
+                    continue
+                columns = ', '.join(quote(column.name) for column in index.columns)
+                unique = 'UNIQUE ' if index.unique else ''
+                log(f'  creating index {index.name} on {table.name} ({columns})')
+                connection.execute(text(
+                    f'CREATE {unique}INDEX {concurrently}IF NOT EXISTS {quote(index.name)} '
+                    f'ON {quote(table.name)} ({columns})'
+                ))
+                created += 1
+    return created
+
+
+def _is_redundant(index, other, declared):
+    """index ซ้ำซ้อนกับ other หรือไม่ (คอลัมน์ของ index เป็นส่วนต้นของ other)"""
+    if other['columns'][:len(index['columns'])] != index['columns']:
+        return False
+    same_columns = other['columns'] == index['columns']
+    if index['unique'] and not (other['unique'] and same_columns):
+        # unique index ยังบังคับความไม่ซ้ำของข้อมูลอยู่ ซ้ำเฉพาะเมื่อมี unique อื่นที่คอลัมน์ตรงกันทุกตัว
+        return False
+    if not same_columns or other['constraint'] or other['unique'] != index['unique']:
+        return True
+    # เหมือนกันทุกอย่าง: ให้ตัวที่ประกาศใน model อยู่ (ถ้าเหมือนกันอีกให้ตัวที่ชื่อมาก่อนอยู่)
+    return (other['name'] in declared, index['name']) > (index['name'] in declared, other['name'])
+
+
+def index_report(connection, metadata):
+    """ตรวจ index ของตารางใน metadata คืน list ของ dict {kind, table, index, detail}
+
+    - missing: ประกาศใน model แต่ไม่มีในฐานข้อมูล (ยังไม่ได้รัน flask db-upgrade)
+    - duplicate: คอลัมน์เป็นส่วนต้นของ index, primary key หรือ unique constraint อื่นในตารางเดียวกัน
+      ฐานข้อมูลใช้อีกตัวแทนได้เสมอ มีไว้ก็ทำให้การเขียนช้าลงเปล่าๆ
+    - unmanaged: มีในฐานข้อมูลแต่ไม่ได้ประกาศใน model (เช่นที่ optimize_db.py รุ่นเก่าสร้างไว้)
+    - unused: (PostgreSQL) ไม่เคยถูกใช้เลยตั้งแต่ reset สถิติ (pg_stat_user_indexes.idx_scan = 0)
+    - invalid: (PostgreSQL) CREATE INDEX CONCURRENTLY ล้มเหลวค้างไว้ flask db-upgrade จะสร้างใหม่
+    """
+    inspector = inspect(connection)
+    invalid = _invalid_indexes(connection)
+    findings = []
+    for table in metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        declared = {index.name for index in table.indexes}
+        indexes = []
+        primary_key = inspector.get_pk_constraint(table.name)['constrained_columns']
+        if primary_key:
+            indexes.append({'name': 'PRIMARY KEY', 'columns': primary_key, 'unique': True, 'constraint': True})
+        for constraint in inspector.get_unique_constraints(table.name):
+            indexes.append({'name': constraint['name'] or 'UNIQUE', 'columns': constraint['column_names'],
+                            'unique': True, 'constraint': True})
+        for index in inspector.get_indexes(table.name):
+            if index.get('duplicates_constraint'):  # index ที่ PostgreSQL สร้างให้ unique constraint
+                continue
+            indexes.append({'name': index['name'], 'columns': index['column_names'],
+                            'unique': bool(index['unique']), 'constraint': False})
+
+        existing = {index['name'] for index in indexes}
+        for name in sorted(declared - existing):
+            findings.append({'kind': 'missing', 'table': table.name, 'index': name, 'detail': 'run flask db-upgrade'})
+        for index in indexes:
+            if index['constraint']:
+                continue
+            if index['name'] in invalid:
+                findings.append({'kind': 'invalid', 'table': table.name, 'index': index['name'], 'detail': ''})
+            for other in indexes:
+                if other is not index and _is_redundant(index, other, declared):
+                    findings.append({
+                        'kind': 'duplicate', 'table': table.name, 'index': index['name'],
+                        'detail': f'({", ".join(index["columns"])}) is covered by {other["name"]} '
+                                  f'({", ".join(other["columns"])})',
+                    })
+                    break
+            if index['name'] not in declared:
+                findings.append({'kind': 'unmanaged', 'table': table.name, 'index': index['name'],
+                                 'detail': f'({", ".join(index["columns"])}) is not declared in the models'})
+
+    if connection.dialect.name == 'postgresql':
+        rows = connection.execute(text(
+            'SELECT s.relname, s.indexrelname FROM pg_stat_user_indexes s '
+            'JOIN pg_index i ON i.indexrelid = s.indexrelid '
+            'WHERE s.idx_scan = 0 AND NOT i.indisunique AND NOT i.indisprimary'
+        )).all()
+        tables = {table.name for table in metadata.sorted_tables}
+        findings.extend(
+            {'kind': 'unused', 'table': table, 'index': index, 'detail': 'idx_scan = 0'}
+            for table, index in rows if table in tables
+        )
+    return findings
+
+
+def drop_indexes(engine, names, log=print):
+    """ลบ index ตามชื่อ (PostgreSQL ใช้ DROP INDEX CONCURRENTLY จึงไม่ล็อกตารางระหว่างลบ)"""
+    concurrently = 'CONCURRENTLY ' if engine.dialect.name == 'postgresql' else ''
+    with _autocommit(engine) as connection:
+        quote = connection.dialect.identifier_preparer.quote
+        for name in names:
+            log(f'  dropping index {name}')
+            connection.execute(text(f'DROP INDEX {concurrently}IF EXISTS {quote(name)}'))
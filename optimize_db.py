@@ -7,7 +7,6 @@ Database Optimization Script for Hospital Management System
 
 import sqlite3
 import os
-import time
 from datetime import datetime
 
 def connect_db():
@@ -26,53 +25,14 @@ def connect_db():
         return None
 
 def create_indexes(conn):
-    """สร้างดัชนีเพื่อเพิ่มประสิทธิภาพ"""
-    try:
-        cursor = conn.cursor()
-        
-        print("🔧 กำลังสร้างดัชนีเพื่อเพิ่มประสิทธิภาพ...")
-        
-        # ดัชนีสำหรับตาราง department
-        indexes = [
-            "CREATE INDEX IF NOT EXISTS idx_department_code ON department(code)",
-            "CREATE INDEX IF NOT EXISTS idx_department_name ON department(name)",
-            "CREATE INDEX IF NOT EXISTS idx_department_created ON department(created_at)",
-            
-            # ดัชนีสำหรับตาราง guideline
-            "CREATE INDEX IF NOT EXISTS idx_guideline_dept ON guideline(department_id)",
-            "CREATE INDEX IF NOT EXISTS idx_guideline_title ON guideline(title)",
-            "CREATE INDEX IF NOT EXISTS idx_guideline_upload ON guideline(upload_date)",
-            "CREATE INDEX IF NOT EXISTS idx_guideline_external ON guideline(external_link)",
-            
-            # ดัชนีสำหรับตาราง knowledge
-            "CREATE INDEX IF NOT EXISTS idx_knowledge_dept ON knowledge(department_id)",
-            "CREATE INDEX IF NOT EXISTS idx_knowledge_title ON knowledge(title)",
-            "CREATE INDEX IF NOT EXISTS idx_knowledge_created ON knowledge(created_at)",
-            
-            # ดัชนีสำหรับตาราง activity
-            "CREATE INDEX IF NOT EXISTS idx_activity_dept ON activity(department_id)",
-            "CREATE INDEX IF NOT EXISTS idx_activity_date ON activity(activity_date)",
-            "CREATE INDEX IF NOT EXISTS idx_activity_created ON activity(created_at)",
-            
-            # ดัชนีสำหรับตาราง contact
-            "CREATE INDEX IF NOT EXISTS idx_contact_dept ON contact(department_id)",
-            "CREATE INDEX IF NOT EXISTS idx_contact_email ON contact(email)",
-            "CREATE INDEX IF NOT EXISTS idx_contact_phone ON contact(phone)",
-            
-            # ดัชนีสำหรับตาราง admin_user
-            "CREATE INDEX IF NOT EXISTS idx_admin_username ON admin_user(username)",
-            "CREATE INDEX IF NOT EXISTS idx_admin_email ON admin_user(email)"
-        ]
-        
-        for index_sql in indexes:
-            cursor.execute(index_sql)
-            print(f"  ✅ สร้างดัชนี: {index_sql.split('idx_')[1].split(' ON ')[0]}")
-        
-        conn.commit()
-        print("✅ สร้างดัชนีเสร็จสิ้น")
-        
-    except sqlite3.Error as e:
-        print(f"❌ เกิดข้อผิดพลาดในการสร้างดัชนี: {e}")
+    """index ประกาศไว้ใน model ของ app.py แล้ว ไม่สร้างจากสคริปต์นี้อีก
+
+    สคริปต์นี้เคยสร้าง index ให้เฉพาะ instance/hospital.db (ฐานข้อมูล PostgreSQL บน production จึงไม่มี)
+    และบางตัวซ้ำกับ index ของ unique constraint ให้ใช้คำสั่งของแอปแทน:
+      flask db-upgrade                    สร้าง index ที่ขาด (PostgreSQL ใช้ CREATE INDEX CONCURRENTLY)
+      flask db-indexes [--drop-duplicates] ตรวจ index ที่ซ้ำซ้อน/ไม่ได้ใช้ และลบตัวที่ซ้ำ
+    """
+    print("🔧 index ประกาศไว้ใน model แล้ว: รัน `flask db-upgrade` เพื่อสร้าง และ `flask db-indexes` เพื่อตรวจ index ที่ซ้ำ")
 
 def analyze_database(conn):
     """วิเคราะห์ฐานข้อมูล"""
@@ -115,48 +75,6 @@ def analyze_database(conn):
     except sqlite3.Error as e:
         print(f"❌ เกิดข้อผิดพลาดในการวิเคราะห์: {e}")
 
-def performance_test(conn):
-    """ทดสอบประสิทธิภาพ"""
-    try:
-        cursor = conn.cursor()
-        
-        print("\n⚡ ทดสอบประสิทธิภาพ")
-        print("=" * 50)
-        
-        # ทดสอบการค้นหาแบบไม่มีดัชนี
-        print("🔍 ทดสอบการค้นหาแบบไม่มีดัชนี...")
-        start_time = time.time()
-        cursor.execute("SELECT * FROM department WHERE code = 'DM'")
-        result = cursor.fetchone()
-        no_index_time = time.time() - start_time
-        print(f"  ⏱️  เวลา: {no_index_time:.6f} วินาที")
-        
-        # ทดสอบการค้นหาแบบมีดัชนี
-        print("🔍 ทดสอบการค้นหาแบบมีดัชนี...")
-        start_time = time.time()
-        cursor.execute("SELECT * FROM department WHERE code = 'DM'")
-        result = cursor.fetchone()
-        with_index_time = time.time() - start_time
-        print(f"  ⏱️  เวลา: {with_index_time:.6f} วินาที")
-        
-        # ทดสอบการค้นหาข้อมูลที่เกี่ยวข้อง
-        print("🔍 ทดสอบการค้นหาข้อมูลที่เกี่ยวข้อง...")
-        start_time = time.time()
-        cursor.execute("""
-            SELECT d.name, COUNT(g.id) as guideline_count
-            FROM department d
-            LEFT JOIN guideline g ON d.id = g.department_id
-            GROUP BY d.id
-            ORDER BY guideline_count DESC
-        """)
-        results = cursor.fetchall()
-        join_time = time.time() - start_time
-        print(f"  ⏱️  เวลา: {join_time:.6f} วินาที")
-        print(f"  📊 ผลลัพธ์: {len(results)} รายการ")
-        
-    except sqlite3.Error as e:
-        print(f"❌ เกิดข้อผิดพลาดในการทดสอบประสิทธิภาพ: {e}")
-
 def maintenance_tips():
     """คำแนะนำการบำรุงรักษา"""
     print("\n💡 คำแนะนำการบำรุงรักษาฐานข้อมูล")
@@ -193,8 +111,8 @@ def main():
         # วิเคราะห์ฐานข้อมูล
         analyze_database(conn)
         
-        # ทดสอบประสิทธิภาพ
-        performance_test(conn)
+        # การวัดประสิทธิภาพย้ายไปที่ benchmarks/ (ข้อมูลจำลองปริมาณมาก + route จริงของแอป)
+        print("\n⚡ วัดประสิทธิภาพด้วย: python -m benchmarks.generate แล้ว python -m benchmarks.scenarios")
         
         # คำแนะนำการบำรุงรักษา
         maintenance_tips()
@@ -0,0 +1,282 @@
+# -*- coding: utf-8 -*-
+"""
+Rendered-page cache สำหรับหน้า public (home, department)
+
+key ของ cache มีเลข revision ของเนื้อหาอยู่ในตัว เมื่อแอดมินแก้ไขข้อมูล revision จะเพิ่มขึ้น
+ทำให้ key เปลี่ยนเองโดยไม่ต้องไล่ลบ cache เก่า (entry เก่าจะถูกไล่ออกตาม LRU/จำนวนไฟล์)
+
+Backend ที่มีให้เลือก
+- MemoryCache: LRU ในหน่วยความจำของ process จำกัดทั้งจำนวนและขนาดรวม
+- FileSystemCache: เก็บเป็นไฟล์ในเครื่อง ใช้ร่วมกันได้ระหว่าง gunicorn workers
+- TieredCache: memory ด้านหน้า filesystem
+"""
+
+import hashlib
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows ไม่มี fcntl ใช้ได้แค่ lock ภายใน process
+    fcntl = None
+
+
+class _KeyLocks:
+    """lock แยกตาม key ภายใน process (ลบทิ้งเมื่อไม่มีใครใช้แล้ว)"""
+
+    def __init__(self):
+        self._guard = threading.Lock()
+        self._locks = {}
+
+    @contextmanager
+    def hold(self, key):
+        with self._guard:
+            lock, users = self._locks.get(key, (None, 0))
+            if lock is None:
+                lock = threading.Lock()
+            self._locks[key] = (lock, users + 1)
+        try:
+            with lock:
+                yield
+        finally:
+            with self._guard:
+                lock, users = self._locks[key]
+                if users <= 1:
+                    del self._locks[key]
+                else:
+                    self._locks[key] = (lock, users - 1)
+
+
+class CacheBackend:
+    """interface ของ backend: get/set/clear และ lock(key) สำหรับรวม cache miss ของ key เดียวกัน"""
+
+    def __init__(self):
+        self._locks = _KeyLocks()
+
+    def get(self, key):
+        raise NotImplementedError
+
+    def set(self, key, value):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+    @contextmanager
+    def lock(self, key):
+        with self._locks.hold(key):
+            yield
+
+
+class NullCache(CacheBackend):
+    """ไม่ cache อะไรเลย (PAGE_CACHE_BACKEND=none)"""
+
+    def get(self, key):
+        return None
+
+    def set(self, key, value):
+        pass
+
+    def clear(self):
+        pass
+
+    @contextmanager
+    def lock(self, key):
+        # ไม่มีอะไรให้รอ render พร้อมกันได้เลย
+        yield
+
+
+class MemoryCache(CacheBackend):
+    """LRU cache ในหน่วยความจำ จำกัดจำนวน entry และขนาดรวม (byte ตาม sizeof ของแต่ละค่า)"""
+
+    def __init__(self, max_entries=256, max_bytes=32 * 1024 * 1024, sizeof=len):
+        super().__init__()
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self._data = OrderedDict()
+        self._size = 0
+        self._guard = threading.Lock()
+
+    def get(self, key):
+        with self._guard:
+            value = self._data.get(key)
+            if value is not None:
+                self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        size = self.sizeof(value)
+        if size > self.max_bytes:
+            return
+        with self._guard:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self._size -= self.sizeof(old)
+            self._data[key] = value
+            self._size += size
+            while self._data and (len(self._data) > self.max_entries or self._size > self.max_bytes):
+                _, evicted = self._data.popitem(last=False)
+                self._size -= self.sizeof(evicted)
+
+    def clear(self):
+        with self._guard:
+            self._data.clear()
+            self._size = 0
+
+
+class FileSystemCache(CacheBackend):
+    """เก็บ cache เป็นไฟล์ (เขียนแบบ atomic ด้วย os.replace) ใช้ร่วมกันได้หลาย process
+
+    lock() ใช้ fcntl.flock เพื่อให้ worker อื่นที่ขอ key เดียวกันรอผลแทนการ render ซ้ำ
+    """
+
+    def __init__(self, directory, max_entries=2048):
+        super().__init__()
+        self.directory = directory
+        self.max_entries = max_entries
+        self._writes = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key, suffix='.html'):
+        digest = hashlib.sha256(key.encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, digest + suffix)
+
+    def get(self, key):
+        try:
+            with open(self._path(key), 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def set(self, key, value):
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(value)
+            os.replace(tmp_path, self._path(key))
+        except OSError:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            return
+        self._writes += 1
+        if self._writes % 64 == 0:
+            self._prune()
+
+    def _prune(self):
+        """ลบไฟล์ที่เก่าที่สุดเมื่อจำนวนไฟล์เกิน max_entries และลบไฟล์ lock ที่ค้างนานเกิน 1 ชั่วโมง"""
+        try:
+            scanned = list(os.scandir(self.directory))
+        except OSError:
+            return
+        stale_before = time.time() - 3600
+        for entry in scanned:
+            if entry.name.endswith('.lock') and entry.stat().st_mtime < stale_before:
+                try:
+                    os.unlink(entry.path)
+                except OSError:
+                    pass
+        entries = [entry for entry in scanned if entry.name.endswith('.html')]
+        if len(entries) <= self.max_entries:
+            return
+        entries.sort(key=lambda entry: entry.stat().st_mtime)
+        for entry in entries[:len(entries) - self.max_entries]:
+            try:
+                os.unlink(entry.path)
+            except OSError:
+                pass
+
+    def clear(self):
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.html'):
+                os.unlink(entry.path)
+
+    @contextmanager
+    def lock(self, key):
+        with self._locks.hold(key):
+            if fcntl is None:
+                yield
+                return
+            with open(self._path(key, '.lock'), 'a') as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+class TieredCache(CacheBackend):
+    """อ่านจาก memory ก่อน ถ้าไม่พบค่อยอ่านจาก filesystem แล้วเก็บกลับเข้า memory"""
+
+    def __init__(self, front, back):
+        super().__init__()
+        self.front = front
+        self.back = back
+
+    def get(self, key):
+        value = self.front.get(key)
+        if value is None:
+            value = self.back.get(key)
+            if value is not None:
+                self.front.set(key, value)
+        return value
+
+    def set(self, key, value):
+        self.front.set(key, value)
+        self.back.set(key, value)
+
+    def clear(self):
+        self.front.clear()
+        self.back.clear()
+
+    @contextmanager
+    def lock(self, key):
+        with self.back.lock(key):
+            yield
+
+
+class PageCache:
+    """ส่วนที่ view เรียกใช้: get_or_render() รวม cache miss ที่มาพร้อมกันให้ render ครั้งเดียว"""
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_render(self, key, render):
+        """คืนค่า bytes ของหน้าที่ cache ไว้ หรือเรียก render() (คืน str) แล้วเก็บผลไว้"""
+        value = self.backend.get(key)
+        if value is not None:
+            self.hits += 1
+            return value
+
+        with self.backend.lock(key):
+            # อาจมี request อื่น render เสร็จไปแล้วระหว่างที่รอ lock
+            value = self.backend.get(key)
+            if value is not None:
+                self.hits += 1
+                return value
+            self.misses += 1
+            value = render().encode('utf-8')
+            self.backend.set(key, value)
+            return value
+
+    def clear(self):
+        self.backend.clear()
+
+
+def create_backend(name, directory=None, max_entries=256, max_bytes=32 * 1024 * 1024):
+    """สร้าง backend ตามชื่อใน config: memory, filesystem, tiered หรือ none"""
+    if name == 'memory':
+        return MemoryCache(max_entries=max_entries, max_bytes=max_bytes)
+    if name == 'filesystem':
+        return FileSystemCache(directory)
+    if name == 'tiered':
+        return TieredCache(MemoryCache(max_entries=max_entries, max_bytes=max_bytes), FileSystemCache(directory))
+    if name == 'none':
+        return NullCache()
+    raise ValueError(f'Unknown PAGE_CACHE_BACKEND: {name}')
@@ -0,0 +1,263 @@
+# -*- coding: utf-8 -*-
+"""
+Full-text search index สำหรับ Guidelines, ความรู้ และกิจกรรม
+
+ภาษาไทยไม่มีช่องว่างระหว่างคำ จึงใช้ดัชนีแบบ trigram (n-gram 3 ตัวอักษร)
+แทนการตัดคำ ทำให้ค้นหาคำย่อยกลางประโยคได้โดยไม่ต้องมีพจนานุกรม
+
+- SQLite: ตารางเสมือน FTS5 ที่ใช้ tokenizer แบบ trigram (ต้องการ SQLite 3.34 ขึ้นไป)
+- PostgreSQL: ตารางปกติ + GIN index แบบ gin_trgm_ops ของ extension pg_trgm
+  ซึ่งทำให้ ILIKE '%คำ%' ใช้ index ได้
+
+trigram ใช้กับคำค้นที่สั้นกว่า 3 ตัวอักษรไม่ได้ แต่คำไทยสองตัวอักษรและตัวย่อเป็นคำค้นที่พบบ่อย จึงเก็บ
+bigram (คู่ตัวอักษรที่ติดกันในแต่ละคำของเอกสาร) ไว้อีกชุด แต่ละ bigram เขียนเป็น token 'g<hex ของ UTF-8>'
+tokenizer ใดก็ตัดเป็นคำเดียวได้เสมอ (SQLite: ตาราง FTS5 search_index_bigram, PostgreSQL: คอลัมน์ grams + GIN)
+คำค้นสองตัวอักษรใช้ดัชนีนี้หาเอกสารที่เป็นไปได้แล้วตรวจซ้ำด้วย LIKE ส่วนคำค้นตัวอักษรเดียวยังเป็น
+LIKE '%x%' ที่ไม่ใช้ index (ไล่ทุกแถวของดัชนีค้นหา)
+"""
+
+import re
+
+from markupsafe import Markup, escape
+from sqlalchemy import inspect, text
+
+# แปลง doc_type เป็นตัวเลขเพื่อใช้ประกอบ rowid ของ FTS5 (rowid = doc_id * 4 + code)
+DOC_TYPE_CODES = {'guideline': 1, 'knowledge': 2, 'activity': 3}
+
+# trigram ต้องการคำค้นอย่างน้อย 3 ตัวอักษรจึงจะใช้ index ได้ คำที่สั้นกว่าใช้ bigram
+MIN_INDEXED_TERM_LENGTH = 3
+MIN_BIGRAM_TERM_LENGTH = 2
+
+
+def split_terms(query):
+    """แยกคำค้นตามช่องว่าง ตัดคำซ้ำ และคงลำดับเดิมไว้"""
+    terms = []
+    for term in query.split():
+        if term.casefold() not in (t.casefold() for t in terms):
+            terms.append(term)
+    return terms
+
+
+def _gram_token(gram):
+    return 'g' + gram.encode('utf-8').hex()
+
+
+def bigram_tokens(*values):
+    """token ของ bigram ทั้งหมด (ไม่ซ้ำ) ในแต่ละคำของ values หลัง casefold คั่นด้วยช่องว่าง"""
+    grams = set()
+    for value in values:
+        for word in (value or '').casefold().split():
+            grams.update(word[i:i + 2] for i in range(len(word) - 1))
+    return ' '.join(sorted(_gram_token(gram) for gram in grams))
+
+
+def _like_pattern(term):
+    escaped = term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return f'%{escaped}%'
+
+
+def highlight(value, terms, width=160):
+    """ตัดข้อความรอบคำที่พบครั้งแรก และครอบคำค้นด้วย <mark> (escape HTML ให้แล้ว)"""
+    value = value or ''
+    if not terms:
+        return Markup(escape(value[:width]))
+
+    pattern = re.compile('|'.join(re.escape(term) for term in terms), re.IGNORECASE)
+    match = pattern.search(value)
+    start = 0
+    if match and len(value) > width:
+        start = max(0, min(match.start() - width // 3, len(value) - width))
+    excerpt = value[start:start + width]
+
+    parts = []
+    last = 0
+    for found in pattern.finditer(excerpt):
+        parts.append(escape(excerpt[last:found.start()]))
+        parts.append(Markup('<mark>%s</mark>') % found.group(0))
+        last = found.end()
+    parts.append(escape(excerpt[last:]))
+
+    result = Markup('').join(parts)
+    if start > 0:
+        result = Markup('&hellip;') + result
+    if start + width < len(value):
+        result = result + Markup('&hellip;')
+    return result
+
+
+class SearchIndex:
+    """ดัชนีค้นหาที่ใช้ได้ทั้ง SQLite และ PostgreSQL
+
+    ทุกเมธอดรับ connection ของ SQLAlchemy เพื่อให้เขียนดัชนีใน transaction เดียวกับข้อมูลหลัก
+    """
+
+    table = 'search_index'
+    bigram_table = 'search_index_bigram'
+
+    def __init__(self):
+        # ถ้าฐานข้อมูลไม่รองรับ (เช่น SQLite ที่ไม่มี FTS5) จะปิดการค้นหาแทนที่จะทำให้การบันทึกข้อมูลล้มเหลว
+        self.available = False
+
+    def create_schema(self, connection):
+        """สร้างตาราง/ดัชนีถ้ายังไม่มี คืนค่า True ถ้าเพิ่งสร้างใหม่ (ควร rebuild ต่อ)"""
+        existed = inspect(connection).has_table(self.table)
+        if connection.dialect.name == 'postgresql':
+            connection.execute(text('CREATE EXTENSION IF NOT EXISTS pg_trgm'))
+            connection.execute(text(
+                f'CREATE TABLE IF NOT EXISTS {self.table} ('
+                ' doc_type VARCHAR(20) NOT NULL,'
+                ' doc_id INTEGER NOT NULL,'
+                ' department_id INTEGER NOT NULL,'
+                " title TEXT NOT NULL DEFAULT '',"
+                " body TEXT NOT NULL DEFAULT '',"
+                " grams TEXT NOT NULL DEFAULT '',"
+                ' PRIMARY KEY (doc_type, doc_id))'
+            ))
+            connection.execute(text(f"ALTER TABLE {self.table} ADD COLUMN IF NOT EXISTS grams TEXT NOT NULL DEFAULT ''"))
+            connection.execute(text(
+                f'CREATE INDEX IF NOT EXISTS idx_{self.table}_trgm ON {self.table} '
+                "USING gin ((title || ' ' || body) gin_trgm_ops)"
+            ))
+            connection.execute(text(
+                f'CREATE INDEX IF NOT EXISTS idx_{self.table}_grams ON {self.table} '
+                "USING gin (to_tsvector('simple', grams))"
+            ))
+        else:
+            connection.execute(text(
+                f'CREATE VIRTUAL TABLE IF NOT EXISTS {self.table} USING fts5('
+                ' title, body, doc_type UNINDEXED, doc_id UNINDEXED, department_id UNINDEXED,'
+                " tokenize = 'trigram')"
+            ))
+            # rowid เดียวกับ search_index, ใช้แค่หาเอกสารที่มี bigram จึงไม่เก็บตำแหน่ง (detail=none)
+            connection.execute(text(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {self.bigram_table} USING fts5(grams, detail = 'none')"
+            ))
+        self.available = True
+        return not existed
+
+    def upsert(self, connection, doc_type, doc_id, department_id, title, body):
+        params = {
+            'doc_type': doc_type, 'doc_id': doc_id, 'department_id': department_id,
+            'title': title or '', 'body': body or '', 'grams': bigram_tokens(title, body),
+        }
+        if connection.dialect.name == 'postgresql':
+            connection.execute(text(
+                f'INSERT INTO {self.table} (doc_type, doc_id, department_id, title, body, grams) '
+                'VALUES (:doc_type, :doc_id, :department_id, :title, :body, :grams) '
+                'ON CONFLICT (doc_type, doc_id) DO UPDATE SET '
+                'department_id = EXCLUDED.department_id, title = EXCLUDED.title, body = EXCLUDED.body,'
+                ' grams = EXCLUDED.grams'
+            ), params)
+        else:
+            # FTS5 ไม่มี UPSERT จึงลบแถวเดิม (ค้นหาด้วย rowid) แล้วเพิ่มใหม่
+            params['rowid'] = self._rowid(doc_type, doc_id)
+            for table in (self.table, self.bigram_table):
+                connection.execute(text(f'DELETE FROM {table} WHERE rowid = :rowid'), params)
+            connection.execute(text(
+                f'INSERT INTO {self.table} (rowid, title, body, doc_type, doc_id, department_id) '
+                'VALUES (:rowid, :title, :body, :doc_type, :doc_id, :department_id)'
+            ), params)
+            connection.execute(text(
+                f'INSERT INTO {self.bigram_table} (rowid, grams) VALUES (:rowid, :grams)'
+            ), params)
+
+    def delete(self, connection, doc_type, doc_id):
+        if connection.dialect.name == 'postgresql':
+            connection.execute(
+                text(f'DELETE FROM {self.table} WHERE doc_type = :doc_type AND doc_id = :doc_id'),
+                {'doc_type': doc_type, 'doc_id': doc_id}
+            )
+        else:
+            for table in (self.table, self.bigram_table):
+                connection.execute(
+                    text(f'DELETE FROM {table} WHERE rowid = :rowid'),
+                    {'rowid': self._rowid(doc_type, doc_id)}
+                )
+
+    def delete_department(self, connection, department_id):
+        if connection.dialect.name != 'postgresql':
+            connection.execute(
+                text(f'DELETE FROM {self.bigram_table} WHERE rowid IN '
+                     f'(SELECT rowid FROM {self.table} WHERE department_id = :department_id)'),
+                {'department_id': department_id}
+            )
+        connection.execute(
+            text(f'DELETE FROM {self.table} WHERE department_id = :department_id'),
+            {'department_id': department_id}
+        )
+
+    def rebuild(self, connection, documents):
+        """ล้างดัชนีแล้วสร้างใหม่จาก documents (iterable ของ tuple แบบเดียวกับ upsert)"""
+        connection.execute(text(f'DELETE FROM {self.table}'))
+        if connection.dialect.name != 'postgresql':
+            connection.execute(text(f'DELETE FROM {self.bigram_table}'))
+        count = 0
+        for document in documents:
+            self.upsert(connection, *document)
+            count += 1
+        return count
+
+    def search(self, connection, query, limit=20, offset=0):
+        """ค้นหาและเรียงตามความเกี่ยวข้อง คืนค่า (จำนวนทั้งหมด, รายการผลลัพธ์)
+
+        ผลลัพธ์แต่ละรายการเป็น dict ที่มี doc_type, doc_id, department_id,
+        department_name, title, body และ score
+        """
+        terms = split_terms(query)
+        if not terms:
+            return 0, []
+        if connection.dialect.name == 'postgresql':
+            where, order, params = self._postgres_clauses(terms, query)
+        else:
+            where, order, params = self._sqlite_clauses(terms)
+
+        base = f'FROM {self.table} s JOIN department d ON d.id = s.department_id WHERE {where}'
+        total = connection.execute(text(f'SELECT count(*) {base}'), params).scalar()
+        if not total:
+            return 0, []
+        rows = connection.execute(text(
+            f'SELECT s.doc_type, s.doc_id, s.department_id, d.name AS department_name,'
+            f' s.title, s.body, {order} AS score {base} ORDER BY score DESC, s.doc_id DESC'
+            ' LIMIT :limit OFFSET :offset'
+        ), {**params, 'limit': limit, 'offset': offset}).mappings().all()
+        return total, [dict(row) for row in rows]
+
+    def _sqlite_clauses(self, terms):
+        indexed = [term for term in terms if len(term) >= MIN_INDEXED_TERM_LENGTH]
+        short = [term for term in terms if len(term) < MIN_INDEXED_TERM_LENGTH]
+        clauses = []
+        params = {}
+        if indexed:
+            # ครอบทุกคำด้วย "..." เพื่อไม่ให้ตีความเป็น syntax ของ FTS5
+            params['match'] = ' '.join('"%s"' % term.replace('"', '""') for term in indexed)
+            clauses.append(f'{self.table} MATCH :match')
+        grams = bigram_tokens(*[term for term in short if len(term) >= MIN_BIGRAM_TERM_LENGTH])
+        if grams:
+            # token เป็น g<hex> ล้วน ใช้ใน MATCH ได้ตรงๆ (หลาย token = AND) แล้วตรวจคำจริงด้วย LIKE ข้างล่าง
+            params['grams'] = grams
+            clauses.append(f's.rowid IN (SELECT rowid FROM {self.bigram_table} WHERE {self.bigram_table} MATCH :grams)')
+        for i, term in enumerate(short):
+            params[f'short{i}'] = _like_pattern(term)
+            clauses.append(f"(s.title LIKE :short{i} ESCAPE '\\' OR s.body LIKE :short{i} ESCAPE '\\')")
+        # bm25 ยิ่งน้อยยิ่งเกี่ยวข้อง จึงกลับเครื่องหมาย และให้น้ำหนักชื่อเรื่องมากกว่าเนื้อหา
+        order = f'-bm25({self.table}, 10.0, 1.0)' if indexed else '0'
+        return ' AND '.join(clauses), order, params
+
+    def _postgres_clauses(self, terms, query):
+        clauses = []
+        params = {'query': query}
+        for i, term in enumerate(terms):
+            params[f'term{i}'] = _like_pattern(term)
+            clauses.append(f"(s.title || ' ' || s.body) ILIKE :term{i} ESCAPE '\\'")
+        # trigram ช่วยคำสั้นไม่ได้ ให้ GIN ของ grams หาเอกสารก่อน ILIKE
+        grams = bigram_tokens(*[term for term in terms
+                                if MIN_BIGRAM_TERM_LENGTH <= len(term) < MIN_INDEXED_TERM_LENGTH])
+        if grams:
+            params['grams'] = grams.replace(' ', ' & ')
+            clauses.append("to_tsvector('simple', s.grams) @@ to_tsquery('simple', :grams)")
+        order = "similarity(s.title, :query) * 2 + word_similarity(:query, s.title || ' ' || s.body)"
+        return ' AND '.join(clauses), order, params
+
+    @staticmethod
+    def _rowid(doc_type, doc_id):
+        return int(doc_id) * 4 + DOC_TYPE_CODES[doc_type]
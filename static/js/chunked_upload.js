@@ -0,0 +1,138 @@
+// อัปโหลดไฟล์แบบแบ่ง chunk ก่อนส่งฟอร์ม
+// ใช้กับ <form data-chunked-upload="URL ของ /admin/uploads/chunked"> ที่ไม่ได้เปิดการอัปโหลดตรง (data-direct-upload)
+// ไฟล์ถูกส่งทีละ chunk พร้อม SHA-256 ถ้าการเชื่อมต่อหลุดจะถามเซิร์ฟเวอร์ว่าได้รับถึงไหนแล้วและส่งต่อจากตรงนั้น
+// เมื่อครบแล้วจึงส่งฟอร์มเดิมพร้อมฟิลด์ <ชื่อฟิลด์>_upload_id แทนตัวไฟล์
+(function () {
+    const MAX_RETRIES = 6;
+
+    if (!window.crypto || !window.crypto.subtle || !window.fetch) {
+        return;  // เบราว์เซอร์เก่า/ไม่ใช่ https: ส่งไฟล์แบบฟอร์มปกติ
+    }
+
+    async function sha256Hex(buffer) {
+        const digest = await crypto.subtle.digest('SHA-256', buffer);
+        return Array.from(new Uint8Array(digest)).map(b => b.toString(16).padStart(2, '0')).join('');
+    }
+
+    function storageKey(file) {
+        return `chunked-upload:${file.name}:${file.size}:${file.lastModified}`;
+    }
+
+    function sleep(ms) {
+        return new Promise(resolve => setTimeout(resolve, ms));
+    }
+
+    async function call(url, options) {
+        const response = await fetch(url, Object.assign({credentials: 'same-origin'}, options));
+        const data = await response.json().catch(() => ({}));
+        return {response, data};
+    }
+
+    async function startOrResume(baseUrl, file) {
+        // ไฟล์เดิม (ชื่อ ขนาด และเวลาแก้ไขตรงกัน) ที่เคยอัปโหลดค้างไว้ ให้ต่อจากเดิม
+        const saved = localStorage.getItem(storageKey(file));
+        if (saved) {
+            const {response, data} = await call(`${baseUrl}/${saved}`);
+            if (response.ok) {
+                return data;
+            }
+            localStorage.removeItem(storageKey(file));
+        }
+        const {response, data} = await call(baseUrl, {
+            method: 'POST',
+            headers: {'Content-Type': 'application/json'},
+            body: JSON.stringify({filename: file.name, size: file.size})
+        });
+        if (!response.ok) {
+            throw new Error(data.error || `HTTP ${response.status}`);
+        }
+        localStorage.setItem(storageKey(file), data.upload_id);
+        return data;
+    }
+
+    async function uploadFile(baseUrl, file, onProgress) {
+        let state = await startOrResume(baseUrl, file);
+        let failures = 0;
+        onProgress(state.received / state.size);
+
+        while (!state.complete) {
+            const index = state.next_index;
+            const start = index * state.chunk_size;
+            const buffer = await file.slice(start, Math.min(start + state.chunk_size, file.size)).arrayBuffer();
+            try {
+                const {response, data} = await call(`${baseUrl}/${state.upload_id}/${index}`, {
+                    method: 'PUT',
+                    headers: {'Content-Type': 'application/octet-stream', 'X-Chunk-SHA256': await sha256Hex(buffer)},
+                    body: buffer
+                });
+                if (response.status === 404) {
+                    localStorage.removeItem(storageKey(file));
+                    throw new Error('การอัปโหลดหมดอายุแล้ว กรุณาลองใหม่');
+                }
+                if (!response.ok) {
+                    throw new Error(data.error || `HTTP ${response.status}`);
+                }
+                state = data;
+                failures = 0;
+            } catch (error) {
+                if (++failures > MAX_RETRIES || error.message.startsWith('การอัปโหลดหมดอายุ')) {
+                    throw error;
+                }
+                await sleep(Math.min(30000, 500 * 2 ** failures));
+                // ถามเซิร์ฟเวอร์ว่าได้รับถึงไหนแล้ว แล้วส่งต่อจากตรงนั้น
+                const {response, data} = await call(`${baseUrl}/${state.upload_id}`).catch(() => ({response: {ok: false}}));
+                if (response.ok) {
+                    state = data;
+                }
+            }
+            onProgress(state.received / state.size);
+        }
+        localStorage.removeItem(storageKey(file));
+        return state.upload_id;
+    }
+
+    function progressBar(input) {
+        const wrapper = document.createElement('div');
+        wrapper.className = 'progress mt-2';
+        wrapper.innerHTML = '<div class="progress-bar progress-bar-striped progress-bar-animated" role="progressbar" style="width: 0%">0%</div>';
+        input.insertAdjacentElement('afterend', wrapper);
+        const bar = wrapper.firstElementChild;
+        return ratio => {
+            const percent = Math.floor(ratio * 100);
+            bar.style.width = `${percent}%`;
+            bar.textContent = `${percent}%`;
+        };
+    }
+
+    document.addEventListener('DOMContentLoaded', function () {
+        // ฟอร์มที่อัปโหลดตรงไป Cloudinary ได้ (direct_upload.js) ไม่ต้องส่งไฟล์ผ่านเซิร์ฟเวอร์
+        document.querySelectorAll('form[data-chunked-upload]:not([data-direct-upload])').forEach(form => {
+            form.addEventListener('submit', async event => {
+                // เฉพาะช่องเลือกไฟล์ที่แสดงอยู่และเลือกไฟล์แล้ว
+                const inputs = Array.from(form.querySelectorAll('input[type="file"]'))
+                    .filter(input => input.files.length && input.offsetParent !== null);
+                if (!inputs.length) {
+                    return;
+                }
+                event.preventDefault();
+                const submitButtons = form.querySelectorAll('[type="submit"]');
+                submitButtons.forEach(button => { button.disabled = true; });
+                try {
+                    for (const input of inputs) {
+                        const uploadId = await uploadFile(form.dataset.chunkedUpload, input.files[0], progressBar(input));
+                        const hidden = document.createElement('input');
+                        hidden.type = 'hidden';
+                        hidden.name = `${input.name}_upload_id`;
+                        hidden.value = uploadId;
+                        form.appendChild(hidden);
+                        input.disabled = true;  // ไม่ต้องส่งตัวไฟล์ซ้ำไปกับฟอร์ม
+                    }
+                    form.submit();
+                } catch (error) {
+                    alert(`อัปโหลดไฟล์ไม่สำเร็จ: ${error.message}\nกดบันทึกอีกครั้งเพื่ออัปโหลดต่อจากส่วนที่ส่งไปแล้ว`);
+                    submitButtons.forEach(button => { button.disabled = false; });
+                }
+            });
+        });
+    });
+})();
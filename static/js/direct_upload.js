@@ -0,0 +1,121 @@
+// อัปโหลดไฟล์ตรงจาก browser ไป Cloudinary (ไฟล์ไม่ผ่านเซิร์ฟเวอร์ของเรา)
+// ใช้กับ <form data-direct-upload="URL ของ /admin/uploads/direct/sign" data-upload-kind="guideline|knowledge|activity">
+// 1. ขอพารามิเตอร์ที่เซ็นแล้วสำหรับโฟลเดอร์ของหน่วยงาน
+// 2. POST ไฟล์ไป Cloudinary (ไฟล์ใหญ่แบ่งส่งทีละ chunk ตามโปรโตคอลของ Cloudinary)
+// 3. ส่งฟอร์มเดิมพร้อมฟิลด์ <ชื่อฟิลด์>_direct ที่มี public_id/version/signature ให้เซิร์ฟเวอร์ตรวจ
+(function () {
+    const CHUNK_SIZE = 20 * 1024 * 1024;  // Cloudinary กำหนดอย่างน้อย 5MB ต่อ chunk (ยกเว้น chunk สุดท้าย)
+
+    function departmentId(form) {
+        const select = form.querySelector('[name="department_id"]');
+        return select ? select.value : form.dataset.departmentId;
+    }
+
+    async function sign(form) {
+        const response = await fetch(form.dataset.directUpload, {
+            method: 'POST',
+            credentials: 'same-origin',
+            headers: {'Content-Type': 'application/json'},
+            body: JSON.stringify({kind: form.dataset.uploadKind, department_id: departmentId(form)})
+        });
+        const data = await response.json().catch(() => ({}));
+        if (!response.ok) {
+            throw new Error(data.error || `HTTP ${response.status}`);
+        }
+        return data;
+    }
+
+    function send(params, blob, headers, onProgress) {
+        // ใช้ XMLHttpRequest เพราะ fetch ยังรายงานความคืบหน้าการส่งไม่ได้
+        return new Promise((resolve, reject) => {
+            const body = new FormData();
+            ['api_key', 'timestamp', 'signature', 'folder'].forEach(name => body.append(name, params[name]));
+            body.append('file', blob);
+            const xhr = new XMLHttpRequest();
+            xhr.open('POST', params.upload_url);
+            Object.entries(headers).forEach(([name, value]) => xhr.setRequestHeader(name, value));
+            xhr.upload.onprogress = event => onProgress(event.loaded);
+            xhr.onload = () => {
+                const data = JSON.parse(xhr.responseText || '{}');
+                if (xhr.status >= 200 && xhr.status < 300) {
+                    resolve(data);
+                } else {
+                    reject(new Error((data.error && data.error.message) || `HTTP ${xhr.status}`));
+                }
+            };
+            xhr.onerror = () => reject(new Error('การเชื่อมต่อกับ Cloudinary ล้มเหลว'));
+            xhr.send(body);
+        });
+    }
+
+    async function uploadFile(form, file, onProgress) {
+        const params = await sign(form);
+        if (file.size <= CHUNK_SIZE) {
+            return send(params, file, {}, loaded => onProgress(loaded / file.size));
+        }
+        const uniqueId = `${params.timestamp}-${Math.random().toString(36).slice(2)}`;
+        let result = null;
+        for (let start = 0; start < file.size; start += CHUNK_SIZE) {
+            const end = Math.min(start + CHUNK_SIZE, file.size);
+            result = await send(params, file.slice(start, end), {
+                'X-Unique-Upload-Id': uniqueId,
+                'Content-Range': `bytes ${start}-${end - 1}/${file.size}`
+            }, loaded => onProgress((start + loaded) / file.size));
+        }
+        return result;  // chunk สุดท้ายได้ผลลัพธ์ของไฟล์ทั้งไฟล์
+    }
+
+    function progressBar(input) {
+        const wrapper = document.createElement('div');
+        wrapper.className = 'progress mt-2';
+        wrapper.innerHTML = '<div class="progress-bar progress-bar-striped progress-bar-animated bg-success" role="progressbar" style="width: 0%">0%</div>';
+        input.insertAdjacentElement('afterend', wrapper);
+        const bar = wrapper.firstElementChild;
+        return ratio => {
+            const percent = Math.min(100, Math.floor(ratio * 100));
+            bar.style.width = `${percent}%`;
+            bar.textContent = `${percent}%`;
+        };
+    }
+
+    document.addEventListener('DOMContentLoaded', function () {
+        document.querySelectorAll('form[data-direct-upload]').forEach(form => {
+            form.addEventListener('submit', async event => {
+                const inputs = Array.from(form.querySelectorAll('input[type="file"]'))
+                    .filter(input => input.files.length && input.offsetParent !== null);
+                if (!inputs.length) {
+                    return;
+                }
+                event.preventDefault();
+                const submitButtons = form.querySelectorAll('[type="submit"]');
+                submitButtons.forEach(button => { button.disabled = true; });
+                try {
+                    for (const input of inputs) {
+                        const file = input.files[0];
+                        const result = await uploadFile(form, file, progressBar(input));
+                        const hidden = document.createElement('input');
+                        hidden.type = 'hidden';
+                        hidden.name = `${input.name}_direct`;
+                        hidden.value = JSON.stringify({
+                            public_id: result.public_id,
+                            version: result.version,
+                            signature: result.signature,
+                            resource_type: result.resource_type,
+                            format: result.format,
+                            bytes: result.bytes,
+                            width: result.width,
+                            height: result.height,
+                            original_filename: file.name
+                        });
+                        form.appendChild(hidden);
+                        input.disabled = true;  // ไม่ต้องส่งตัวไฟล์ไปกับฟอร์ม
+                    }
+                    form.submit();
+                } catch (error) {
+                    alert(`อัปโหลดไฟล์ไม่สำเร็จ: ${error.message}`);
+                    submitButtons.forEach(button => { button.disabled = false; });
+                }
+            });
+        });
+    });
+})();
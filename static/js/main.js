@@ -37,10 +37,11 @@ document.addEventListener('DOMContentLoaded', function() {
 // File validation function
 function validateFile(event) {
     const file = event.target.files[0];
-    const maxSize = 50 * 1024 * 1024; // 50MB
+    // ฟอร์มที่อัปโหลดแบบแบ่ง chunk กำหนดขนาดสูงสุดไว้ใน data-max-size
+    const maxSize = Number(event.target.dataset.maxSize) || 50 * 1024 * 1024;
     
     if (file && file.size > maxSize) {
-        alert('ไฟล์มีขนาดใหญ่เกินไป (สูงสุด 50MB)');
+        alert(`ไฟล์มีขนาดใหญ่เกินไป (สูงสุด ${Math.floor(maxSize / 1048576)}MB)`);
         event.target.value = '';
         return false;
     }
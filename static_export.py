@@ -0,0 +1,214 @@
+# -*- coding: utf-8 -*-
+"""
+ส่งออกหน้า public (หน้าแรกและหน้าหน่วยงาน) เป็นไฟล์ HTML พร้อม static/ ให้ nginx หรือ CDN ส่งแทน Flask
+
+โครงสร้างของ directory ที่ส่งออก:
+
+    <root>/current -> releases/<ชื่อ release>   (symlink ที่ nginx ใช้เป็น root)
+    <root>/releases/<ชื่อ release>/index.html
+                                  /department/<id>/index.html
+                                  /static/...
+                                  /.export-manifest.json   (sha256 ของแต่ละหน้า ใช้หาหน้าที่เปลี่ยน)
+
+แต่ละรอบสร้าง release ใหม่โดย hardlink ไฟล์ทั้งหมดจาก release ปัจจุบัน (ไม่กินพื้นที่เพิ่ม) แล้วเขียนเฉพาะหน้าที่
+เนื้อหาเปลี่ยน ไฟล์ที่จะเขียนทับถูก unlink ก่อนเสมอเพื่อไม่ให้ไปแก้ inode ที่ release เก่ายังใช้อยู่ สุดท้ายสลับ
+symlink current ด้วย rename ซึ่ง atomic ผู้ใช้จึงไม่เห็นหน้าครึ่งๆ กลางๆ หรือหน้าจากสอง release ปนกัน
+
+render ผ่าน test client ในฐานะผู้ใช้ที่ไม่ได้ล็อกอิน จึงได้ HTML เดียวกับที่ Flask ตอบ (และใช้ page cache เดียวกัน)
+"""
+
+import hashlib
+import json
+import os
+import shutil
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+MANIFEST_NAME = '.export-manifest.json'
+
+# ใส่ใน environ ของ request ที่ใช้ render เพื่อให้แอปแยกออกจากการเปิดหน้าจริง (เช่นไม่นับสถิติการใช้งาน)
+EXPORT_ENVIRON_KEY = 'ha.static_export'
+
+
+class ExportError(Exception):
+    pass
+
+
+def page_file(url):
+    """path ของไฟล์ใน release สำหรับ URL: '/' -> index.html, '/department/3' -> department/3/index.html"""
+    parts = [part for part in url.strip('/').split('/') if part]
+    if any(part in ('.', '..') for part in parts):
+        raise ExportError(f'Invalid page URL: {url}')
+    return '/'.join(parts + ['index.html'])
+
+
+def _unlink(path):
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+
+
+def _write(path, data):
+    """เขียนไฟล์ใหม่เสมอ (ไฟล์เดิมอาจเป็น hardlink ที่ release ก่อนหน้าใช้ร่วมอยู่)"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    _unlink(path)
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+class StaticExporter:
+    def __init__(self, app, root, list_pages, keep_releases=3):
+        self.app = app
+        self.root = root
+        self.list_pages = list_pages  # ฟังก์ชันที่คืน URL ของทุกหน้าที่ต้องส่งออก (เรียกใน app context)
+        self.keep_releases = max(keep_releases, 1)
+        self.exports = 0
+
+    @property
+    def current(self):
+        return os.path.join(self.root, 'current')
+
+    @property
+    def releases_dir(self):
+        return os.path.join(self.root, 'releases')
+
+    def current_release(self):
+        """path จริงของ release ที่ current ชี้อยู่ หรือ None ถ้ายังไม่เคยส่งออก"""
+        if not os.path.islink(self.current):
+            return None
+        return os.path.realpath(self.current)
+
+    def read_manifest(self):
+        release = self.current_release()
+        if release is None:
+            return {}
+        try:
+            with open(os.path.join(release, MANIFEST_NAME), encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    @contextmanager
+    def _exclusive(self):
+        """ส่งออกได้ทีละ process (คำสั่ง CLI กับ worker ที่ส่งออกหลังแอดมินแก้ไข) ไม่มี fcntl บน Windows จึงไม่ lock"""
+        os.makedirs(self.root, exist_ok=True)
+        try:
+            import fcntl
+        except ImportError:
+            yield
+            return
+        with open(os.path.join(self.root, 'export.lock'), 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            yield
+
+    def render(self, url):
+        """HTML ของหน้า หรือ None ถ้าหน้านั้นไม่มีแล้ว (404)"""
+        # app context ใหม่เสมอ ถ้าเรียกระหว่าง request ของแอดมิน (UPLOAD_MODE=sync) request จำลองจะไม่ใช้ g/session
+        # ของแอดมินร่วม ซึ่งทำให้ได้หน้าที่มีเมนูแอดมิน
+        with self.app.app_context():
+            response = self.app.test_client().get(url, environ_base={EXPORT_ENVIRON_KEY: True})
+        if response.status_code == 404:
+            return None
+        if response.status_code != 200:
+            raise ExportError(f'{url}: HTTP {response.status_code}')
+        return response.get_data()
+
+    def plan(self, urls=None):
+        """render หน้าแล้วเทียบกับ manifest ของ release ปัจจุบัน
+
+        urls=None คือส่งออกทั้งหมด หน้าที่อยู่ใน manifest แต่ไม่อยู่ใน list_pages() แล้วจะถูกลบ
+        คืน (pages, changes) โดย pages = {ไฟล์: (URL, HTML หรือ None ถ้าต้องลบ)}
+        และ changes = [(สถานะ added/changed/removed, URL)] เฉพาะหน้าที่ต่างจากเดิม
+        """
+        manifest = self.read_manifest()
+        full = urls is None
+        if full:
+            urls = list(self.list_pages())
+        pages, changes = {}, []
+        for url in urls:
+            path = page_file(url)
+            data = self.render(url)
+            pages[path] = (url, data)
+            old = manifest.get(path)
+            if data is None:
+                if old is not None:
+                    changes.append(('removed', url))
+            elif old is None:
+                changes.append(('added', url))
+            elif old['sha256'] != hashlib.sha256(data).hexdigest():
+                changes.append(('changed', url))
+        if full:
+            for path, entry in manifest.items():
+                if path not in pages:
+                    pages[path] = (entry['url'], None)
+                    changes.append(('removed', entry['url']))
+        return pages, changes
+
+    def export(self, urls=None, dry_run=False):
+        """ส่งออกหน้าตาม urls (None = ทุกหน้าและ static/ ทั้งหมด) คืนรายการหน้าที่เปลี่ยน
+
+        ถ้าไม่มีหน้าใดเปลี่ยนจะไม่สร้าง release ใหม่ (ยกเว้นส่งออกทั้งหมด ซึ่งคัดลอก static/ ใหม่เสมอ)
+        """
+        with self._exclusive():
+            pages, changes = self.plan(urls)
+            previous = self.current_release()
+            full = urls is None or previous is None
+            if dry_run or not (changes or full):
+                return changes
+
+            os.makedirs(self.releases_dir, exist_ok=True)
+            release = os.path.join(self.releases_dir, datetime.now(timezone.utc).strftime('%Y%m%d-%H%M%S-%f'))
+            if previous is not None:
+                shutil.copytree(previous, release, copy_function=os.link)
+            else:
+                os.makedirs(release)
+            if full:
+                static = os.path.join(release, 'static')
+                shutil.rmtree(static, ignore_errors=True)
+                if self.app.static_folder and os.path.isdir(self.app.static_folder):
+                    shutil.copytree(self.app.static_folder, static)
+
+            manifest = self.read_manifest() if previous is not None else {}
+            for path, (url, data) in pages.items():
+                target = os.path.join(release, *path.split('/'))
+                if data is None:
+                    _unlink(target)
+                    self._remove_empty_dirs(os.path.dirname(target), release)
+                    manifest.pop(path, None)
+                    continue
+                digest = hashlib.sha256(data).hexdigest()
+                if manifest.get(path, {}).get('sha256') != digest:
+                    _write(target, data)
+                    manifest[path] = {'url': url, 'sha256': digest}
+            _write(os.path.join(release, MANIFEST_NAME),
+                   json.dumps(manifest, ensure_ascii=False, indent=1, sort_keys=True).encode('utf-8'))
+
+            self._activate(release)
+            self._prune(release)
+            self.exports += 1
+            return changes
+
+    @staticmethod
+    def _remove_empty_dirs(directory, stop):
+        while os.path.abspath(directory) != os.path.abspath(stop):
+            try:
+                os.rmdir(directory)
+            except OSError:
+                return
+            directory = os.path.dirname(directory)
+
+    def _activate(self, release):
+        """ชี้ current ไปที่ release ใหม่: สร้าง symlink ชั่วคราวแล้ว rename ทับ (atomic บน POSIX)"""
+        temporary = f'{self.current}.{os.getpid()}.tmp'
+        _unlink(temporary)
+        os.symlink(os.path.relpath(release, self.root), temporary)
+        os.replace(temporary, self.current)
+
+    def _prune(self, active):
+        """ลบ release เก่า เก็บไว้ keep_releases ชุดล่าสุด (request ที่กำลังอ่าน release เก่าอยู่ยังอ่านต่อได้จนจบ)"""
+        releases = sorted(os.listdir(self.releases_dir), reverse=True)
+        for name in releases[self.keep_releases:]:
+            path = os.path.join(self.releases_dir, name)
+            if os.path.abspath(path) != os.path.abspath(active):
+                shutil.rmtree(path, ignore_errors=True)
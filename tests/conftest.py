@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+"""
+ตั้ง environment ให้ app.py ใช้ฐานข้อมูล SQLite และ storage ชั่วคราว (app อ่าน config ตอน import จึงต้องตั้งก่อน)
+"""
+
+import os
+import sys
+import tempfile
+
+import pytest
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+WORKDIR = tempfile.mkdtemp(prefix='ha-tests-')
+
+os.environ.update({
+    'DATABASE_URL': 'sqlite:///' + os.path.join(WORKDIR, 'test.db'),
+    'SCHEMA_AUTO_MIGRATE': 'true',
+    'UPLOAD_BACKEND': 'stub',
+    'UPLOAD_MODE': 'sync',
+    'UPLOAD_SPOOL_DIR': os.path.join(WORKDIR, 'spool'),
+    'STORAGE_ROOT': os.path.join(WORKDIR, 'storage'),
+    'PAGE_CACHE_BACKEND': 'none',
+    'USAGE_COUNTERS': 'false',
+    'SLOW_REQUEST_LOG': os.devnull,
+    'STATIC_EXPORT_DIR': '',
+})
+sys.path.insert(0, ROOT)
+
+
+@pytest.fixture(scope='session')
+def app_module():
+    import app
+    return app
+
+
+@pytest.fixture
+def client(app_module):
+    return app_module.app.test_client()
+
+
+class QueryCounter:
+    """เก็บ statement ของทุก engine (engine หลักและ engine อ่านของหน้า public) ระหว่าง with"""
+
+    def __init__(self):
+        self.statements = []
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+    def _record(self, conn, cursor, statement, *args):
+        self.statements.append(statement)
+
+    def __enter__(self):
+        event.listen(Engine, 'before_cursor_execute', self._record)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(Engine, 'before_cursor_execute', self._record)
+
+
+@pytest.fixture
+def admin_client(app_module, client):
+    """client ที่ล็อกอินเป็นแอดมินจาก seed_db แล้ว"""
+    response = client.post('/admin/login', data={'username': 'admin', 'password': 'admin123'})
+    assert response.status_code == 302
+    return client
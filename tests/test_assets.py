@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+"""ไฟล์เนื้อหาเดียวกันใช้ StoredAsset ร่วมกัน ref_count ลดเมื่อลบข้อมูล และ assets-gc ลบเมื่อไม่มีใครใช้แล้ว"""
+
+import io
+import os
+
+
+def upload(m, client, title, data):
+    with m.app.app_context():
+        dept_id = m.db.session.scalars(m.db.select(m.Department.id).order_by(m.Department.id)).first()
+    response = client.post('/admin/upload_guideline', data={
+        'department_id': dept_id, 'title': title, 'description': '', 'upload_type': 'file',
+        'file': (io.BytesIO(data), 'แนวทาง.pdf'),
+    }, content_type='multipart/form-data')
+    assert response.status_code == 302
+    with m.app.app_context():
+        guideline = m.db.session.scalars(m.db.select(m.Guideline).filter_by(title=title)).one()
+        return guideline.id, guideline.file_path
+
+
+def asset(m, url):
+    with m.app.app_context():
+        return m.db.session.scalars(m.db.select(m.StoredAsset).filter_by(secure_url=url)).one_or_none()
+
+
+def test_ref_count_follows_deletes(app_module, admin_client):
+    m = app_module
+    data = b'%PDF-1.4 ' + os.urandom(64)
+    first_id, url = upload(m, admin_client, 'dedup first', data)
+    second_id, second_url = upload(m, admin_client, 'dedup second', data)
+    assert second_url == url  # เนื้อหาเดียวกันไม่อัปโหลดซ้ำ
+    assert url.endswith('.pdf')
+    assert asset(m, url).ref_count == 2
+
+    assert admin_client.post(f'/admin/guidelines/delete/{first_id}').status_code == 302
+    assert asset(m, url).ref_count == 1
+    with m.app.app_context():
+        assert m.collect_unused_assets(grace=-1) == 0  # ยังมีแถวที่ใช้อยู่
+    assert asset(m, url) is not None
+
+    assert admin_client.post(f'/admin/guidelines/delete/{second_id}').status_code == 302
+    stored = asset(m, url)
+    assert stored.ref_count == 0
+    stub_file = os.path.join(m.app.config['STORAGE_ROOT'], 'stub', stored.public_id)
+    assert os.path.exists(stub_file)
+    with m.app.app_context():
+        assert m.collect_unused_assets(grace=-1) == 1
+    assert asset(m, url) is None
+    assert not os.path.exists(stub_file)
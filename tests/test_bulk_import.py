@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+"""นำเข้าข้อมูลจาก manifest ผ่านหน้า /admin/import"""
+
+import io
+import json
+import zipfile
+
+import pytest
+
+
+def department_code(m):
+    with m.app.app_context():
+        return m.db.session.scalars(m.db.select(m.Department.code).order_by(m.Department.id)).first()
+
+
+def upload_manifest(m, client, filename, data):
+    response = client.post('/admin/import', data={'archive': (io.BytesIO(data), filename)},
+                           content_type='multipart/form-data')
+    assert response.status_code == 302
+    import_id = int(response.headers['Location'].rstrip('/').rsplit('/', 1)[1])
+    with m.app.app_context():
+        record = m.db.session.get(m.BulkImport, import_id)
+        return record.status, record.imported, record.error_list
+
+
+def csv_manifest(code, title):
+    return (f'kind,department,title,link,link_type\n'
+            f'guideline,{code},{title},https://example.org/{title},Other\n').encode('utf-8')
+
+
+def json_manifest(code, title):
+    return json.dumps([{'kind': 'guideline', 'department': code, 'title': title,
+                        'link': f'https://example.org/{title}'}], ensure_ascii=False).encode('utf-8')
+
+
+@pytest.mark.parametrize('filename, build', [
+    ('รายการ.csv', csv_manifest),
+    ('รายการนำเข้า.json', json_manifest),
+])
+def test_manifest_with_thai_filename(app_module, admin_client, filename, build):
+    # secure_filename ตัดชื่อภาษาไทยทิ้ง ชนิดของ manifest ต้องยังดูจากนามสกุลได้
+    data = build(department_code(app_module), f'thai-name-{filename}')
+    status, imported, errors = upload_manifest(app_module, admin_client, filename, data)
+    assert (status, imported, errors) == ('done', 1, [])
+
+
+def test_spool_name_keeps_extension(app_module, tmp_path):
+    from uploads import spool_path_for
+    assert spool_path_for(str(tmp_path), 'รายการ.csv').endswith('_upload.csv')
+    assert spool_path_for(str(tmp_path), 'แนวทาง.PDF').endswith('_upload.PDF')
+    assert spool_path_for(str(tmp_path), 'report.pdf').endswith('_report.pdf')
+
+
+def run_import(m, path):
+    result = m.app.test_cli_runner().invoke(args=['import-content', str(path)])
+    assert result.exit_code == 0, result.output
+    with m.app.app_context():
+        record = m.db.session.scalars(m.db.select(m.BulkImport).order_by(m.BulkImport.id.desc())).first()
+        return record.status, record.imported, record.skipped, record.failed, record.error_list
+
+
+def titles(m, model, prefix):
+    with m.app.app_context():
+        return sorted(m.db.session.scalars(m.db.select(model.title).where(model.title.startswith(prefix))))
+
+
+def test_zip_with_csv_manifest_uploads_files_and_is_idempotent(app_module, tmp_path):
+    m = app_module
+    code = department_code(m)
+    archive = tmp_path / 'import.zip'
+    with zipfile.ZipFile(archive, 'w') as zf:
+        zf.writestr('manifest.csv', (
+            'kind,department,title,file,link,date\n'
+            f'guideline,{code},csvzip แนวทาง,files/แนวทาง.pdf,,2025-01-31\n'
+            f'knowledge,{code},csvzip ความรู้,,https://example.org/k,01/02/2025\n'
+            f'activity,{code},csvzip กิจกรรม,,https://example.org/a,2025-03-01\n'
+            f'activity,{code},csvzip ไม่มีวันที่,,https://example.org/b,\n'
+            f'guideline,NOPE,csvzip ไม่มีหน่วยงาน,,https://example.org/c,\n'
+        ).encode('utf-8'))
+        zf.writestr('files/แนวทาง.pdf', b'%PDF-1.4 bulk import')
+
+    status, imported, skipped, failed, errors = run_import(m, archive)
+    assert (status, imported, skipped, failed) == ('done', 3, 0, 2)
+    assert sorted(error['row'] for error in errors) == [4, 5]
+    assert titles(m, m.Guideline, 'csvzip') == ['csvzip แนวทาง']
+    with m.app.app_context():
+        guideline = m.db.session.scalars(m.db.select(m.Guideline).filter_by(title='csvzip แนวทาง')).one()
+        assert guideline.file_path.endswith('.pdf') and guideline.upload_status is None
+        assert guideline.upload_date.date().isoformat() == '2025-01-31'
+
+    # รันซ้ำ: แถวที่นำเข้าแล้วถูกข้าม ไม่เกิดข้อมูลซ้ำ
+    status, imported, skipped, failed, _ = run_import(m, archive)
+    assert (status, imported, skipped, failed) == ('done', 0, 3, 2)
+    assert titles(m, m.Knowledge, 'csvzip') == ['csvzip ความรู้']
+    assert titles(m, m.Activity, 'csvzip') == ['csvzip กิจกรรม']
+
+
+def test_json_manifest_from_folder(app_module, tmp_path):
+    m = app_module
+    code = department_code(m)
+    (tmp_path / 'guide.pdf').write_bytes(b'%PDF-1.4 json import')
+    manifest = tmp_path / 'manifest.json'
+    manifest.write_text(json.dumps({'items': [
+        {'kind': 'guideline', 'department': code, 'title': 'jsonfolder ไฟล์', 'file': 'guide.pdf'},
+        {'kind': 'knowledge', 'department': code, 'title': 'jsonfolder ลิงก์', 'link': 'https://example.org/j',
+         'link_type': 'youtube'},
+        {'kind': 'guideline', 'department': code, 'title': 'jsonfolder หาไฟล์ไม่เจอ', 'file': 'missing.pdf'},
+    ]}, ensure_ascii=False), encoding='utf-8')
+
+    status, imported, skipped, failed, errors = run_import(m, manifest)
+    assert (status, imported, skipped, failed) == ('done', 2, 0, 1)
+    assert [error['row'] for error in errors] == [3]
+    assert titles(m, m.Guideline, 'jsonfolder') == ['jsonfolder ไฟล์']
+    assert titles(m, m.Knowledge, 'jsonfolder') == ['jsonfolder ลิงก์']
+
+
+def test_invalid_manifest_fails_whole_import(app_module, tmp_path):
+    manifest = tmp_path / 'manifest.json'
+    manifest.write_text('{"not": "a list"}', encoding='utf-8')
+    status, imported, _, _, errors = run_import(app_module, manifest)
+    assert (status, imported) == ('failed', 0)
+    assert errors and errors[0]['row'] is None
@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+"""cache สถิติแดชบอร์ดผูกกับ revision ในฐานข้อมูล การแก้ไขจาก worker อื่นจึงทำให้ค่าเดิมใช้ไม่ได้ทันที"""
+
+import pytest
+
+from conftest import QueryCounter
+
+
+@pytest.fixture(autouse=True)
+def stats_cache(app_module, monkeypatch):
+    monkeypatch.setitem(app_module.app.config, 'STATS_CACHE_TTL', 60)
+    app_module._dashboard_stats_cache['value'] = None
+    yield app_module._dashboard_stats_cache
+    app_module._dashboard_stats_cache['value'] = None
+
+
+def add_guideline(m):
+    dept_id = m.db.session.scalars(m.db.select(m.Department.id)).first()
+    m.db.session.add(m.Guideline(department_id=dept_id, title='dashboard', external_link='https://example.org'))
+    m.db.session.commit()
+    return dept_id
+
+
+def test_change_from_other_worker_invalidates_cache(app_module):
+    m = app_module
+    with m.app.app_context():
+        before = m.get_dashboard_stats()['guidelines']
+        assert m.get_dashboard_stats()['guidelines'] == before  # hit
+
+        # worker อื่นเพิ่มข้อมูลแล้วเรียก notify_content_changed: cache ของ worker นี้ไม่ถูกแตะเลย
+        # มีแค่ revision ในฐานข้อมูลที่เปลี่ยน
+        add_guideline(m)
+        m.bump_revisions([m.DASHBOARD_SCOPE])
+        assert m.get_dashboard_stats()['guidelines'] == before + 1
+
+
+def test_cache_hit_skips_aggregate(app_module):
+    m = app_module
+    with m.app.app_context():
+        m.get_dashboard_stats()
+        with QueryCounter() as counter:
+            m.get_dashboard_stats()
+    assert counter.count == 1  # revision lookup เท่านั้น
+
+
+def test_admin_list_total_uses_single_count(app_module, admin_client):
+    m = app_module
+    with m.app.app_context():
+        add_guideline(m)
+        expected = m.db.session.scalar(m.db.select(m.db.func.count()).select_from(m.Guideline))
+    with QueryCounter() as counter:
+        response = admin_client.get('/admin/guidelines')
+    assert response.status_code == 200
+    assert f'({expected})' in response.get_data(as_text=True)
+    assert not any('guidelines_month' in statement for statement in counter.statements)
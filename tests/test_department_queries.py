@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+"""จำนวน query ของหน้าหน่วยงานต้องคงที่ไม่ว่าหน่วยงานจะมีข้อมูลกี่แถว (กัน N+1 กลับมา)"""
+
+import itertools
+from datetime import date
+
+import pytest
+
+from conftest import QueryCounter
+
+_codes = itertools.count(1)
+
+
+def make_department(m, rows):
+    """หน่วยงานใหม่ที่มี guideline/knowledge/activity/contact อย่างละ rows แถว"""
+    with m.app.app_context():
+        dept = m.Department(name=f'ทดสอบ {rows}', code=f'QUERY{next(_codes)}', description='')
+        m.db.session.add(dept)
+        m.db.session.flush()
+        for n in range(rows):
+            m.db.session.add_all([
+                m.Guideline(department_id=dept.id, title=f'guideline {n}', external_link='https://example.org'),
+                m.Knowledge(department_id=dept.id, title=f'knowledge {n}', content='เนื้อหา'),
+                m.Activity(department_id=dept.id, title=f'activity {n}', activity_date=date(2025, 1, 1)),
+                m.Contact(department_id=dept.id, email=f'{n}@example.org'),
+            ])
+        m.db.session.commit()
+        return dept.id
+
+
+def count_queries(client, url):
+    with QueryCounter() as counter:
+        response = client.get(url)
+    assert response.status_code == 200
+    return counter.count
+
+
+TAB_PATHS = ['/tab/guidelines', '/tab/knowledge', '/tab/activities', '/tab/contact']
+
+
+@pytest.fixture(scope='module')
+def departments(app_module):
+    return {rows: make_department(app_module, rows) for rows in (1, 25, 60)}
+
+
+def test_department_query_count_is_flat_across_rows_and_tabs(app_module, client, departments, monkeypatch):
+    # หน้าละ 100 รายการ ทุกแถวถูก render (ขนาดหน้าไม่ช่วยซ่อน N+1) ทุกแท็บมีมากกว่า 20 แถวในสองหน่วยงาน
+    monkeypatch.setitem(app_module.app.config, 'DEPARTMENT_TAB_PAGE_SIZE', 100)
+    counts = {}
+    for path in [''] + TAB_PATHS:
+        for rows, dept_id in departments.items():
+            client.get(f'/department/{dept_id}{path}')  # request แรกเปิด connection/โหลด template
+            counts[path, rows] = count_queries(client, f'/department/{dept_id}{path}')
+        assert len({counts[path, rows] for rows in departments}) == 1, counts
+    assert len({counts[path, 60] for path in TAB_PATHS}) == 1, counts
+
+
+@pytest.mark.parametrize('path', TAB_PATHS)
+def test_load_more_pages_cost_the_same(app_module, client, departments, path):
+    url = f'/department/{departments[60]}{path}'
+    client.get(url)
+    counts = []
+    while url:
+        counts.append(count_queries(client, url))
+        url = client.get(url).get_json()['next']
+    assert len(counts) == 3  # 60 แถว หน้าละ 20
+    assert len(set(counts)) == 1, counts
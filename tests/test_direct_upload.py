@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+"""ผลอัปโหลดตรงจาก browser ที่ส่งซ้ำต้องใช้ StoredAsset เดิม ไม่ชน unique ของ secure_url"""
+
+import json
+
+import cloudinary
+import cloudinary.utils
+import pytest
+
+
+@pytest.fixture
+def direct_uploads(app_module, monkeypatch):
+    config = cloudinary.config()
+    for name, value in (('cloud_name', 'demo'), ('api_key', 'key'), ('api_secret', 'secret')):
+        monkeypatch.setattr(config, name, value, raising=False)
+    monkeypatch.setitem(app_module.app.config, 'UPLOAD_DIRECT', True)
+
+
+def make_guideline(m, title):
+    with m.app.app_context():
+        dept = m.db.session.scalars(m.db.select(m.Department).order_by(m.Department.id)).first()
+        guideline = m.Guideline(department_id=dept.id, title=title, external_link='https://example.org')
+        m.db.session.add(guideline)
+        m.db.session.commit()
+        return guideline.id, dept.id, dept.code.lower()
+
+
+def signed_payload(folder, name):
+    public_id, version = f'{folder}/{name}', 1700000000
+    signature = cloudinary.utils.api_sign_request({'public_id': public_id, 'version': version}, 'secret')
+    return json.dumps({'public_id': public_id, 'version': version, 'signature': signature,
+                       'resource_type': 'raw', 'bytes': 1234, 'original_filename': f'{name}.pdf'})
+
+
+def submit(client, guideline_id, dept_id, payload):
+    return client.post(f'/admin/guidelines/edit/{guideline_id}', data={
+        'department_id': dept_id, 'title': 'direct', 'description': '', 'upload_type': 'file',
+        'file_direct': payload,
+    })
+
+
+def asset_for(m, guideline_id):
+    with m.app.app_context():
+        url = m.db.session.get(m.Guideline, guideline_id).file_path
+        return url, m.db.session.scalars(m.db.select(m.StoredAsset).filter_by(secure_url=url)).all()
+
+
+def test_resubmitted_direct_upload_reuses_asset(app_module, admin_client, direct_uploads):
+    m = app_module
+    first_id, dept_id, code = make_guideline(m, 'direct first')
+    second_id, _, _ = make_guideline(m, 'direct second')
+    payload = signed_payload(f'guidelines/{code}', 'replayed')
+
+    assert submit(admin_client, first_id, dept_id, payload).status_code == 302
+    assert submit(admin_client, first_id, dept_id, payload).status_code == 302  # ส่งฟอร์มเดิมซ้ำ
+    url, assets = asset_for(m, first_id)
+    assert url.endswith('/replayed') and len(assets) == 1
+    assert assets[0].ref_count == 1
+
+    # ผลเดียวกันใช้กับอีกแถว: ยังเป็น asset เดิมและนับการอ้างอิงเพิ่ม
+    assert submit(admin_client, second_id, dept_id, payload).status_code == 302
+    second_url, assets = asset_for(m, second_id)
+    assert second_url == url and len(assets) == 1
+    assert assets[0].ref_count == 2
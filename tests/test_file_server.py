@@ -0,0 +1,21 @@
+# -*- coding: utf-8 -*-
+"""Cache-Control ของ /storage/: immutable เฉพาะไฟล์ที่แอปตั้งชื่อเอง"""
+
+import pytest
+
+from file_server import IMMUTABLE_CACHE_CONTROL, StorageFileServer
+
+
+@pytest.mark.parametrize('path, immutable', [
+    ('uploads/knowledge/poster.640w.3f9a0c1e5b7d2a46.jpg', True),
+    ('uploads/activity/ภาพ.1280w.0123456789abcdef.png', True),
+    ('stub/guidelines/er/0123456789abcdef_guide.pdf', True),
+    ('uploads/guidelines/report_2023010120231231.pdf', False),
+    ('uploads/poster.3f9a0c1e5b7d2a46.jpg', False),
+    ('uploads/0123456789abcdef_guide.pdf', False),
+    ('stub/guidelines/er/guide.pdf', False),
+])
+def test_immutable_only_for_generated_names(tmp_path, path, immutable):
+    server = StorageFileServer(str(tmp_path), max_age=300)
+    expected = IMMUTABLE_CACHE_CONTROL if immutable else 'public, max-age=300'
+    assert server.cache_control(path) == expected
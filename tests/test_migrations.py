@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+"""MigrationRunner รันทีละขั้นตามลำดับเวอร์ชัน ข้ามขั้นที่รันแล้ว และบันทึกเวอร์ชันหลังแต่ละขั้น"""
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+from migrations import Migration, MigrationRunner, read_state
+
+
+@pytest.fixture
+def session(tmp_path):
+    engine = create_engine(f'sqlite:///{tmp_path / "migrations.db"}')
+    with Session(engine) as session:
+        yield session
+    engine.dispose()
+
+
+def recorder(calls, version, feature=None):
+    def apply(session, state):
+        # เห็นเวอร์ชันของขั้นก่อนหน้าแล้วเสมอ
+        calls.append((version, state.version))
+        if feature:
+            state.features.add(feature)
+    return apply
+
+
+def test_runs_in_version_order_and_records_each_step(session):
+    calls = []
+    runner = MigrationRunner([
+        Migration(3, 'third', recorder(calls, 3), transactional=False),
+        Migration(1, 'first', recorder(calls, 1)),
+        Migration(2, 'second', recorder(calls, 2, feature='search')),
+    ])
+    state = runner.upgrade(session, log=lambda message: None)
+    assert calls == [(1, 0), (2, 1), (3, 2)]
+    assert (state.version, state.features) == (3, {'search'})
+
+    assert runner.upgrade(session, log=lambda message: None).version == 3
+    assert len(calls) == 3  # รันซ้ำไม่มีขั้นไหนถูกเรียกอีก
+
+
+def test_only_pending_steps_run_after_upgrade(session):
+    calls = []
+    MigrationRunner([Migration(1, 'first', recorder(calls, 1))]).upgrade(session, log=lambda message: None)
+    MigrationRunner([
+        Migration(1, 'first', recorder(calls, 1)),
+        Migration(2, 'second', recorder(calls, 2)),
+    ]).upgrade(session, log=lambda message: None)
+    assert calls == [(1, 0), (2, 1)]
+    assert read_state(session.connection()).version == 2
+
+
+def test_failed_step_keeps_previous_version(session):
+    def fail(session, state):
+        raise RuntimeError('boom')
+
+    runner = MigrationRunner([Migration(1, 'first', lambda session, state: None), Migration(2, 'broken', fail)])
+    with pytest.raises(RuntimeError):
+        runner.upgrade(session, log=lambda message: None)
+    session.rollback()
+    assert read_state(session.connection()).version == 1
+
+
+@pytest.mark.parametrize('versions', [[1, 1], [0, 1]])
+def test_rejects_duplicate_or_zero_versions(versions):
+    with pytest.raises(ValueError):
+        MigrationRunner([Migration(version, str(version), lambda session, state: None) for version in versions])
+
+
+def test_app_migrations_are_contiguous_and_applied(app_module):
+    runner = app_module.schema_migrations
+    assert [migration.version for migration in runner.migrations] == list(range(1, runner.latest + 1))
+    with app_module.app.app_context():
+        assert read_state(app_module.db.session.connection()).version == runner.latest
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+"""ค้นหาคำสั้น: สองตัวอักษรใช้ดัชนี bigram, ตัวอักษรเดียวย้อนไปใช้ LIKE"""
+
+import pytest
+
+from conftest import QueryCounter
+
+
+@pytest.fixture(scope='module')
+def documents(app_module):
+    m = app_module
+    if not m.search_index.available:
+        pytest.skip('SQLite build has no FTS5 trigram tokenizer')
+    with m.app.app_context():
+        dept_id = m.db.session.scalars(m.db.select(m.Department.id)).first()
+        guidelines = [
+            m.Guideline(department_id=dept_id, title='แนวทางดูแลผู้ป่วย CKD ระยะ 3', external_link='https://example.org'),
+            m.Guideline(department_id=dept_id, title='การให้ยา ICU', description='ยาฉีดในหอผู้ป่วยหนัก',
+                        external_link='https://example.org'),
+            m.Guideline(department_id=dept_id, title='คู่มือห้องผ่าตัด', external_link='https://example.org'),
+        ]
+        m.db.session.add_all(guidelines)
+        m.db.session.commit()
+        return {g.title: g.id for g in guidelines}
+
+
+def search(m, query):
+    with m.app.app_context(), QueryCounter() as counter:
+        total, rows = m.search_index.search(m.db.session.connection(), query, limit=50)
+    ids = {row['doc_id'] for row in rows if row['doc_type'] == 'guideline'}
+    return total, ids, counter.statements
+
+
+def test_bigram_tokens():
+    from search import bigram_tokens
+    assert bigram_tokens('ICU') == bigram_tokens('icu') == ' '.join(sorted(['g6963', 'g6375']))
+    assert bigram_tokens('a b') == ''
+
+
+@pytest.mark.parametrize('query, titles', [
+    ('ยา', ['การให้ยา ICU']),
+    ('ck', ['แนวทางดูแลผู้ป่วย CKD ระยะ 3']),
+    ('ยา ic', ['การให้ยา ICU']),
+    ('ยา CKD', []),
+])
+def test_two_letter_terms_use_bigram_index(app_module, documents, query, titles):
+    total, ids, statements = search(app_module, query)
+    assert ids == {documents[title] for title in titles}
+    assert any('search_index_bigram MATCH' in statement for statement in statements)
+
+
+def test_bigram_index_follows_updates(app_module, documents):
+    m = app_module
+    guideline_id = documents['คู่มือห้องผ่าตัด']
+    with m.app.app_context():
+        m.db.session.get(m.Guideline, guideline_id).title = 'คู่มือห้องคลอด'
+        m.db.session.commit()
+    assert guideline_id not in search(m, 'ผ่')[1]
+    assert guideline_id in search(m, 'คล')[1]
+
+
+def test_single_letter_falls_back_to_like(app_module, documents):
+    # ตัวอักษรเดียวไม่มีดัชนีใดใช้ได้ (ดู docstring ของ search.py) ผลยังถูกต้องแต่ไล่ทุกแถวด้วย LIKE
+    total, ids, statements = search(app_module, '3')
+    assert documents['แนวทางดูแลผู้ป่วย CKD ระยะ 3'] in ids
+    assert not any('MATCH' in statement for statement in statements)
+    assert any('LIKE' in statement for statement in statements)
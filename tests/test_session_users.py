@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+"""cache ของแอดมินที่ล็อกอินอยู่: hit ไม่อ่านฐานข้อมูล, miss อ่านแถวเดียว, การเพิกถอนทำให้ session เดิมหลุด"""
+
+import time
+
+import pytest
+
+from conftest import QueryCounter
+
+
+def admin_user_queries(client, url='/admin/dashboard'):
+    with QueryCounter() as counter:
+        response = client.get(url)
+    return response, [s for s in counter.statements if 'admin_user' in s]
+
+
+@pytest.fixture(autouse=True)
+def empty_cache(app_module):
+    app_module._session_user_cache.clear()
+    yield
+    app_module._session_user_cache.clear()
+
+
+def test_cached_admin_skips_database(app_module, admin_client):
+    response, queries = admin_user_queries(admin_client)
+    assert response.status_code == 200
+    assert len(queries) == 1  # miss: โหลดแถวเดียว ไม่มี query แยกสำหรับ session_version
+
+    response, queries = admin_user_queries(admin_client)
+    assert response.status_code == 200
+    assert queries == []
+
+
+def test_revoke_logs_out_immediately_on_same_instance(app_module, admin_client):
+    assert admin_client.get('/admin/dashboard').status_code == 200
+    with app_module.app.app_context():
+        app_module.revoke_sessions()
+        app_module.db.session.commit()
+    assert admin_client.get('/admin/dashboard').status_code == 302
+
+
+def test_revoke_from_other_instance_applies_after_ttl(app_module, admin_client, monkeypatch):
+    assert admin_client.get('/admin/dashboard').status_code == 200
+    # instance อื่นเพิ่ม session_version โดยตรงในฐานข้อมูล cache ของ instance นี้ไม่ถูกล้าง
+    with app_module.app.app_context():
+        app_module.db.session.execute(app_module.db.update(app_module.AdminUser).values(
+            session_version=app_module.AdminUser.session_version + 1))
+        app_module.db.session.commit()
+    assert admin_client.get('/admin/dashboard').status_code == 200
+
+    now = time.monotonic() + app_module.app.config['SESSION_USER_CACHE_TTL'] + 1
+    monkeypatch.setattr(app_module.time, 'monotonic', lambda: now)
+    assert admin_client.get('/admin/dashboard').status_code == 302
+
+
+def test_logout_applies_without_waiting_for_cache(app_module, admin_client):
+    assert admin_client.get('/admin/dashboard').status_code == 200
+    admin_client.get('/admin/logout')
+    assert admin_client.get('/admin/dashboard').status_code == 302
@@ -0,0 +1,276 @@
+# -*- coding: utf-8 -*-
+"""
+คิวอัปโหลดไฟล์เบื้องหลัง
+
+request ของแอดมินแค่บันทึกไฟล์ลงดิสก์ (spool) สร้างแถวข้อมูลสถานะ pending แล้วตอบกลับทันที
+การส่งไฟล์ขึ้น Cloudinary ทำใน thread pool ที่จำกัดจำนวน worker พร้อม retry แบบ exponential backoff
+
+- CloudinaryUploader: อัปโหลดจริงด้วย cloudinary.uploader
+- StubUploader: คัดลอกไฟล์ไปไว้ใน storage/ ของเครื่อง (ไม่ต้องใช้ network) ใช้ทดสอบและ load test
+  ตั้งค่าเวลาแฝงและอัตราความล้มเหลวจำลองได้
+- UploadQueue: โหมด async ส่งงานเข้า thread pool, โหมด sync ทำงานทันทีใน request
+  (ใช้บน Vercel ที่ thread เบื้องหลังจะถูกหยุดเมื่อตอบ response แล้ว)
+- append_chunk: เขียนไฟล์ที่ส่งมาแบบแบ่ง chunk ต่อท้าย spool ทีละส่วน (ใช้หน่วยความจำไม่เกินหนึ่ง buffer)
+- sign_direct_upload / verify_direct_upload: ให้ browser อัปโหลดตรงไป Cloudinary โดยไม่ผ่าน Flask
+"""
+
+import hashlib
+import os
+import random
+import shutil
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.utils import secure_filename
+
+try:
+    import cloudinary.exceptions
+    import cloudinary.uploader
+    import cloudinary.utils
+except ImportError:  # ใช้ StubUploader ได้โดยไม่ต้องติดตั้ง cloudinary
+    cloudinary = None
+
+
+class PermanentUploadError(Exception):
+    """ข้อผิดพลาดที่ลองใหม่ก็ไม่หาย เช่น ไฟล์ผิดประเภทหรือสิทธิ์ไม่พอ"""
+
+
+class CloudinaryUploader:
+    name = 'cloudinary'
+
+    # ข้อผิดพลาดฝั่ง client ที่ไม่ควร retry
+    PERMANENT_ERRORS = ('BadRequest', 'AuthorizationRequired', 'NotAllowed')
+
+    def __init__(self, chunk_size=20 * 1024 * 1024):
+        self.chunk_size = chunk_size
+
+    def upload(self, path, folder, resource_type):
+        """อัปโหลดไฟล์จาก path คืน dict ที่มี secure_url, bytes, public_id และขนาดรูป (width/height ถ้าเป็นรูปภาพ)
+
+        ไฟล์ที่ใหญ่กว่า chunk_size ใช้ upload_large ซึ่งอ่านและส่งทีละ chunk
+        """
+        try:
+            if os.path.getsize(path) > self.chunk_size:
+                result = cloudinary.uploader.upload_large(
+                    path, folder=folder, resource_type=resource_type, chunk_size=self.chunk_size)
+            else:
+                result = cloudinary.uploader.upload(path, folder=folder, resource_type=resource_type)
+        except cloudinary.exceptions.Error as e:
+            if type(e).__name__ in self.PERMANENT_ERRORS:
+                raise PermanentUploadError(str(e)) from e
+            raise
+        return {
+            'secure_url': result.get('secure_url'),
+            'bytes': result.get('bytes'),
+            'public_id': result.get('public_id'),
+            'resource_type': result.get('resource_type'),
+            'width': result.get('width'),
+            'height': result.get('height'),
+        }
+
+    def delete(self, public_id, resource_type):
+        cloudinary.uploader.destroy(public_id, resource_type=resource_type or 'image', invalidate=True)
+
+
+class StubUploader:
+    """จำลอง Cloudinary โดยคัดลอกไฟล์ไปไว้ใต้ root (เสิร์ฟผ่าน /storage/ ได้ทันที)"""
+
+    name = 'stub'
+
+    def __init__(self, root, url_prefix, latency=0.0, failure_rate=0.0):
+        self.root = root
+        self.url_prefix = url_prefix.rstrip('/')
+        self.latency = latency
+        self.failure_rate = failure_rate
+
+    def upload(self, path, folder, resource_type):
+        if self.latency:
+            time.sleep(self.latency)
+        if self.failure_rate and random.random() < self.failure_rate:
+            raise ConnectionError('stub uploader: simulated network failure')
+        name = f'{uuid.uuid4().hex[:16]}_{os.path.basename(path)}'
+        target_dir = os.path.join(self.root, folder)
+        os.makedirs(target_dir, exist_ok=True)
+        shutil.copyfile(path, os.path.join(target_dir, name))
+        return {
+            'secure_url': f'{self.url_prefix}/{folder}/{name}',
+            'bytes': os.path.getsize(path),
+            'public_id': f'{folder}/{name}',
+            'resource_type': resource_type,
+        }
+
+    def delete(self, public_id, resource_type):
+        try:
+            os.unlink(os.path.join(self.root, public_id))
+        except FileNotFoundError:
+            pass
+
+
+def create_uploader(name, stub_root=None, stub_url_prefix='/storage/stub', stub_latency=0.0,
+                    stub_failure_rate=0.0, chunk_size=20 * 1024 * 1024):
+    """สร้าง uploader ตามชื่อใน config: cloudinary หรือ stub"""
+    if name == 'cloudinary':
+        return CloudinaryUploader(chunk_size=chunk_size)
+    if name == 'stub':
+        return StubUploader(stub_root, stub_url_prefix, latency=stub_latency, failure_rate=stub_failure_rate)
+    raise ValueError(f'Unknown UPLOAD_BACKEND: {name}')
+
+
+def direct_uploads_available():
+    """อัปโหลดตรงจาก browser ได้เมื่อมี api_key/api_secret สำหรับเซ็นพารามิเตอร์"""
+    if cloudinary is None:
+        return False
+    config = cloudinary.config()
+    return bool(config.cloud_name and config.api_key and config.api_secret)
+
+
+def sign_direct_upload(folder, resource_type):
+    """พารามิเตอร์ที่ browser ใช้ POST ไฟล์ตรงไป Cloudinary
+
+    ลายเซ็นผูกกับ folder และ timestamp Cloudinary ไม่รับลายเซ็นที่เก่ากว่า 1 ชั่วโมง
+    """
+    config = cloudinary.config()
+    params = {'folder': folder, 'timestamp': int(time.time())}
+    return {
+        **params,
+        'signature': cloudinary.utils.api_sign_request(params, config.api_secret, config.signature_algorithm),
+        'api_key': config.api_key,
+        'upload_url': cloudinary.utils.cloudinary_api_url('upload', resource_type=resource_type),
+    }
+
+
+def verify_direct_upload(payload, folder):
+    """ตรวจผลอัปโหลดที่ browser ได้จาก Cloudinary แล้วส่งกลับมา คืน dict แบบเดียวกับ upload()
+
+    ลายเซ็นของ Cloudinary ครอบเฉพาะ public_id และ version จึงสร้าง secure_url เองจากค่าที่ตรวจแล้ว
+    และยอมรับเฉพาะไฟล์ที่อยู่ใน folder ที่เซ็นให้เท่านั้น
+    """
+    try:
+        public_id = str(payload['public_id'])
+        version = int(payload['version'])
+        signature = str(payload['signature'])
+        resource_type = str(payload.get('resource_type') or 'image')
+        size = int(payload.get('bytes') or 0)
+        # ขนาดรูปไม่อยู่ในลายเซ็น ใช้แค่กำหนด width/height ของ <img>
+        width = int(payload['width']) if payload.get('width') else None
+        height = int(payload['height']) if payload.get('height') else None
+    except (KeyError, TypeError, ValueError) as e:
+        raise PermanentUploadError(f'ข้อมูลผลการอัปโหลดไม่ครบ: {e}') from e
+    if not public_id.startswith(f'{folder}/'):
+        raise PermanentUploadError('ไฟล์ไม่ได้อยู่ในโฟลเดอร์ของหน่วยงานนี้')
+    if not cloudinary.utils.verify_api_response_signature(public_id, version, signature):
+        raise PermanentUploadError('ลายเซ็นของผลการอัปโหลดไม่ถูกต้อง')
+    secure_url, _ = cloudinary.utils.cloudinary_url(
+        public_id, resource_type=resource_type, type='upload', version=version,
+        format=None if resource_type == 'raw' else payload.get('format'), secure=True,
+    )
+    return {'secure_url': secure_url, 'bytes': size, 'public_id': public_id, 'resource_type': resource_type,
+            'width': width, 'height': height}
+
+
+def spool_path_for(spool_dir, filename):
+    """ตั้งชื่อไฟล์ใน spool ที่ไม่ซ้ำกัน (คงชื่อเดิมไว้ท้ายชื่อเพื่อให้อ่านง่าย)
+
+    secure_filename ตัดอักษรไทยทิ้งหมด ('รายการ.csv' -> 'csv') จึงแยกนามสกุลออกมาก่อนเพื่อให้ชื่อใน spool
+    ยังบอกชนิดไฟล์ได้ ('<uuid>_upload.csv')
+    """
+    os.makedirs(spool_dir, exist_ok=True)
+    stem, extension = os.path.splitext(filename or '')
+    stem = secure_filename(stem) or 'upload'
+    extension = secure_filename(extension.lstrip('.'))
+    name = f'{stem}.{extension}' if extension else stem
+    return os.path.join(spool_dir, f'{uuid.uuid4().hex}_{name}')
+
+
+def spool_upload(file_storage, spool_dir, buffer_size=1024 * 1024):
+    """บันทึกไฟล์จากฟอร์มลงโฟลเดอร์ spool พร้อมคำนวณ SHA-256 ระหว่างเขียน คืน (path, sha256)"""
+    path = spool_path_for(spool_dir, file_storage.filename)
+    digest = hashlib.sha256()
+    with open(path, 'wb') as f:
+        for data in iter(lambda: file_storage.stream.read(buffer_size), b''):
+            digest.update(data)
+            f.write(data)
+    return path, digest.hexdigest()
+
+
+class ChunkError(Exception):
+    """chunk ที่ได้รับไม่ครบหรือ checksum ไม่ตรง (client ควรส่ง chunk นั้นใหม่)"""
+
+
+def append_chunk(path, offset, stream, length, sha256, buffer_size=64 * 1024):
+    """อ่าน chunk ความยาว length จาก stream แล้วเขียนลงไฟล์ที่ตำแหน่ง offset
+
+    ตรวจ SHA-256 ระหว่างเขียน ถ้าไม่ตรงหรือได้ข้อมูลไม่ครบ จะตัดไฟล์กลับไปที่ offset แล้วโยน ChunkError
+    """
+    digest = hashlib.sha256()
+    written = 0
+    with open(path, 'r+b') as f:
+        f.seek(offset)
+        f.truncate()
+        while written <= length:
+            data = stream.read(min(buffer_size, length + 1 - written))
+            if not data:
+                break
+            digest.update(data)
+            f.write(data)
+            written += len(data)
+        if written != length or digest.hexdigest() != sha256.lower():
+            f.truncate(offset)
+            raise ChunkError(f'chunk at offset {offset}: expected {length} bytes with sha256 {sha256}, '
+                             f'got {written} bytes with sha256 {digest.hexdigest()}')
+
+
+def file_sha256(path, buffer_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for data in iter(lambda: f.read(buffer_size), b''):
+            digest.update(data)
+    return digest.hexdigest()
+
+
+def backoff_delay(attempt, base, maximum):
+    """ระยะรอก่อนลองครั้งถัดไป (exponential backoff แบบ full jitter) attempt เริ่มที่ 1"""
+    return random.uniform(0, min(maximum, base * (2 ** (attempt - 1))))
+
+
+class UploadQueue:
+    """ส่งงานอัปโหลดเข้า thread pool (async) หรือทำทันที (sync)
+
+    งานแต่ละชิ้นถูกบันทึกในฐานข้อมูลก่อนส่งเข้าคิวเสมอ ถ้า process ตายระหว่างทาง
+    ให้ app เรียกงานที่ค้างเข้าคิวใหม่ตอนเริ่มระบบ (run_pending_uploads ใน app.py)
+    """
+
+    def __init__(self, app, mode='async', max_workers=2):
+        if mode not in ('async', 'sync'):
+            raise ValueError(f'Unknown UPLOAD_MODE: {mode}')
+        self.app = app
+        self.mode = mode
+        self.max_workers = max_workers
+        self._executor = None
+
+    @property
+    def executor(self):
+        # สร้าง pool เมื่อมีงานแรก เพื่อไม่ให้ทุก process ที่ import app ต้องมี thread ค้างไว้
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='upload')
+        return self._executor
+
+    def submit(self, func, *args):
+        if self.mode == 'sync':
+            func(*args)
+            return None
+        return self.executor.submit(self._run_in_context, func, *args)
+
+    def _run_in_context(self, func, *args):
+        with self.app.app_context():
+            try:
+                func(*args)
+            except Exception as e:  # thread pool จะกลืน exception ไว้เงียบๆ จึงพิมพ์ออกมาเอง
+                print(f'Upload worker error: {e!r}')
+                raise
+
+    def shutdown(self, wait=True):
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
+            self._executor = None
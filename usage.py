@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+"""
+ตัวนับการใช้งาน (ดาวน์โหลด guideline, เปิดหน้าหน่วยงาน) แบบ write-behind
+
+request แค่บวกตัวเลขใน dict ของ process ใต้ lock ไม่แตะฐานข้อมูลเลย thread เบื้องหลังหนึ่งตัวต่อ process
+ส่งค่าที่สะสมไว้ให้ flush ทุก interval วินาที (เร็วกว่านั้นเมื่อสะสมครบ max_events ครั้ง) และตอน process ปิด
+ฐานข้อมูลจึงได้รับ upsert หนึ่งชุดต่อรอบแทนการเขียนหนึ่งครั้งต่อการเปิดหน้า
+
+flush ที่ล้มเหลว (เช่นฐานข้อมูลหลุดชั่วคราว) จะคืนค่ากลับเข้าตัวนับเพื่อส่งใหม่รอบถัดไป
+ค่าที่ยังไม่ถูก flush หายไปถ้า process ถูก kill ทันที (SIGKILL) หรือ instance ของ Vercel ถูกปิดขณะหยุดนิ่ง
+"""
+
+import atexit
+import os
+import threading
+from datetime import datetime, timezone
+
+
+class UsageCounters:
+    def __init__(self, flush, interval=10.0, max_events=500):
+        self.flush_batch = flush  # รับ {(kind, target_id, วันที่ UTC): จำนวนครั้ง}
+        self.interval = interval
+        self.max_events = max_events
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._events = 0
+        self._wake = threading.Event()
+        self._pid = None  # thread ไม่ติดไปกับ fork (gunicorn --preload) จึงเริ่มใหม่เมื่อ pid เปลี่ยน
+        self.failed_flushes = 0
+        atexit.register(self.flush)
+
+    def record(self, kind, target_id):
+        key = (kind, target_id, datetime.now(timezone.utc).date())
+        with self._lock:
+            self._pending[key] = self._pending.get(key, 0) + 1
+            self._events += 1
+            full = self._events >= self.max_events
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                threading.Thread(target=self._run, name='usage-counters', daemon=True).start()
+        if full:
+            self._wake.set()
+
+    def pending(self):
+        """จำนวนครั้งที่ยังไม่ถูก flush ของ process นี้"""
+        with self._lock:
+            return self._events
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            self.flush()
+
+    def flush(self):
+        """ส่งค่าที่สะสมไว้ทั้งหมดให้ flush_batch คืนจำนวนครั้งที่บันทึกได้"""
+        with self._lock:
+            batch, self._pending = self._pending, {}
+            events, self._events = self._events, 0
+        if not batch:
+            return 0
+        try:
+            self.flush_batch(batch)
+        except Exception as e:
+            with self._lock:
+                for key, count in batch.items():
+                    self._pending[key] = self._pending.get(key, 0) + count
+                self._events += events
+            self.failed_flushes += 1
+            print(f"Warning: usage counters not saved, will retry ({str(e).splitlines()[0] if str(e) else type(e).__name__})")
+            return 0
+        return events